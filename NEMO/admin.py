@@ -2246,8 +2246,8 @@ class StaffAssistanceRequestAdmin(admin.ModelAdmin):
 
 @register(EmailLog)
 class EmailLogAdmin(admin.ModelAdmin):
-    list_display = ["id", "category", "sender", "to", "subject", "when", "ok"]
-    list_filter = ["category", "ok"]
+    list_display = ["id", "category", "sender", "to", "subject", "when", "ok", "queued", "attempts"]
+    list_filter = ["category", "ok", "queued"]
     search_fields = ["subject", "content", "to"]
     readonly_fields = (
         "when",
@@ -75,6 +75,7 @@ class NEMOConfig(AppConfig):
     name = "NEMO"
 
     def ready(self):
+        from NEMO import facility_status  # registers the signals keeping the status snapshot up to date
         from NEMO.plugins import utils  # needed for checks
 
         apply_oracledb_patches()
@@ -0,0 +1,263 @@
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from django.db.models import QuerySet
+from django.urls import reverse
+from django.utils import timezone
+
+from NEMO.models import AreaAccessRecord, Reservation, ScheduledOutage, Tool, UsageEvent, User
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def feed_date(value: datetime) -> str:
+    return timezone.localtime(value).isoformat()
+
+
+def dumps(event: Dict) -> bytes:
+    return orjson.dumps(event) if orjson else json.dumps(event, separators=(",", ":")).encode()
+
+
+def serialize_feed(events: Iterable[Dict]) -> bytes:
+    """
+    Returns the calendar feed events as a JSON array, serialized with orjson when it is installed.
+    Events are encoded one by one as they are produced, so feeds can be composed from several event iterables.
+    """
+    return b"[" + b",".join(dumps(event) for event in events) + b"]"
+
+
+class EventFeedSerializer:
+    """
+    Serializes reservations, outages, usage events and area access records to FullCalendar events.
+    Related objects are fetched with the events, and the tools the user is staff on are only looked up once.
+    """
+
+    def __init__(self, user: User):
+        self.user = user
+        self._staff_tool_ids: Optional[Set[int]] = None
+
+    def is_staff_on_tool(self, tool: Optional[Tool]) -> bool:
+        if self.user.is_staff:
+            return True
+        if not tool:
+            return False
+        if self._staff_tool_ids is None:
+            self._staff_tool_ids = set(self.user.staff_for_tools.values_list("id", flat=True))
+        # Child tools use their parent's staff
+        return (tool.parent_tool_id or tool.id) in self._staff_tool_ids
+
+    def reservation_tooltip(self, reservation: Reservation) -> str:
+        tooltip = f"{reservation.reservation_item.name} reservation for {reservation.user}"
+        if reservation.creator_id != reservation.user_id:
+            tooltip += f", created by {reservation.creator}"
+        return tooltip
+
+    def reservation_editable(self, reservation: Reservation) -> bool:
+        return self.user.id == reservation.user_id or self.is_staff_on_tool(reservation.tool)
+
+    def reservations(
+        self,
+        reservations: QuerySet[Reservation],
+        personal_schedule=None,
+        all_tools=None,
+        all_areas=None,
+        all_areastools=None,
+        display_name=False,
+        display_configuration=False,
+    ) -> Iterator[Dict]:
+        reservations = reservations.select_related("tool__parent_tool", "area", "user", "creator")
+        if display_configuration:
+            reservations = reservations.prefetch_related("configurationoption_set__configuration")
+        for reservation in reservations:
+            item = reservation.reservation_item
+            event = {}
+            title_with_item = f"{item.name} ({reservation.user.username})\n{reservation.title}"
+            if personal_schedule and reservation.tool:
+                event["title"] = title_with_item
+                event["color"] = "#33ad33"
+            elif personal_schedule and reservation.area:
+                event["title"] = title_with_item
+                event["color"] = "#84CD84"
+            elif all_tools or all_areastools and reservation.tool:
+                event["title"] = title_with_item
+                event["color"] = getattr(item, "tool_calendar_color", None) or "#33ad33"
+            elif all_areas or all_areastools and reservation.area:
+                event["title"] = title_with_item
+                event["color"] = getattr(item, "area_calendar_color", None) or "#84CD84"
+            else:
+                if display_name:
+                    event["title"] = title_with_item
+                else:
+                    event["title"] = reservation.title or str(reservation.user)
+                    if display_configuration:
+                        event["title"] += "\n" + reservation.get_configuration_options_display()
+                        colors = reservation.get_configuration_options_colors()
+                        if colors:
+                            event["colors"] = colors
+                if reservation.tool:
+                    tool_color = item.tool_calendar_color
+                    event["color"] = "#88B7CD" if (tool_color or "").lower() == "#33ad33" else tool_color or "#88B7CD"
+                else:
+                    event["color"] = item.area_calendar_color or "#88B7CD"
+                if reservation.user_id == self.user.id:
+                    event["own-reservation"] = True
+            event["tooltip"] = self.reservation_tooltip(reservation)
+            event["id"] = f"Reservation {reservation.id}"
+            # The reservation creator or staff may edit the event
+            if self.reservation_editable(reservation):
+                event["editable"] = True
+            event["start"] = feed_date(reservation.start)
+            event["end"] = feed_date(reservation.get_visual_end())
+            event["details_url"] = reverse("reservation_details", args=[reservation.id])
+            yield event
+
+    def outages(self, outages: QuerySet[ScheduledOutage]) -> Iterator[Dict]:
+        for outage in outages.select_related("tool__parent_tool"):
+            event = {"title": outage.title, "id": f"Outage {outage.id}"}
+            if self.is_staff_on_tool(outage.tool):
+                event["editable"] = True
+            event["color"] = "#ff0000"
+            event["start"] = feed_date(outage.start)
+            event["end"] = feed_date(outage.end)
+            event["details_url"] = reverse("outage_details", args=[outage.id])
+            yield event
+
+    def usage_events(self, usage_events: QuerySet[UsageEvent], personal_schedule=None) -> Iterator[Dict]:
+        for usage_event in usage_events.select_related("tool__parent_tool", "user", "operator", "project"):
+            tool, user, operator = usage_event.tool, usage_event.user, usage_event.operator
+            on_behalf = usage_event.operator_id != usage_event.user_id
+            if personal_schedule or not on_behalf:
+                title = f"{tool.name} ({user.username})\n {usage_event.project}"
+            else:
+                title = f"{tool.name} ({operator} on behalf of {user.username})\n {usage_event.project}"
+            if not on_behalf:
+                tooltip = f"{tool.name} usage for {user} billed to project {usage_event.project}"
+            else:
+                tooltip = (
+                    f"{tool.name} usage for {user}, operated by {operator} and billed to project {usage_event.project}"
+                )
+            yield {
+                "title": title,
+                "tooltip": tooltip,
+                "id": usage_event.id,
+                "start": feed_date(usage_event.start),
+                # Usage events shorter than the minimum display length are lengthened for display purposes
+                "end": feed_date(usage_event.get_visual_end()),
+                "details_url": reverse("usage_details", args=[usage_event.id]),
+                "color": tool.tool_calendar_color or "#33ad33",
+            }
+
+    def area_access_events(self, area_access_events: QuerySet[AreaAccessRecord]) -> Iterator[Dict]:
+        records = area_access_events.select_related("area", "customer", "project", "staff_charge__staff_member")
+        for record in records:
+            staff_charge = f"by {record.staff_charge.staff_member}" if record.staff_charge else ""
+            yield {
+                "title": f"{record.area} access billed to project {record.project} {staff_charge}",
+                "tooltip": f"{record.area} access for {record.customer} billed to project {record.project} {staff_charge}",
+                "id": record.id,
+                "start": feed_date(record.start),
+                # Area access events shorter than the minimum display length are lengthened for display purposes
+                "end": feed_date(record.get_visual_end()),
+                "details_url": reverse("area_access_details", args=[record.id]),
+                "color": record.area.area_calendar_color or "#e68a00",
+            }
+
+    def missed_reservations(self, missed_reservations: QuerySet[Reservation], personal_schedule=None) -> Iterator[Dict]:
+        missed_reservations = missed_reservations.select_related(
+            "tool__parent_tool", "area", "user", "creator", "project"
+        )
+        for reservation in missed_reservations:
+            if personal_schedule:
+                title = f"Missed reservation for the {reservation.reservation_item} \n {reservation.project}"
+            else:
+                title = f"Missed reservation by {reservation.user} \n {reservation.project}"
+            tooltip = f"Missed {reservation.reservation_item.name} reservation for {reservation.user} billed to project {reservation.project}"
+            if reservation.creator_id != reservation.user_id:
+                tooltip += f", created by {reservation.creator}"
+            yield {
+                "title": title,
+                "tooltip": tooltip,
+                "id": reservation.id,
+                "color": "#ff0000",
+                "start": feed_date(reservation.start),
+                "end": feed_date(reservation.end),
+                "details_url": reverse("reservation_details", args=[reservation.id]),
+            }
+
+    def user_usage_events(self, usage_events: QuerySet[UsageEvent]) -> Iterator[Dict]:
+        for usage_event in usage_events.select_related("tool"):
+            yield {
+                "title": f"Usage of the {usage_event.tool.name}",
+                "id": usage_event.id,
+                "color": "#33ad33",
+                "start": feed_date(usage_event.start),
+                "end": feed_date(usage_event.get_visual_end()),
+                "details_url": reverse("usage_details", args=[usage_event.id]),
+            }
+
+    def user_area_access_events(self, area_access_events: QuerySet[AreaAccessRecord]) -> Iterator[Dict]:
+        for event in self.area_access_events(area_access_events):
+            yield {
+                "title": event["title"],
+                "id": event["id"],
+                "color": "#e68a00",
+                "start": event["start"],
+                "end": event["end"],
+                "details_url": event["details_url"],
+            }
+
+    def user_reservations(self, reservations: QuerySet[Reservation]) -> Iterator[Dict]:
+        for reservation in reservations.select_related("tool__parent_tool", "area"):
+            item = reservation.reservation_item
+            title = f"Reservation for the {item.name}"
+            if reservation.title:
+                title += f', titled "{reservation.title}"'
+            if reservation.tool:
+                color = item.tool_calendar_color or "#33ad33"
+            else:
+                color = item.area_calendar_color or "#88B7CD"
+            yield {
+                "title": title,
+                "id": reservation.id,
+                "color": color,
+                "start": feed_date(reservation.start),
+                "end": feed_date(reservation.get_visual_end()),
+                "details_url": reverse("reservation_details", args=[reservation.id]),
+            }
+
+    def user_missed_reservations(self, missed_reservations: QuerySet[Reservation]) -> Iterator[Dict]:
+        for reservation in missed_reservations.select_related("tool__parent_tool", "area"):
+            yield {
+                "title": f"Missed reservation for the {reservation.reservation_item.name}",
+                "id": reservation.id,
+                "color": "#ff0000" if reservation.tool else "#FF6666",
+                "start": feed_date(reservation.start),
+                "end": feed_date(reservation.get_visual_end()),
+                "details_url": reverse("reservation_details", args=[reservation.id]),
+            }
+
+    def configuration_agenda(self, reservations: QuerySet[Reservation], all_tools=None) -> Iterator[Dict]:
+        reservations = reservations.select_related("tool__parent_tool", "area", "user", "creator")
+        for reservation in reservations.prefetch_related("configurationoption_set__configuration"):
+            configuration_display = reservation.get_configuration_options_display()
+            if all_tools and reservation.tool:
+                title = f"{reservation.reservation_item.name} ({reservation.user.username})\n{configuration_display}"
+            else:
+                title = f"{reservation.user}\n{configuration_display}"
+            event = {
+                "title": title,
+                "tooltip": self.reservation_tooltip(reservation),
+                "colors": reservation.get_configuration_options_colors(),
+                "id": f"Reservation {reservation.id}",
+            }
+            # The reservation creator or staff may edit the event
+            if self.reservation_editable(reservation):
+                event["editable"] = True
+            event["start"] = feed_date(reservation.start)
+            event["end"] = feed_date(reservation.get_visual_end())
+            event["details_url"] = reverse("reservation_details", args=[reservation.id])
+            yield event
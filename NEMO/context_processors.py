@@ -1,14 +1,33 @@
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
 from NEMO.models import Area, Notification, PhysicalAccessLevel, Tool, User
 from NEMO.utilities import (
     date_input_js_format,
     datetime_input_js_format,
+    is_cache_shared,
     pickadate_date_format,
     pickadate_time_format,
+    quiet_int,
     time_input_js_format,
 )
 from NEMO.views.customization import CustomizationBase
 from NEMO.views.notifications import get_notification_counts
 
+SITE_FEATURE_FLAGS_CACHE_KEY = "NEMO_site_feature_flags"
+SITE_FEATURE_FLAGS_CACHE_SECONDS = quiet_int(getattr(settings, "SITE_FEATURE_FLAGS_CACHE_SECONDS", 60), 60)
+SITE_FEATURE_FLAGS = [
+    "tools_exist",
+    "areas_exist",
+    "buddy_system_areas_exist",
+    "access_user_request_allowed_exist",
+    "facility_managers_exist",
+]
+
 
 def show_logout_button(request):
     return {"logout_allowed": True}
@@ -29,22 +48,7 @@ def base_context(request):
                 request.session["no_header"] = False
     except:
         request.session["no_header"] = False
-    try:
-        tools_exist = Tool.objects.filter(visible=True).exists()
-    except:
-        tools_exist = False
-    try:
-        areas_exist = Area.objects.exists() and PhysicalAccessLevel.objects.exists()
-    except:
-        areas_exist = False
-    try:
-        buddy_system_areas_exist = Area.objects.filter(buddy_system_allowed=True).exists()
-    except:
-        buddy_system_areas_exist = False
-    try:
-        access_user_request_allowed_exist = PhysicalAccessLevel.objects.filter(allow_user_request=True).exists()
-    except:
-        access_user_request_allowed_exist = False
+    site_feature_flags = get_site_feature_flags()
     try:
         notification_counts = get_notification_counts(user)
     except:
@@ -74,10 +78,6 @@ def base_context(request):
         safety_notification_count = notification_counts.get(Notification.Types.SAFETY, 0)
     except:
         safety_notification_count = 0
-    try:
-        facility_managers_exist = User.objects.filter(is_active=True, is_facility_manager=True).exists()
-    except:
-        facility_managers_exist = False
     adjustment_request_allowed = customization_values.get("adjustment_requests_enabled", "")
     return {
         "customizations": customization_values,
@@ -85,10 +85,7 @@ def base_context(request):
         "recurring_charges_name": customization_values.get("recurring_charges_name"),
         "site_title": customization_values.get("site_title"),
         "device": getattr(request, "device", "desktop"),
-        "tools_exist": tools_exist,
-        "areas_exist": areas_exist,
-        "buddy_system_areas_exist": buddy_system_areas_exist,
-        "access_user_request_allowed_exist": access_user_request_allowed_exist,
+        **site_feature_flags,
         "adjustment_request_allowed": adjustment_request_allowed == "enabled"
         or adjustment_request_allowed == "reviewers_only"
         and isinstance(user, User)
@@ -101,7 +98,6 @@ def base_context(request):
         "temporary_access_notification_count": temporary_access_notification_count,
         "adjustment_notification_count": adjustment_notification_count,
         "safety_notification_count": safety_notification_count,
-        "facility_managers_exist": facility_managers_exist,
         "time_input_js_format": time_input_js_format,
         "date_input_js_format": date_input_js_format,
         "datetime_input_js_format": datetime_input_js_format,
@@ -117,3 +113,53 @@ def base_context(request):
         "calendar_first_day_of_week": customization_values.get("calendar_first_day_of_week"),
         "allow_profile_view": customization_values.get("user_allow_profile_view", "") == "enabled",
     }
+
+
+def get_site_feature_flags() -> Dict[str, bool]:
+    """
+    Returns facility-wide flags used to display menu items.
+    They are cached when the Django cache is shared between processes (they wouldn't be cleared in the others),
+    and the cache is cleared when tools, areas, access levels or users change.
+    """
+    if not is_cache_shared():
+        return compute_site_feature_flags() or dict.fromkeys(SITE_FEATURE_FLAGS, False)
+    site_feature_flags = cache.get(SITE_FEATURE_FLAGS_CACHE_KEY)
+    if site_feature_flags is None:
+        site_feature_flags = compute_site_feature_flags()
+        if site_feature_flags is None:
+            # Don't cache anything if we can't query the database
+            return dict.fromkeys(SITE_FEATURE_FLAGS, False)
+        cache.set(SITE_FEATURE_FLAGS_CACHE_KEY, site_feature_flags, SITE_FEATURE_FLAGS_CACHE_SECONDS)
+    return site_feature_flags
+
+
+def compute_site_feature_flags() -> Optional[Dict[str, bool]]:
+    """Returns facility-wide flags used to display menu items, or None if the database can't be queried"""
+    try:
+        return {
+            "tools_exist": Tool.objects.filter(visible=True).exists(),
+            "areas_exist": Area.objects.exists() and PhysicalAccessLevel.objects.exists(),
+            "buddy_system_areas_exist": Area.objects.filter(buddy_system_allowed=True).exists(),
+            "access_user_request_allowed_exist": PhysicalAccessLevel.objects.filter(allow_user_request=True).exists(),
+            "facility_managers_exist": User.objects.filter(is_active=True, is_facility_manager=True).exists(),
+        }
+    except:
+        return None
+
+
+@receiver(post_save, sender=Tool)
+@receiver(post_delete, sender=Tool)
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+@receiver(post_save, sender=PhysicalAccessLevel)
+@receiver(post_delete, sender=PhysicalAccessLevel)
+@receiver(post_delete, sender=User)
+def invalidate_site_feature_flags(sender, **kwargs):
+    cache.delete(SITE_FEATURE_FLAGS_CACHE_KEY)
+
+
+@receiver(post_save, sender=User)
+def invalidate_site_feature_flags_on_user_save(sender, update_fields=None, **kwargs):
+    # Users are saved on every login (last_login), only changes to active facility managers matter here
+    if update_fields is None or {"is_active", "is_facility_manager"}.intersection(update_fields):
+        invalidate_site_feature_flags(sender, **kwargs)
@@ -3,17 +3,17 @@ import inspect
 import sys
 from functools import wraps
 from logging import getLogger
-from threading import Lock, Thread
+from threading import Thread
 
+from django.conf import settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
 
+from NEMO.locks import get_lock_backend
 from NEMO.utilities import slugify_underscore
 
 decorators_logger = getLogger(__name__)
 
-locks = {}
-
 
 def disable_session_expiry_refresh(f):
     """
@@ -54,17 +54,19 @@ def postpone(function):
 # Passing a method argument will only lock a function being called with that same argument
 # For example, @synchronized('tool_id') on a do_this(tool_id) function will only prevent do_this from being called
 # at the same time with the same tool_id. If do_this is called twice with different tool_id, it won't be locked
-def synchronized(method_argument=""):
+# The lock backend is set with SYNCHRONIZED_LOCK_BACKEND (in-process by default, see NEMO.locks for cross-process ones)
+# A LockTimeoutError is raised if the lock cannot be acquired within timeout seconds (SYNCHRONIZED_LOCK_TIMEOUT)
+def synchronized(method_argument="", timeout=None):
     def decorator(function):
+        group_name = slugify_underscore(f"{function.__module__.replace('.', '_')}_{function.__qualname__}")
+
         @wraps(function)
         def wrapper(*args, **kwargs):
             func_args = inspect.signature(function).bind(*args, **kwargs).arguments
             attribute_value = slugify_underscore(str(func_args.get(method_argument, "")))
-            lock_name = slugify_underscore(
-                f"{function.__module__.replace('.', '_')}_{function.__qualname__}_{attribute_value}"
-            )
-            lock = locks.setdefault(lock_name, Lock())
-            with lock:
+            lock_name = slugify_underscore(f"{group_name}_{attribute_value}")
+            lock_timeout = timeout if timeout is not None else getattr(settings, "SYNCHRONIZED_LOCK_TIMEOUT", None)
+            with get_lock_backend().lock(lock_name, group_name, lock_timeout):
                 return function(*args, **kwargs)
 
         return wrapper
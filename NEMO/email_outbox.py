@@ -0,0 +1,158 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+from threading import Lock
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+from django.utils import timezone
+
+from NEMO.models import EmailLog
+from NEMO.utilities import send_email_message
+
+outbox_logger = getLogger(__name__)
+
+# Time a worker has to send an email it claimed, before other workers consider it abandoned and claim it again
+CLAIM_SECONDS = 300
+
+
+class SerializedMessage:
+    """Already serialized email message, with the methods used by email backends"""
+
+    def __init__(self, data: str):
+        self.data = data
+
+    def as_string(self, unixfrom=False, linesep="\n"):
+        # Messages are serialized with \n line endings. Only those are translated, bodies sent as 8bit can contain
+        # other characters splitlines() would split on (form feeds, unicode line separators etc.)
+        return self.data.replace("\n", linesep) if linesep != "\n" else self.data
+
+    def as_bytes(self, unixfrom=False, linesep="\n"):
+        return self.as_string(unixfrom, linesep).encode()
+
+    def get_charset(self):
+        return None
+
+
+class QueuedEmailMessage(EmailMessage):
+    """Email message for a queued email log, sending the message exactly as it was serialized when it was queued"""
+
+    def __init__(self, email_log: EmailLog, connection=None):
+        super().__init__(
+            subject=email_log.subject,
+            from_email=email_log.sender,
+            to=email_log.get_recipients(),
+            connection=connection,
+        )
+        self.email_log = email_log
+
+    def message(self, *args, **kwargs):
+        return SerializedMessage(self.email_log.message)
+
+
+class RateLimiter:
+    """Spaces out calls to wait() so they are made at most rate times per second, across threads"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def get_retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff, starting at EMAIL_OUTBOX_RETRY_DELAY seconds after the first failed attempt"""
+    return timedelta(seconds=getattr(settings, "EMAIL_OUTBOX_RETRY_DELAY", 60) * 2 ** (attempts - 1))
+
+
+def claim_email(email_id: int) -> Optional[EmailLog]:
+    # Claim the email by pushing its next attempt back, so other workers don't send it at the same time
+    now = timezone.now()
+    claimed = EmailLog.objects.filter(id=email_id, queued=True, next_attempt__lte=now).update(
+        next_attempt=now + timedelta(seconds=CLAIM_SECONDS)
+    )
+    return EmailLog.objects.get(id=email_id) if claimed else None
+
+
+def send_queued_email(email_log: EmailLog, connection) -> bool:
+    email_log.attempts += 1
+    try:
+        send_email_message(QueuedEmailMessage(email_log, connection))
+        email_log.queued = False
+        email_log.ok = True
+        email_log.next_attempt = None
+        email_log.message = None
+    except Exception as e:
+        outbox_logger.error(f"Error sending queued email {email_log.id} (attempt {email_log.attempts}): {e}")
+        email_log.ok = False
+        email_log.last_error = str(e)
+        if email_log.attempts >= getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5):
+            email_log.queued = False
+            email_log.next_attempt = None
+        else:
+            email_log.next_attempt = timezone.now() + get_retry_delay(email_log.attempts)
+    email_log.save(update_fields=["queued", "ok", "attempts", "next_attempt", "last_error", "message"])
+    return email_log.ok and not email_log.queued
+
+
+def send_queued_emails_with_connection(email_ids: List[int], rate_limiter: RateLimiter) -> int:
+    sent = 0
+    connection = get_connection()
+    try:
+        # Open the connection now, so it is kept open between messages
+        connection.open()
+    except Exception as e:
+        outbox_logger.error(e)
+    try:
+        for email_id in email_ids:
+            email_log = claim_email(email_id)
+            if email_log:
+                rate_limiter.wait()
+                sent += send_queued_email(email_log, connection)
+    finally:
+        connection.close()
+    return sent
+
+
+def send_queued_emails_in_thread(email_ids: List[int], rate_limiter: RateLimiter) -> int:
+    try:
+        return send_queued_emails_with_connection(email_ids, rate_limiter)
+    finally:
+        # Threads get their own database connection, close it when done
+        db_connection.close()
+
+
+def send_queued_emails(max_workers: int = None, rate_limit: float = None, limit: int = None) -> int:
+    """
+    Sends the queued emails that are due, and returns the number of emails successfully sent.
+    Emails are sent by up to max_workers threads (EMAIL_OUTBOX_MAX_WORKERS), each one using its own connection.
+    rate_limit (EMAIL_OUTBOX_RATE_LIMIT) is the maximum number of emails sent per second, across all workers.
+    Failed emails are retried later with an exponential backoff, up to EMAIL_OUTBOX_MAX_ATTEMPTS times.
+    """
+    max_workers = max_workers or getattr(settings, "EMAIL_OUTBOX_MAX_WORKERS", 1)
+    rate_limiter = RateLimiter(rate_limit or getattr(settings, "EMAIL_OUTBOX_RATE_LIMIT", None))
+    due_emails = EmailLog.objects.filter(queued=True, next_attempt__lte=timezone.now()).order_by("next_attempt", "id")
+    email_ids = list(due_emails.values_list("id", flat=True)[:limit])
+    if not email_ids:
+        return 0
+    if max_workers == 1:
+        return send_queued_emails_with_connection(email_ids, rate_limiter)
+    # Spread the emails between workers, so they are still sent roughly in order
+    workers = min(max_workers, len(email_ids))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="email_outbox") as executor:
+        results = executor.map(
+            send_queued_emails_in_thread, [email_ids[i::workers] for i in range(workers)], [rate_limiter] * workers
+        )
+        return sum(results)
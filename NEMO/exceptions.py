@@ -139,3 +139,11 @@ class RequiredUnansweredQuestionsException(NEMOException):
         display_questions = ", ".join([f'"{question.title}"' for question in questions])
         msg = f"You have to answer the following required questions: {display_questions}"
         super().__init__(msg)
+
+
+class LockTimeoutError(NEMOException):
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        msg = "The operation could not be completed because another one is still in progress, please try again."
+        super().__init__(msg)
@@ -0,0 +1,365 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Min, Prefetch
+from django.dispatch import receiver
+from django.utils import timezone
+
+from NEMO.locks import get_lock_backend
+from NEMO.models import (
+    Area,
+    AreaAccessRecord,
+    Resource,
+    ScheduledOutage,
+    Task,
+    Tool,
+    UsageEvent,
+    User,
+)
+from NEMO.tool_status import ToolStatusHelper
+from NEMO.utilities import is_cache_shared, quiet_int
+
+
+class FacilityStatusSnapshot:
+    """
+    Materialized status of the tools and of the area occupancy, used by the status dashboard and the sidebar.
+    It is stored in the Django cache and kept up to date from signals: saving or deleting usage events, tasks,
+    resources, outages, tools and area access records saves a small stale marker under the next value of a generation
+    counter, and only the items it lists are computed again on the next read. Saves never read or write the snapshot
+    itself, the snapshot records the generation it includes. So reading it usually doesn't run any query.
+    The whole snapshot is rebuilt when it's missing, when stale markers are missing, when a scheduled outage or a
+    delayed logoff starts or ends, and after FACILITY_STATUS_SNAPSHOT_SECONDS, for changes without signals (user names,
+    area reservations etc.).
+    The status has to be exact, so the snapshot is only kept when the Django cache is shared between processes
+    (memcached, redis, database etc.). Otherwise, changes made in one process would not be seen by the others, and the
+    status is built on every read instead (still a fixed number of queries).
+    """
+
+    CACHE_KEY = "NEMO_facility_status_snapshot"
+    CACHE_TTL = quiet_int(getattr(settings, "FACILITY_STATUS_SNAPSHOT_SECONDS", 60), 60)
+    GENERATION_KEY = "NEMO_facility_status_generation"
+    STALE_KEY_PREFIX = "NEMO_facility_status_stale_"
+    # Above this many stale markers, rebuilding the whole snapshot is cheaper
+    MAX_STALE_MARKERS = 500
+    LOCK_NAME = "NEMO_facility_status_snapshot"
+
+    @classmethod
+    def get(cls) -> Dict:
+        if not is_cache_shared():
+            return cls.build(None)
+        snapshot = cache.get(cls.CACHE_KEY)
+        if snapshot is None or cls.needs_refresh(snapshot, cls.generation()):
+            with get_lock_backend().lock(cls.LOCK_NAME):
+                # The generation is read before the database, so changes made in between will be applied next time
+                generation = cls.generation()
+                snapshot = cache.get(cls.CACHE_KEY)
+                if snapshot is not None and snapshot["generation"] != generation:
+                    markers = cls.stale_markers(snapshot["generation"], generation)
+                    if markers is None:
+                        snapshot = None
+                    else:
+                        cls.refresh_stale_items(snapshot, markers)
+                        snapshot["generation"] = generation
+                if snapshot is None or snapshot["valid_until"] <= timezone.now():
+                    snapshot = cls.build(generation)
+                cache.set(cls.CACHE_KEY, snapshot, None)
+        return snapshot
+
+    @classmethod
+    def rebuild(cls) -> Dict:
+        if not is_cache_shared():
+            return cls.build(None)
+        with get_lock_backend().lock(cls.LOCK_NAME):
+            snapshot = cls.build(cls.generation())
+            cache.set(cls.CACHE_KEY, snapshot, None)
+        return snapshot
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
+
+    @classmethod
+    def is_tracking_changes(cls) -> bool:
+        # The generation counter is created by the first read. If it is lost, the next read rebuilds the snapshot
+        return is_cache_shared() and cache.get(cls.GENERATION_KEY) is not None
+
+    @classmethod
+    def generation(cls) -> int:
+        generation = cache.get(cls.GENERATION_KEY)
+        if generation is None:
+            # Start from the current time, so a counter lost from the cache never goes back to a known generation
+            cache.add(cls.GENERATION_KEY, int(time.time() * 1000), None)
+            generation = cache.get(cls.GENERATION_KEY)
+        return generation
+
+    @classmethod
+    def mark_stale(cls, tool_ids: Iterable[int] = (), record_ids: Iterable[int] = (), areas=False, changes_at=None):
+        """
+        Marks tools (and the tools of the same family) and area access records as stale.
+        areas marks the areas unavailable resources and outages as stale.
+        changes_at is when the status will change without any signal (start or end of an outage or a delayed logoff).
+        """
+        marker = {
+            "tool_ids": [tool_id for tool_id in tool_ids if tool_id],
+            "record_ids": list(record_ids),
+            "areas": areas,
+            "changes_at": changes_at,
+        }
+        cls.generation()
+        generation = cache.incr(cls.GENERATION_KEY)
+        # Markers are only needed until the snapshot expires, it is fully rebuilt after that
+        cache.set(f"{cls.STALE_KEY_PREFIX}{generation}", marker, cls.CACHE_TTL * 2)
+
+    @classmethod
+    def mark_stale_on_commit(cls, **kwargs):
+        # Inside a transaction, right away for this process and again after commit in case the snapshot was
+        # refreshed in between (outside a transaction, on_commit runs right away)
+        if transaction.get_connection().in_atomic_block:
+            cls.mark_stale(**kwargs)
+        transaction.on_commit(lambda: cls.mark_stale(**kwargs))
+
+    @staticmethod
+    def needs_refresh(snapshot: Dict, generation: int) -> bool:
+        return snapshot["valid_until"] <= timezone.now() or snapshot["generation"] != generation
+
+    @classmethod
+    def stale_markers(cls, from_generation: int, to_generation: int) -> Optional[List[Dict]]:
+        """Returns the stale markers after from_generation, or None when some are missing and it needs a rebuild"""
+        if not 0 < to_generation - from_generation <= cls.MAX_STALE_MARKERS:
+            return None
+        keys = [f"{cls.STALE_KEY_PREFIX}{generation}" for generation in range(from_generation + 1, to_generation + 1)]
+        markers = cache.get_many(keys)
+        return list(markers.values()) if len(markers) == len(keys) else None
+
+    @classmethod
+    def build(cls, generation: Optional[int]) -> Dict:
+        now = timezone.now()
+        snapshot = {
+            "tools": tool_entries(),
+            "occupants": occupant_entries(),
+            "valid_until": now + timedelta(seconds=cls.CACHE_TTL),
+            "generation": generation,
+        }
+        snapshot.update(area_flags())
+        # Outages and delayed logoffs change the status without any signal when they start or end
+        next_changes = [
+            ScheduledOutage.objects.filter(start__gt=now).aggregate(next=Min("start"))["next"],
+            ScheduledOutage.objects.filter(end__gt=now).aggregate(next=Min("end"))["next"],
+            UsageEvent.objects.filter(end__gt=now).aggregate(next=Min("end"))["next"],
+        ]
+        snapshot["valid_until"] = min([change for change in next_changes if change] + [snapshot["valid_until"]])
+        return snapshot
+
+    @staticmethod
+    def refresh_stale_items(snapshot: Dict, markers: List[Dict]):
+        stale_tool_ids = {tool_id for marker in markers for tool_id in marker["tool_ids"]}
+        if stale_tool_ids:
+            # Tools sharing the usage and problems of the stale tools (parent and children)
+            tool_ids = set(stale_tool_ids)
+            for tool_id, entry in snapshot["tools"].items():
+                if stale_tool_ids.intersection(entry["family_ids"]):
+                    tool_ids.add(tool_id)
+            entries = tool_entries(tool_ids)
+            for tool_id in tool_ids:
+                snapshot["tools"].pop(tool_id, None)
+            snapshot["tools"].update(entries)
+        record_ids = {record_id for marker in markers for record_id in marker["record_ids"]}
+        if record_ids:
+            for record_id in record_ids:
+                snapshot["occupants"].pop(record_id, None)
+            snapshot["occupants"].update(occupant_entries(record_ids))
+        if any(marker["areas"] for marker in markers):
+            snapshot.update(area_flags())
+        now = timezone.now()
+        for marker in markers:
+            if marker["changes_at"] and now < marker["changes_at"] < snapshot["valid_until"]:
+                snapshot["valid_until"] = marker["changes_at"]
+
+
+def tool_entries(tool_ids: Iterable[int] = None) -> Dict[int, Dict]:
+    tools = Tool.objects.filter(visible=True).prefetch_related(
+        "_primary_owner",
+        "_backup_owners",
+        "_superusers",
+        Prefetch("_requires_area_access", queryset=Area.objects.all().only("name", "requires_reservation")),
+    )
+    if tool_ids is not None:
+        tools = tools.filter(id__in=tool_ids)
+    tool_statuses = ToolStatusHelper(tools)
+    return {tool.id: tool_entry(tool_statuses, tool) for tool in tool_statuses.tools}
+
+
+def tool_entry(tool_statuses: ToolStatusHelper, tool: Tool) -> Dict:
+    status = tool_statuses.get(tool)
+    event = status.current_usage_event
+    entry = {
+        "name": tool_statuses.name_or_child_in_use_name(tool),
+        "id": tool.id,
+        "user": "",
+        "operator": "",
+        "in_use": False,
+        "in_use_since": "",
+        "delayed_logoff_in_progress": status.delayed_logoff_in_progress,
+        "problematic": status.problematic,
+        "operational": tool.operational,
+        "required_resource_is_unavailable": bool(status.unavailable_required_resources),
+        "nonrequired_resource_is_unavailable": bool(status.unavailable_nonrequired_resources),
+        "scheduled_outage": bool(status.outages),
+        "scheduled_partial_outage": bool(status.partial_outages),
+        "area_name": tool.requires_area_access.name if tool.requires_area_access else None,
+        "area_requires_reservation": (
+            tool.requires_area_access.requires_reservation if tool.requires_area_access else False
+        ),
+        "get_tool_info_html": tool.get_tool_info_html(),
+        # Used to filter, group and update entries, removed before display
+        "category": tool._category,
+        "tool_or_parent_id": tool.tool_or_parent_id(),
+        "family_ids": [tool.id, tool.tool_or_parent_id()],
+    }
+    if event:
+        entry["operator"] = str(event.operator)
+        entry["user"] = str(event.operator)
+        if event.user != event.operator:
+            entry["user"] += " on behalf of " + str(event.user)
+        entry["in_use"] = True
+        entry["in_use_since"] = event.start
+        entry["operator_is_any_part_of_staff"] = event.operator.is_any_part_of_staff
+        entry["operator_is_service_personnel"] = event.operator.is_service_personnel
+    return entry
+
+
+def occupant_entries(record_ids: Iterable[int] = None) -> Dict[int, Dict]:
+    occupants = AreaAccessRecord.objects.filter(end=None, staff_charge=None).prefetch_related(
+        Prefetch(
+            "customer",
+            queryset=User.objects.all().only(
+                "first_name",
+                "last_name",
+                "username",
+                "is_staff",
+                "is_accounting_officer",
+                "is_user_office",
+                "is_facility_manager",
+                "is_superuser",
+            ),
+        )
+    )
+    if record_ids is not None:
+        occupants = occupants.filter(id__in=record_ids)
+    result = {}
+    for occupant in occupants:
+        customer: User = occupant.customer
+        if customer.is_any_part_of_staff:
+            customer_display = f'<span class="success-highlight">{str(customer)}</span>'
+        elif customer.is_service_personnel:
+            customer_display = f'<span class="warning-highlight">{str(customer)}</span>'
+        elif (
+            customer.is_logged_in_area_without_reservation() or customer.is_logged_in_area_outside_authorized_schedule()
+        ):
+            customer_display = f'<span class="danger-highlight">{str(customer)}</span>'
+        else:
+            customer_display = str(customer)
+        result[occupant.id] = {
+            "area_id": occupant.area_id,
+            "customer_display": customer_display,
+            "is_any_part_of_staff": customer.is_any_part_of_staff,
+            "is_service_personnel": customer.is_service_personnel,
+        }
+    return result
+
+
+def area_flags() -> Dict[str, List[int]]:
+    now = timezone.now()
+    resource_areas = Resource.dependent_areas.through.objects
+    outages = ScheduledOutage.objects.filter(start__lte=now, end__gt=now, tool__isnull=True)
+    outage_area_ids = set(outages.filter(area__isnull=False).values_list("area_id", flat=True))
+    outage_area_ids.update(
+        resource_areas.filter(resource__in=outages.filter(resource__isnull=False).values("resource_id")).values_list(
+            "area_id", flat=True
+        )
+    )
+    return {
+        "unavailable_resource_area_ids": list(
+            resource_areas.filter(resource__available=False).values_list("area_id", flat=True)
+        ),
+        "outage_area_ids": list(outage_area_ids),
+    }
+
+
+def changes_at(*dates: Optional[datetime]) -> Optional[datetime]:
+    now = timezone.now()
+    return min([date for date in dates if date and date > now], default=None)
+
+
+def resource_tool_ids(resource_id) -> List[int]:
+    tool_ids = list(
+        Resource.fully_dependent_tools.through.objects.filter(resource_id=resource_id).values_list("tool_id", flat=True)
+    )
+    tool_ids.extend(
+        Resource.partially_dependent_tools.through.objects.filter(resource_id=resource_id).values_list(
+            "tool_id", flat=True
+        )
+    )
+    return tool_ids
+
+
+def invalidate_on_change(sender, **kwargs):
+    FacilityStatusSnapshot.invalidate()
+    transaction.on_commit(FacilityStatusSnapshot.invalidate)
+
+
+@receiver(models.signals.post_save, sender=UsageEvent)
+@receiver(models.signals.post_delete, sender=UsageEvent)
+def usage_event_changed(sender, instance: UsageEvent, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        FacilityStatusSnapshot.mark_stale_on_commit(
+            tool_ids=[instance.tool_id, instance.tool.parent_tool_id], changes_at=changes_at(instance.end)
+        )
+
+
+@receiver(models.signals.post_save, sender=Task)
+@receiver(models.signals.post_delete, sender=Task)
+def task_changed(sender, instance: Task, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        FacilityStatusSnapshot.mark_stale_on_commit(tool_ids=[instance.tool_id])
+
+
+@receiver(models.signals.post_save, sender=Tool)
+@receiver(models.signals.post_delete, sender=Tool)
+def tool_changed(sender, instance: Tool, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        FacilityStatusSnapshot.mark_stale_on_commit(tool_ids=[instance.id, instance.parent_tool_id])
+
+
+@receiver(models.signals.post_save, sender=Resource)
+def resource_changed(sender, instance: Resource, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        FacilityStatusSnapshot.mark_stale_on_commit(tool_ids=resource_tool_ids(instance.id), areas=True)
+
+
+@receiver(models.signals.post_save, sender=ScheduledOutage)
+@receiver(models.signals.post_delete, sender=ScheduledOutage)
+def scheduled_outage_changed(sender, instance: ScheduledOutage, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        tool_ids = resource_tool_ids(instance.resource_id) if instance.resource_id else [instance.tool_id]
+        FacilityStatusSnapshot.mark_stale_on_commit(
+            tool_ids=tool_ids, areas=not instance.tool_id, changes_at=changes_at(instance.start, instance.end)
+        )
+
+
+@receiver(models.signals.post_save, sender=AreaAccessRecord)
+@receiver(models.signals.post_delete, sender=AreaAccessRecord)
+def area_access_record_changed(sender, instance: AreaAccessRecord, raw=False, **kwargs):
+    if not raw and FacilityStatusSnapshot.is_tracking_changes():
+        FacilityStatusSnapshot.mark_stale_on_commit(record_ids=[instance.id])
+
+
+# Dependencies of deleted resources are already gone, so everything needs to be computed again
+models.signals.post_delete.connect(invalidate_on_change, sender=Resource)
+models.signals.m2m_changed.connect(invalidate_on_change, sender=Resource.fully_dependent_tools.through)
+models.signals.m2m_changed.connect(invalidate_on_change, sender=Resource.partially_dependent_tools.through)
+models.signals.m2m_changed.connect(invalidate_on_change, sender=Resource.dependent_areas.through)
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import select
 import socket
 import struct
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
 from logging import getLogger
-from time import sleep
-from typing import Dict, List, Optional, TYPE_CHECKING
+from threading import Lock, Thread
+from time import monotonic, perf_counter, sleep
+from typing import Callable, Dict, Iterable, List, Optional, TYPE_CHECKING, Tuple
 from xml.etree import ElementTree
 
 import requests
@@ -36,6 +40,7 @@ INTERLOCK_STATUS_NO_CONNECTION = "No connection"
 INTERLOCK_STATUS_CARD_DISABLED = "Card disabled"
 INTERLOCK_STATUS_INTERLOCKS_DISABLED = "Interlocks are disabled"
 INTERLOCK_STATUS_NOT_IMPLEMENTED = "Not implemented"
+INTERLOCK_STATUS_TIMED_OUT = "Timed out"
 
 
 class Interlock(ABC):
@@ -148,6 +153,30 @@ class Interlock(ABC):
     def _ping(self, interlock: Interlock_model) -> str:
         return INTERLOCK_STATUS_NOT_IMPLEMENTED
 
+    def ping_card(self, card: InterlockCard, card_interlocks: List[Interlock_model]) -> Dict[int, str]:
+        """
+        Check the connectivity of interlocks that all belong to the given card.
+
+        Returns:
+            Dict[int, str]: A message indicating the connectivity status of each interlock, by interlock id.
+        """
+        interlocks_enabled = getattr(settings, "INTERLOCKS_ENABLED", False)
+        if not interlocks_enabled:
+            return {interlock.id: INTERLOCK_STATUS_INTERLOCKS_DISABLED for interlock in card_interlocks}
+        elif not card.enabled:
+            return {interlock.id: INTERLOCK_STATUS_CARD_DISABLED for interlock in card_interlocks}
+        return self._ping_card(card, card_interlocks)
+
+    def _ping_card(self, card: InterlockCard, card_interlocks: List[Interlock_model]) -> Dict[int, str]:
+        # Ping each interlock, but stop trying as soon as the card cannot be reached
+        statuses = {}
+        for interlock in card_interlocks:
+            status = self._ping(interlock)
+            statuses[interlock.id] = status
+            if status == INTERLOCK_STATUS_NO_CONNECTION:
+                return {**{i.id: INTERLOCK_STATUS_NO_CONNECTION for i in card_interlocks}, **statuses}
+        return statuses
+
 
 class NoOpInterlock(Interlock):
     def _send_command(self, interlock: Interlock_model, command_type: Interlock_model.State) -> Interlock_model.State:
@@ -329,10 +358,7 @@ class StanfordInterlock(Interlock):
 
     def _ping(self, interlock: Interlock_model) -> str:
         try:
-            sock = socket.socket()
-            sock.settimeout(3.0)
-            server_address = (interlock.card.server, interlock.card.port)
-            with sock.connect(server_address):
+            with socket.create_connection((interlock.card.server, interlock.card.port), 3.0):
                 pass
         except OSError:
             return INTERLOCK_STATUS_NO_CONNECTION
@@ -340,6 +366,147 @@ class StanfordInterlock(Interlock):
             return INTERLOCK_STATUS_ERROR + f": {str(error)}"
         return INTERLOCK_STATUS_OK
 
+    def _ping_card(self, card: InterlockCard, card_interlocks: List[Interlock_model]) -> Dict[int, str]:
+        # We only check the connection to the card, so the status is the same for all its interlocks
+        status = self._ping(card_interlocks[0])
+        return {interlock.id: status for interlock in card_interlocks}
+
+
+class CardConnection:
+    """An open connection to an interlock card, with the lock serializing its use"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.connection = None
+        self.last_used = 0.0
+
+
+class InterlockCardConnectionPool(ABC):
+    """
+    Opens a connection per command by default. Commands sent to the same card are serialized (within this process),
+    so concurrent commands wait for their turn.
+    Pooling is enabled by setting INTERLOCKS_CONNECTION_IDLE_TIMEOUT: one connection per card is then kept open,
+    checked before being reused, reopened when broken, and closed after being idle for that many seconds.
+    Relay boards usually only accept a single client, so pooling should only be used when a single process sends
+    interlock commands (each process would otherwise hold its own connection to the card and block the others).
+    """
+
+    def __init__(self):
+        self._card_connections: Dict[Tuple, CardConnection] = {}
+        self._lock = Lock()
+        self._reaper: Optional[Thread] = None
+
+    @abstractmethod
+    def _open(self, card: InterlockCard, timeout: float):
+        pass
+
+    @abstractmethod
+    def _is_healthy(self, connection) -> bool:
+        pass
+
+    @abstractmethod
+    def _close(self, connection):
+        pass
+
+    @staticmethod
+    def idle_timeout() -> float:
+        return getattr(settings, "INTERLOCKS_CONNECTION_IDLE_TIMEOUT", 0)
+
+    def execute(self, card: InterlockCard, function: Callable, timeout: float):
+        """
+        Calls function with an open connection to the card and returns its result.
+        If the function fails on a reused connection, it is called again once with a new connection.
+        """
+        card_connection = self._get_card_connection(card)
+        with card_connection.lock:
+            start = perf_counter()
+            try:
+                reused = card_connection.connection is not None and self._is_healthy(card_connection.connection)
+                for attempt in range(2 if reused else 1):
+                    if not reused or attempt:
+                        self._discard(card_connection)
+                        card_connection.connection = self._open(card, timeout)
+                    try:
+                        return function(card_connection.connection)
+                    except Exception:
+                        self._discard(card_connection)
+                        if attempt or not reused:
+                            raise
+                        interlocks_logger.debug(f"Reconnecting to interlock card {card}")
+            finally:
+                card_connection.last_used = monotonic()
+                if self.idle_timeout() <= 0:
+                    self._discard(card_connection)
+                interlocks_logger.debug(f"Interlock card {card} command took {perf_counter() - start:.3f}s")
+
+    def close_all(self):
+        for card_connection in list(self._card_connections.values()):
+            with card_connection.lock:
+                self._discard(card_connection)
+
+    def _get_card_connection(self, card: InterlockCard) -> CardConnection:
+        # Include the server and port, so a new connection is used when they change
+        key = (card.id, card.server, card.port)
+        with self._lock:
+            if key not in self._card_connections:
+                self._card_connections[key] = CardConnection()
+            if self._reaper is None and self.idle_timeout() > 0:
+                self._reaper = Thread(target=self._close_idle_connections, name="interlock_reaper", daemon=True)
+                self._reaper.start()
+            return self._card_connections[key]
+
+    def _discard(self, card_connection: CardConnection):
+        if card_connection.connection is not None:
+            try:
+                self._close(card_connection.connection)
+            except Exception as error:
+                interlocks_logger.debug(error)
+            card_connection.connection = None
+
+    def _close_idle_connections(self):
+        while True:
+            idle_timeout = self.idle_timeout()
+            sleep(max(idle_timeout / 2, 1))
+            for card_connection in list(self._card_connections.values()):
+                # Skip connections being used, they will be checked again later
+                if card_connection.lock.acquire(blocking=False):
+                    try:
+                        if monotonic() - card_connection.last_used > idle_timeout:
+                            self._discard(card_connection)
+                    finally:
+                        card_connection.lock.release()
+
+
+class SocketConnectionPool(InterlockCardConnectionPool):
+    def _open(self, card: InterlockCard, timeout: float) -> socket.socket:
+        return socket.create_connection((card.server, card.port), timeout=timeout)
+
+    def _is_healthy(self, connection: socket.socket) -> bool:
+        try:
+            # An idle connection should have nothing to read, otherwise it was closed by the card (or has stale data)
+            readable, _, _ = select.select([connection], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _close(self, connection: socket.socket):
+        connection.close()
+
+
+class ModbusConnectionPool(InterlockCardConnectionPool):
+    def _open(self, card: InterlockCard, timeout: float) -> ModbusTcpClient:
+        client = ModbusTcpClient(card.server, port=card.port, timeout=timeout)
+        if not client.connect():
+            client.close()
+            raise ConnectionException(f"Connection to server {card.server}:{card.port} could not be established")
+        return client
+
+    def _is_healthy(self, connection: ModbusTcpClient) -> bool:
+        return connection.connected
+
+    def _close(self, connection: ModbusTcpClient):
+        connection.close()
+
 
 class ProXrInterlock(Interlock):
     """
@@ -423,40 +590,53 @@ class ProXrInterlock(Interlock):
 
     def _send_command(self, interlock: Interlock_model, command_type: Interlock_model.State) -> Interlock_model.State:
         """Returns and sets NEMO locked/unlocked state."""
-        state = Interlock_model.State.UNKNOWN
         # Backward compatibility, no bank means bank 1
         bank = interlock.unit_id if interlock.unit_id is not None else 1
+
+        def send_command(relay_socket) -> Interlock_model.State:
+            if command_type == Interlock_model.State.LOCKED:
+                # turn the interlock channel off
+                off_command = self._get_command_value(interlock, self.PXR_RELAY_OFF)
+                self._send_bytes(relay_socket, (254, off_command, bank))
+                return self._get_state(relay_socket, interlock.card, interlock.channel, bank)
+            elif command_type == Interlock_model.State.UNLOCKED:
+                # turn the interlock channel on
+                on_command = self._get_command_value(interlock, self.PXR_RELAY_ON)
+                self._send_bytes(relay_socket, (254, on_command, bank))
+                return self._get_state(relay_socket, interlock.card, interlock.channel, bank)
+            return Interlock_model.State.UNKNOWN
+
         try:
             timeout = interlock.card.extra_args_dict.get("timeout", 10)
-            with socket.create_connection(
-                (interlock.card.server, interlock.card.port), timeout=timeout
-            ) as relay_socket:
-                if command_type == Interlock_model.State.LOCKED:
-                    # turn the interlock channel off
-                    off_command = self._get_command_value(interlock, self.PXR_RELAY_OFF)
-                    self._send_bytes(relay_socket, (254, off_command, bank))
-                    state = self._get_state(relay_socket, interlock.card, interlock.channel, bank)
-                elif command_type == Interlock_model.State.UNLOCKED:
-                    # turn the interlock channel on
-                    on_command = self._get_command_value(interlock, self.PXR_RELAY_ON)
-                    self._send_bytes(relay_socket, (254, on_command, bank))
-                    state = self._get_state(relay_socket, interlock.card, interlock.channel, bank)
+            return proxr_connection_pool.execute(interlock.card, send_command, timeout)
         except Exception as error:
             raise InterlockError(interlock=interlock, msg="Communication error: " + str(error))
-        return state
 
     def _ping(self, interlock: Interlock_model) -> str:
-        try:
-            with socket.create_connection((interlock.card.server, interlock.card.port), 5) as relay_socket:
+        return self._ping_card(interlock.card, [interlock])[interlock.id]
+
+    def _ping_card(self, card: InterlockCard, card_interlocks: List[Interlock_model]) -> Dict[int, str]:
+        # Use the same connection to read the state of all the interlocks
+        statuses = {interlock.id: INTERLOCK_STATUS_NO_CONNECTION for interlock in card_interlocks}
+
+        def read_states(relay_socket):
+            for interlock in card_interlocks:
                 bank = interlock.unit_id if interlock.unit_id is not None else 1
                 # Try to read the state
                 try:
-                    self._get_state(relay_socket, interlock.card, interlock.channel, bank)
+                    self._get_state(relay_socket, card, interlock.channel, bank)
+                    statuses[interlock.id] = INTERLOCK_STATUS_OK
                 except Exception as error:
-                    return INTERLOCK_STATUS_ERROR + f": {str(error)}"
+                    statuses[interlock.id] = INTERLOCK_STATUS_ERROR + f": {str(error)}"
+                    if isinstance(error, OSError):
+                        # The connection is broken, don't try the other interlocks
+                        raise
+
+        try:
+            proxr_connection_pool.execute(card, read_states, 5)
         except:
-            return INTERLOCK_STATUS_NO_CONNECTION
-        return INTERLOCK_STATUS_OK
+            pass
+        return statuses
 
 
 class WebRelayHttpInterlock(Interlock):
@@ -601,45 +781,58 @@ class ModbusTcpInterlock(Interlock):
     def set_relay_state(cls, interlock: Interlock_model, state: {0, 1}) -> Interlock_model.State:
         coil = interlock.channel
         timeout = interlock.card.extra_args_dict.get("timeout", 3)
-        client = ModbusTcpClient(interlock.card.server, port=interlock.card.port, timeout=timeout)
-        try:
-            valid_connection = client.connect()
-            if not valid_connection:
-                raise Exception(
-                    f"Connection to server {interlock.card.server}:{interlock.card.port} could not be established"
-                )
-            kwargs = {"device_id": interlock.unit_id} if interlock.unit_id is not None else {}
+        # Time to wait for the coil to be set before reading it back
+        read_delay = interlock.card.extra_args_dict.get("read_delay", 0.3)
+        kwargs = {"device_id": interlock.unit_id} if interlock.unit_id is not None else {}
+
+        def write_coil(client: ModbusTcpClient) -> Interlock_model.State:
             write_reply = client.write_coil(coil, state, **kwargs)
             if write_reply.isError():
                 raise Exception(str(write_reply))
-            sleep(0.3)
+            sleep(read_delay)
             read_reply = client.read_coils(coil, count=1, **kwargs)
             if read_reply.isError():
                 raise Exception(str(read_reply))
-            state = read_reply.bits[0]
-            if state == cls._get_command_value(interlock, cls.MODBUS_OFF):
+            new_state = read_reply.bits[0]
+            if new_state == cls._get_command_value(interlock, cls.MODBUS_OFF):
                 return Interlock_model.State.LOCKED
-            elif state == cls._get_command_value(interlock, cls.MODBUS_ON):
+            elif new_state == cls._get_command_value(interlock, cls.MODBUS_ON):
                 return Interlock_model.State.UNLOCKED
-        finally:
-            client.close()
+
+        return modbus_connection_pool.execute(interlock.card, write_coil, timeout)
 
     def _ping(self, interlock: Interlock_model) -> str:
-        try:
-            with ModbusTcpClient(interlock.card.server, port=interlock.card.port) as client:
-                valid_connection = client.connect()
-                if not valid_connection:
-                    return INTERLOCK_STATUS_NO_CONNECTION
-                else:
+        return self._ping_card(interlock.card, [interlock])[interlock.id]
+
+    def _ping_card(self, card: InterlockCard, card_interlocks: List[Interlock_model]) -> Dict[int, str]:
+        # Use the same client to read the coils of all the interlocks
+        statuses = {interlock.id: INTERLOCK_STATUS_NO_CONNECTION for interlock in card_interlocks}
+
+        def read_coils(client: ModbusTcpClient):
+            for interlock in card_interlocks:
+                try:
                     kwargs = {"device_id": interlock.unit_id} if interlock.unit_id is not None else {}
                     read_reply = client.read_coils(interlock.channel, count=1, **kwargs)
                     if read_reply.isError():
-                        return INTERLOCK_STATUS_ERROR + f": {str(read_reply)}"
+                        statuses[interlock.id] = INTERLOCK_STATUS_ERROR + f": {str(read_reply)}"
+                    else:
+                        statuses[interlock.id] = INTERLOCK_STATUS_OK
+                except ConnectionException:
+                    # The connection is broken, don't try the other interlocks
+                    statuses[interlock.id] = INTERLOCK_STATUS_NO_CONNECTION
+                    raise
+                except Exception as error:
+                    statuses[interlock.id] = INTERLOCK_STATUS_ERROR + f": {str(error)}"
+
+        try:
+            modbus_connection_pool.execute(card, read_coils, 3)
         except ConnectionException:
-            return INTERLOCK_STATUS_NO_CONNECTION
+            pass
         except Exception as error:
-            return INTERLOCK_STATUS_ERROR + f": {str(error)}"
-        return INTERLOCK_STATUS_OK
+            for interlock_id, status in statuses.items():
+                if status == INTERLOCK_STATUS_NO_CONNECTION:
+                    statuses[interlock_id] = INTERLOCK_STATUS_ERROR + f": {str(error)}"
+        return statuses
 
 
 def send_csv_interlock_report(interlock_list: QuerySetType[Interlock_model], users: List[User]):
@@ -655,6 +848,45 @@ def send_csv_interlock_report(interlock_list: QuerySetType[Interlock_model], use
         )
 
 
+def ping_interlocks(interlock_list: Iterable[Interlock_model]) -> Dict[int, str]:
+    """
+    Pings interlocks concurrently and returns their status by interlock id.
+    Interlocks are grouped by card, and each card is pinged in its own thread (up to INTERLOCKS_PING_MAX_WORKERS).
+    Interlocks on cards that have not answered after INTERLOCKS_PING_DEADLINE seconds are reported as timed out.
+    """
+    interlocks_by_card: Dict[int, List[Interlock_model]] = defaultdict(list)
+    for interlock in interlock_list:
+        interlocks_by_card[interlock.card_id].append(interlock)
+    statuses: Dict[int, str] = {}
+    if not interlocks_by_card:
+        return statuses
+    max_workers = min(getattr(settings, "INTERLOCKS_PING_MAX_WORKERS", 10), len(interlocks_by_card))
+    deadline = getattr(settings, "INTERLOCKS_PING_DEADLINE", 60)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="interlock_ping")
+    futures = {}
+    for card_interlocks in interlocks_by_card.values():
+        # Get the card and its implementation here, so the threads don't have to query the database
+        card = card_interlocks[0].card
+        futures[executor.submit(get(card.category).ping_card, card, card_interlocks)] = card_interlocks
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            try:
+                statuses.update(future.result())
+            except Exception as error:
+                interlocks_logger.exception(error)
+                for interlock in futures[future]:
+                    statuses[interlock.id] = INTERLOCK_STATUS_ERROR + f": {str(error)}"
+    except FuturesTimeoutError:
+        interlocks_logger.warning(f"Interlocks ping did not complete within {deadline} seconds")
+    finally:
+        # Don't wait for the cards still being pinged, their sockets will time out on their own
+        executor.shutdown(wait=False, cancel_futures=True)
+    for card_interlocks in futures.values():
+        for interlock in card_interlocks:
+            statuses.setdefault(interlock.id, INTERLOCK_STATUS_TIMED_OUT)
+    return statuses
+
+
 def get_interlock_report(interlock_list: QuerySetType[Interlock_model]) -> BasicDisplayTable:
     interlock_report = BasicDisplayTable()
     interlock_report.headers = [
@@ -668,10 +900,12 @@ def get_interlock_report(interlock_list: QuerySetType[Interlock_model]) -> Basic
         ("door", "Door"),
         ("id", "ID"),
     ]
+    interlock_list = interlock_list.select_related("card__category", "tool", "door")
+    statuses = ping_interlocks(interlock_list)
     for interlock in interlock_list:
         interlock_report.add_row(
             {
-                "status": interlock.ping(),
+                "status": statuses[interlock.id],
                 "name": interlock.name,
                 "card": str(interlock.card),
                 "channel": interlock.channel,
@@ -700,6 +934,9 @@ def get(category: InterlockCardCategory, raise_exception=True) -> Interlock:
         return interlock_impl
 
 
+proxr_connection_pool = SocketConnectionPool()
+modbus_connection_pool = ModbusConnectionPool()
+
 interlocks: Dict[str, Interlock] = {
     "stanford": StanfordInterlock(),
     "web_relay_http": WebRelayHttpInterlock(),
@@ -0,0 +1,54 @@
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Iterable, List, Optional, Tuple
+
+# Intervals are (start, end) tuples of comparable values (usually datetimes).
+# Intervals are half-open: back-to-back intervals (one ending when the next one starts) do not overlap.
+
+
+def merge_intervals(intervals: Iterable[Tuple]) -> List[Tuple]:
+    """Returns the sorted union of the given intervals, merging the ones overlapping each other"""
+    merged: List[Tuple] = []
+    for start, end in sorted(intervals):
+        if merged and start < merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def occupancy_profile(intervals: Iterable[Tuple], window_start=None, window_end=None) -> List[Tuple[Any, int]]:
+    """
+    Returns the number of concurrent intervals as a list of (time, count) changes, sorted by time.
+    Each count applies from its time until the next one, the last one applies indefinitely (or until window_end).
+    When window_start is given, the profile starts with the count at that time.
+    """
+    events = []
+    for start, end in intervals:
+        if start < end:
+            events.append((start, 1))
+            events.append((end, -1))
+    events.sort(key=itemgetter(0))
+    profile: List[Tuple[Any, int]] = []
+    count = 0
+    for time, time_events in groupby(events, key=itemgetter(0)):
+        if window_end is not None and time >= window_end:
+            break
+        count += sum(delta for _, delta in time_events)
+        if window_start is not None and time <= window_start:
+            profile = [(window_start, count)]
+        elif not profile or profile[-1][1] != count:
+            profile.append((time, count))
+    if window_start is not None and (not profile or profile[0][0] != window_start):
+        profile.insert(0, (window_start, 0))
+    return profile
+
+
+def maximum_concurrency(intervals: Iterable[Tuple]) -> Tuple[int, Optional[Any]]:
+    """Returns the maximum number of concurrent intervals and the earliest time that maximum is reached"""
+    max_count, max_time = 0, None
+    for time, count in occupancy_profile(intervals):
+        if count > max_count:
+            max_count, max_time = count, time
+    return max_count, max_time
@@ -0,0 +1,248 @@
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from logging import getLogger
+from threading import Lock, local
+from typing import Dict, Optional
+from uuid import uuid4
+from weakref import WeakValueDictionary
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+
+from NEMO.utilities import get_class_from_settings
+
+locks_logger = getLogger(__name__)
+
+LOCK_BACKEND_SETTING = "SYNCHRONIZED_LOCK_BACKEND"
+
+
+class LockMetrics:
+    """Contention metrics for a group of locks (for example all the locks of a synchronized function)"""
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contentions = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "acquisitions": self.acquisitions,
+            "contentions": self.contentions,
+            "timeouts": self.timeouts,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+        }
+
+
+class LockBackend(ABC):
+    """
+    Named locks used by the synchronized decorator.
+    Backends only have to implement acquire and release, waiting, timeouts and metrics are handled here.
+    """
+
+    # Time between two attempts for backends that have to poll
+    poll_interval = 0.05
+
+    def __init__(self):
+        self._metrics: Dict[str, LockMetrics] = {}
+        self._metrics_lock = Lock()
+
+    @abstractmethod
+    def acquire(self, name: str, timeout: Optional[float]) -> bool:
+        """Acquires the lock, waiting up to timeout seconds (forever if None). Returns whether it was acquired"""
+        pass
+
+    @abstractmethod
+    def release(self, name: str):
+        pass
+
+    @contextmanager
+    def lock(self, name: str, group: str = None, timeout: Optional[float] = None):
+        from NEMO.exceptions import LockTimeoutError
+
+        metrics = self._get_metrics(group or name)
+        start = time.monotonic()
+        acquired = self.acquire(name, 0)
+        if not acquired:
+            metrics.contentions += 1
+            acquired = self.acquire(name, timeout)
+        wait = time.monotonic() - start
+        metrics.total_wait += wait
+        metrics.max_wait = max(metrics.max_wait, wait)
+        if not acquired:
+            metrics.timeouts += 1
+            locks_logger.warning(f"Could not acquire lock {name} within {timeout} seconds")
+            raise LockTimeoutError(name, timeout)
+        metrics.acquisitions += 1
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Returns the contention metrics of this process, by lock group"""
+        return {group: metrics.as_dict() for group, metrics in self._metrics.items()}
+
+    def _get_metrics(self, group: str) -> LockMetrics:
+        with self._metrics_lock:
+            if group not in self._metrics:
+                self._metrics[group] = LockMetrics()
+            return self._metrics[group]
+
+    def _poll(self, try_acquire, timeout: Optional[float]) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if try_acquire():
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+
+class _NamedLock:
+    __slots__ = ["lock", "__weakref__"]
+
+    def __init__(self):
+        self.lock = Lock()
+
+
+class InProcessLockBackend(LockBackend):
+    """
+    Thread locks, only preventing concurrent execution within the same process.
+    Locks are kept in a weak registry, so they are discarded once no thread is holding or waiting for them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._locks: WeakValueDictionary[str, _NamedLock] = WeakValueDictionary()
+        self._registry_lock = Lock()
+        # Keep a reference to the locks held by each thread, so they are not discarded while in use
+        self._held = local()
+
+    def acquire(self, name: str, timeout: Optional[float]) -> bool:
+        with self._registry_lock:
+            named_lock = self._locks.get(name)
+            if named_lock is None:
+                named_lock = self._locks[name] = _NamedLock()
+        acquired = named_lock.lock.acquire(timeout=-1 if timeout is None else timeout)
+        if acquired:
+            self._held_locks()[name] = named_lock
+        return acquired
+
+    def release(self, name: str):
+        self._held_locks().pop(name).lock.release()
+
+    def _held_locks(self) -> Dict[str, _NamedLock]:
+        if not hasattr(self._held, "locks"):
+            self._held.locks = {}
+        return self._held.locks
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class CacheLockBackend(LockBackend):
+    """
+    Locks stored in the Django cache (SYNCHRONIZED_LOCK_CACHE_ALIAS), preventing concurrent execution across processes
+    when the cache is shared between them (memcached, redis, database etc.). A lock expires after
+    SYNCHRONIZED_LOCK_EXPIRY seconds, so it is not held forever by a process that died while holding it.
+    """
+
+    key_prefix = "NEMO_lock_"
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[getattr(settings, "SYNCHRONIZED_LOCK_CACHE_ALIAS", "default")]
+        self.expiry = getattr(settings, "SYNCHRONIZED_LOCK_EXPIRY", 300)
+        self._tokens = local()
+
+    def acquire(self, name: str, timeout: Optional[float]) -> bool:
+        token = uuid4().hex
+        acquired = self._poll(lambda: self.cache.add(self.key_prefix + name, token, self.expiry), timeout)
+        if acquired:
+            self._held_tokens()[name] = token
+        return acquired
+
+    def release(self, name: str):
+        token = self._held_tokens().pop(name)
+        # Only delete the lock if we still own it (it could have expired and been acquired by someone else)
+        if self.cache.get(self.key_prefix + name) == token:
+            self.cache.delete(self.key_prefix + name)
+
+    def _held_tokens(self) -> Dict[str, str]:
+        if not hasattr(self._tokens, "tokens"):
+            self._tokens.tokens = {}
+        return self._tokens.tokens
+
+
+class DatabaseLockBackend(LockBackend):
+    """
+    Database advisory locks, preventing concurrent execution across processes using the same database.
+    Supported for PostgreSQL (pg_try_advisory_lock) and MySQL/MariaDB (GET_LOCK).
+    Locks are tied to the database connection, so they are released if the process dies.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.database_alias = getattr(settings, "SYNCHRONIZED_LOCK_DATABASE_ALIAS", "default")
+
+    @property
+    def connection(self):
+        connection = connections[self.database_alias]
+        if connection.vendor not in ["postgresql", "mysql"]:
+            raise ImproperlyConfigured(f"{type(self).__name__} is not supported for {connection.vendor} databases")
+        return connection
+
+    @staticmethod
+    def _lock_key(name: str) -> int:
+        # PostgreSQL advisory locks use a signed 64-bit key
+        return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big", signed=True)
+
+    @staticmethod
+    def _lock_name(name: str) -> str:
+        # MySQL lock names are limited to 64 characters
+        return name if len(name) <= 64 else hashlib.sha256(name.encode()).hexdigest()
+
+    def acquire(self, name: str, timeout: Optional[float]) -> bool:
+        connection = self.connection
+        if connection.vendor == "postgresql":
+            return self._poll(lambda: self._fetch("SELECT pg_try_advisory_lock(%s)", self._lock_key(name)), timeout)
+        # GET_LOCK waits on the server, a negative timeout means forever
+        return self._fetch("SELECT GET_LOCK(%s, %s)", self._lock_name(name), -1 if timeout is None else timeout) == 1
+
+    def release(self, name: str):
+        connection = self.connection
+        try:
+            if connection.vendor == "postgresql":
+                self._fetch("SELECT pg_advisory_unlock(%s)", self._lock_key(name))
+            else:
+                self._fetch("SELECT RELEASE_LOCK(%s)", self._lock_name(name))
+        except DatabaseError:
+            # This happens when the transaction is broken (for example after a failed query in an atomic block).
+            # Don't hide the original exception, and close the connection so the database server drops the lock
+            locks_logger.exception(f"Could not release database lock {name}, closing the connection")
+            connection.close()
+
+    def _fetch(self, sql: str, *params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+
+_lock_backend: Optional[LockBackend] = None
+_lock_backend_lock = Lock()
+
+
+def get_lock_backend() -> LockBackend:
+    global _lock_backend
+    if _lock_backend is None:
+        with _lock_backend_lock:
+            if _lock_backend is None:
+                _lock_backend = get_class_from_settings(LOCK_BACKEND_SETTING, "NEMO.locks.InProcessLockBackend")
+    return _lock_backend
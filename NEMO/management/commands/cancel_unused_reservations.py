@@ -5,7 +5,8 @@ from NEMO.views.timed_services import do_cancel_unused_reservations
 
 class Command(BaseCommand):
     help = (
-        "Run every minute to cancel unused reservations and mark them as missed. "
+        "Run every minute (or less often, each run catches up since the previous one) to cancel unused reservations "
+        "and mark them as missed. "
         "Only applicable to areas or tools having a missed reservation threshold value."
     )
 
@@ -0,0 +1,90 @@
+import re
+import time
+from datetime import timedelta
+from typing import Dict
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from NEMO.models import Area, AreaAccessRecord, Reservation, ScheduledOutage, Tool, UsageEvent, User
+
+# Plan lines showing a table being read in full, by database vendor
+FULL_SCAN_PATTERNS = {
+    "sqlite": re.compile(r"\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)"),
+    "postgresql": re.compile(r"\bSeq Scan\b"),
+    "mysql": re.compile(r"\btype\W+ALL\b|\bTable scan\b"),
+}
+
+
+def time_window_queries(tool_id: int, area_id: int, user_id: int, days: int) -> Dict[str, QuerySet]:
+    """The most frequent time window queries, from the calendar, policies, dashboard, timed services and billing"""
+    now = timezone.now()
+    start, end = now - timedelta(days=days), now + timedelta(days=days)
+    active_reservations = Reservation.objects.filter(cancelled=False, missed=False, shortened=False)
+    return {
+        "Tool reservations": active_reservations.filter(tool_id=tool_id, start__lt=end, end__gt=start),
+        "Area reservations": active_reservations.filter(area_id=area_id, start__lt=end, end__gt=start),
+        "All reservations": active_reservations.filter(start__lt=end, end__gt=start),
+        "User reservations": active_reservations.filter(user_id=user_id, start__gte=start, start__lt=end),
+        "Reservations starting soon": active_reservations.filter(start__gt=now, start__lte=now + timedelta(hours=1)),
+        "Tool usage": UsageEvent.objects.filter(tool_id=tool_id, start__lt=end, end__gt=start),
+        "User usage": UsageEvent.objects.filter(user_id=user_id, start__gte=start, start__lt=end),
+        "Tools in use": UsageEvent.objects.filter(end__isnull=True),
+        "Tool in use": UsageEvent.objects.filter(tool_id=tool_id, end__isnull=True),
+        "Usage billing": UsageEvent.objects.filter(end__gte=start, end__lt=now),
+        "Area access": AreaAccessRecord.objects.filter(area_id=area_id, start__lt=end, end__gt=start),
+        "User area access": AreaAccessRecord.objects.filter(customer_id=user_id, start__gte=start, start__lt=end),
+        "Area occupancy": AreaAccessRecord.objects.filter(area_id=area_id, end__isnull=True),
+        "Area access billing": AreaAccessRecord.objects.filter(end__gte=start, end__lt=now),
+        "Tool outages": ScheduledOutage.objects.filter(tool_id=tool_id, start__lt=end, end__gt=start),
+        "Area outages": ScheduledOutage.objects.filter(area_id=area_id, start__lt=end, end__gt=start),
+    }
+
+
+def first_id(model) -> int:
+    return model.objects.order_by("id").values_list("id", flat=True).first() or 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the database plan (EXPLAIN) of the most frequent time window queries on reservations, "
+        "usage events, area access records and outages, and reports the ones reading whole tables. "
+        "Use --timing to also measure how long each query takes on this database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tool", type=int, help="id of the tool to use in queries (default: first tool)")
+        parser.add_argument("--area", type=int, help="id of the area to use in queries (default: first area)")
+        parser.add_argument("--user", type=int, help="id of the user to use in queries (default: first user)")
+        parser.add_argument("--days", type=int, default=7, help="days before and after now to query (default 7)")
+        parser.add_argument("--timing", action="store_true", help="run each query and report its duration")
+        parser.add_argument("--quiet", action="store_true", help="only report the queries reading whole tables")
+
+    def handle(self, *args, **options):
+        queries = time_window_queries(
+            options["tool"] or first_id(Tool),
+            options["area"] or first_id(Area),
+            options["user"] or first_id(User),
+            options["days"],
+        )
+        full_scan_pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        full_scans = 0
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            full_scan = bool(full_scan_pattern and full_scan_pattern.search(plan))
+            full_scans += full_scan
+            if options["quiet"] and not full_scan:
+                continue
+            title = f"{name}: reads whole table" if full_scan else name
+            self.stdout.write(self.style.WARNING(title) if full_scan else self.style.SUCCESS(title))
+            if options["timing"]:
+                started = time.perf_counter()
+                count = len(queryset.values_list("id", flat=True))
+                self.stdout.write(f"{count} row(s) in {(time.perf_counter() - started) * 1000:.1f}ms")
+            self.stdout.write(plan + "\n\n")
+        if not full_scan_pattern:
+            self.stdout.write(f"Full table scans are not detected on {connection.vendor}, check the plans above")
+        else:
+            self.stdout.write(f"{full_scans} of {len(queries)} queries read whole tables")
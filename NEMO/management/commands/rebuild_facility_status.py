@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from NEMO.facility_status import FacilityStatusSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the tools and areas status snapshot used by the status dashboard and the sidebar. "
+        "The snapshot is updated when things change, this is only needed to recover after changes made outside NEMO "
+        "(directly in the database for example). The snapshot is only kept when the Django cache is shared between "
+        "processes."
+    )
+
+    def handle(self, *args, **options):
+        snapshot = FacilityStatusSnapshot.rebuild()
+        self.stdout.write(
+            f"Rebuilt the status of {len(snapshot['tools'])} tool(s) and {len(snapshot['occupants'])} area occupant(s)"
+        )
@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand
+
+from NEMO.timed_services_scheduler import TimedServicesScheduler, get_timed_services_metrics
+from NEMO.utilities import format_datetime
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs all the timed services (missed reservations, wait lists, reminders etc.) at their intervals in this process, "
+        "instead of triggering each of them with cron. The intervals can be changed with TIMED_SERVICES_SCHEDULE. "
+        "When running several schedulers, SYNCHRONIZED_LOCK_BACKEND has to be shared between processes (database or "
+        "shared cache locks) so only one of them runs the services at a time, the others taking over if it stops."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="run the services that are due once and exit")
+        parser.add_argument(
+            "--tick", type=float, default=10, help="seconds to wait between checks for services due (default 10)"
+        )
+        parser.add_argument("--metrics", action="store_true", help="show the last run and durations of each service")
+
+    def handle(self, *args, **options):
+        if options["metrics"]:
+            all_metrics = get_timed_services_metrics()
+            if not all_metrics:
+                self.stdout.write("No timed services have been run by the scheduler yet")
+            for name, metrics in sorted(all_metrics.items()):
+                self.stdout.write(
+                    f"{name}: last run {format_datetime(metrics['last_start'])} in {metrics['last_duration']:.3f}s, "
+                    f"{metrics['runs']} run(s), {metrics['failures']} failure(s), "
+                    f"average {metrics['total_duration'] / metrics['runs']:.3f}s, max {metrics['max_duration']:.3f}s"
+                    + (f", last error: {metrics['last_error']}" if metrics["last_error"] else "")
+                )
+            return
+        scheduler = TimedServicesScheduler()
+        if not scheduler.excludes_other_processes():
+            self.stderr.write(
+                "Warning: SYNCHRONIZED_LOCK_BACKEND is the in-process lock backend, "
+                "other scheduler processes would run the same services at the same time"
+            )
+        if options["once"]:
+            ran = scheduler.run_pending()
+            self.stdout.write(f"Ran {len(ran)} timed service(s){': ' + ', '.join(ran) if ran else ''}")
+        else:
+            scheduler.run_forever(options["tick"])
@@ -5,7 +5,8 @@ from NEMO.views.timed_services import send_email_reservation_ending_reminders
 
 class Command(BaseCommand):
     help = (
-        "Run every 15 minutes to trigger email reminder for reservations ending soon. "
+        "Run every 15 minutes to trigger email reminder for reservations ending soon "
+        "(each run catches up since the previous one). "
         "Reservation ending reminder email has to be set in customizations for this to work."
     )
 
@@ -5,7 +5,7 @@ from NEMO.views.timed_services import send_email_reservation_reminders
 
 class Command(BaseCommand):
     help = (
-        "Run every 15 minutes to trigger email reminder for reservations. "
+        "Run every 15 minutes to trigger email reminder for reservations (each run catches up since the previous one). "
         "Reservation reminder and reservation warning emails have to be set in customizations for this to work."
     )
 
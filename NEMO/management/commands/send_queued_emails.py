@@ -0,0 +1,30 @@
+import time
+
+from django.core.management import BaseCommand
+
+from NEMO.email_outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the emails queued in the outbox (when EMAIL_OUTBOX_ENABLED is set). "
+        "Run it every minute, or continuously with the --loop option."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="number of emails sent concurrently")
+        parser.add_argument("--rate", type=float, help="maximum number of emails sent per second")
+        parser.add_argument("--limit", type=int, help="maximum number of emails sent per run")
+        parser.add_argument("--loop", action="store_true", help="keep running, checking for new emails")
+        parser.add_argument(
+            "--interval", type=float, default=10, help="seconds to wait between checks when looping (default 10)"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_emails(options["workers"], options["rate"], options["limit"])
+            if sent:
+                self.stdout.write(f"Sent {sent} queued email(s)")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
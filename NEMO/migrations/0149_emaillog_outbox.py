@@ -0,0 +1,48 @@
+# Generated by Django 5.2.14 on 2026-10-16 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("NEMO", "0148_unplannedoutage_resource_alter_unplannedoutage_tool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emaillog",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0, help_text="The number of attempts made to send this email"),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="last_error",
+            field=models.TextField(blank=True, help_text="The error received on the last failed attempt", null=True),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="message",
+            field=models.TextField(
+                blank=True, help_text="The serialized email message, kept until the queued email is sent", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="next_attempt",
+            field=models.DateTimeField(
+                blank=True, help_text="The earliest time the email worker will try to send this email", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="queued",
+            field=models.BooleanField(
+                default=False, help_text="Whether this email is waiting in the outbox to be sent by the email worker"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emaillog",
+            index=models.Index(fields=["queued", "next_attempt"], name="NEMO_emaill_queued_f88d92_idx"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.14 on 2026-10-16 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("NEMO", "0149_emaillog_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="areaaccessrecord",
+            name="last_updated",
+            field=models.DateTimeField(auto_now=True, help_text="The last time this record was modified.", null=True),
+        ),
+        migrations.AddField(
+            model_name="reservation",
+            name="last_updated",
+            field=models.DateTimeField(
+                auto_now=True, help_text="The last time this reservation was modified.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="scheduledoutage",
+            name="last_updated",
+            field=models.DateTimeField(auto_now=True, help_text="The last time this outage was modified.", null=True),
+        ),
+        migrations.AddField(
+            model_name="usageevent",
+            name="last_updated",
+            field=models.DateTimeField(
+                auto_now=True, help_text="The last time this usage event was modified.", null=True
+            ),
+        ),
+    ]
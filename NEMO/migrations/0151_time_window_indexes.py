@@ -0,0 +1,77 @@
+# Generated by Django 5.2.14 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("NEMO", "0150_last_updated_calendar_events"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="areaaccessrecord",
+            index=models.Index(fields=["area", "start", "end"], name="area_access_area_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="areaaccessrecord",
+            index=models.Index(fields=["customer", "start"], name="area_access_customer_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="areaaccessrecord",
+            index=models.Index(
+                condition=models.Q(("end__isnull", True)), fields=["area", "customer"], name="area_access_occupancy_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(fields=["tool", "start", "end"], name="reservation_tool_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(fields=["area", "start", "end"], name="reservation_area_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(fields=["user", "start"], name="reservation_user_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                condition=models.Q(("cancelled", False), ("missed", False), ("shortened", False)),
+                fields=["start", "end"],
+                name="reservation_active_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledoutage",
+            index=models.Index(fields=["tool", "start", "end"], name="outage_tool_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledoutage",
+            index=models.Index(fields=["area", "start", "end"], name="outage_area_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledoutage",
+            index=models.Index(fields=["resource", "start", "end"], name="outage_resource_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usageevent",
+            index=models.Index(fields=["tool", "start", "end"], name="usage_event_tool_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usageevent",
+            index=models.Index(fields=["user", "start"], name="usage_event_user_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usageevent",
+            index=models.Index(fields=["end"], name="usage_event_end_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="usageevent",
+            index=models.Index(
+                condition=models.Q(("end__isnull", True)), fields=["tool"], name="usage_event_in_use_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.14 on 2026-10-17 01:29
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def initialize_has_ended_counters(apps, schema_editor):
+    SequenceCounter = apps.get_model("NEMO", "SequenceCounter")
+    for model_name, counter_name in [
+        ("UsageEvent", "usage_event_has_ended"),
+        ("AreaAccessRecord", "area_access_record_has_ended"),
+    ]:
+        model = apps.get_model("NEMO", model_name)
+        last_has_ended = model.objects.aggregate(Max("has_ended"))["has_ended__max"] or 0
+        SequenceCounter.objects.update_or_create(name=counter_name, defaults={"value": last_has_ended})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("NEMO", "0151_time_window_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SequenceCounter",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("value", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(initialize_has_ended_counters, migrations.RunPython.noop),
+    ]
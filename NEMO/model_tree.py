@@ -1,7 +1,17 @@
-from typing import List, Dict
-
+import time
+from collections import defaultdict
+from copy import copy
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import QuerySet
 
+from NEMO.utilities import is_cache_shared, quiet_int
+
 
 class TreeItem:
     """Helper class for tree items"""
@@ -33,34 +43,47 @@ class ModelTreeHelper:
     """
     Helper class for trees with models. Create a tree in memory with links to ancestors and descendants
     to help limit database queries.
+    All the items are retrieved in a single query (unless they are provided) and the tree is built in linear time.
     """
 
-    def __init__(self, model_class, parent_field: str = "parent", children_field: str = "children", only_fields=None):
+    def __init__(
+        self,
+        model_class,
+        parent_field: str = "parent",
+        children_field: str = "children",
+        only_fields=None,
+        model_items: Iterable = None,
+    ):
         self.only_fields = ["name", "category"]
         if only_fields is not None:
             self.only_fields.extend(only_fields)
             self.only_fields = list(set(self.only_fields))
-        query_set = type(model_class).objects.all().prefetch_related(children_field).only(*self.only_fields)
-        self.roots: List = list(query_set.filter(**{f"{parent_field}__isnull": True}))
+        query_set = type(model_class).objects.all()
+        if model_items is None:
+            model_items = query_set.only(*self.only_fields, parent_field)
         self.leaves_queryset: QuerySet = query_set.filter(**{f"{children_field}__isnull": True})
-        self.leaf_ids: List[int] = list(
-            query_set.filter(**{f"{children_field}__isnull": True}).values_list("id", flat=True)
-        )
+        # Group items by parent, keeping the original order
+        self.child_items_by_parent_id: Dict[Optional[int], List] = defaultdict(list)
+        for model_item in model_items:
+            self.child_items_by_parent_id[getattr(model_item, f"{parent_field}_id")].append(model_item)
+        self.roots: List = self.child_items_by_parent_id.get(None, [])
+        self.leaf_ids: List[int] = [
+            model_item.id
+            for child_items in self.child_items_by_parent_id.values()
+            for model_item in child_items
+            if model_item.id not in self.child_items_by_parent_id
+        ]
 
         self.items: Dict[int, TreeItem] = {}
         self.build_tree(model_class, parent_field, children_field, [], None)
-        # Second pass to populate descendants
-        for key, item in self.items.items():
+        # Second pass to populate children and descendants (adding each item to its ancestors' descendants)
+        for item in self.items.values():
             if not item.is_leaf:
-                res = []
-                for child in item.child_items:
-                    res.append(self.items[child.id])
-                item.children = res.copy()
-                result = []
-                for key1, item1 in self.items.items():
-                    if item in item1.ancestors:
-                        result.append(self.items[item1.id])
-                item.descendants = result.copy()
+                item.children = [self.items[child.id] for child in item.child_items]
+                item.descendants = []
+        for item in self.items.values():
+            for ancestor in item.ancestors:
+                ancestor.descendants.append(item)
 
     def build_tree(self, model_class, parent_field, children_field, ancestors: List[TreeItem], items=None):
         is_root = items is None
@@ -83,15 +106,10 @@ class ModelTreeHelper:
             # Add only fields
             for field in self.only_fields:
                 setattr(tree_item, field, getattr(item, field))
-            if item.id in self.leaf_ids:
+            children = self.child_items_by_parent_id.get(item.id)
+            if not children:
                 tree_item.is_leaf = True
             else:
-                children = list(
-                    type(model_class)
-                    .objects.filter(**{f"{parent_field}__id": item.id})
-                    .prefetch_related(children_field)
-                    .only(*self.only_fields)
-                )
                 tree_item.child_items = children
                 tree_item.is_leaf = False
                 new_ancestors = ancestors.copy()
@@ -111,15 +129,63 @@ class ModelTreeHelper:
         return self.items.get(pk, None)
 
 
-def get_area_model_tree():
+AREA_TREE_ONLY_FIELDS = [
+    "name",
+    "category",
+    "maximum_capacity",
+    "reservation_warning",
+    "count_staff_in_occupancy",
+    "count_service_personnel_in_occupancy",
+]
+
+
+class AreaTreeCache:
+    """
+    Process level cache of the areas needed to build the area tree.
+    It is cleared when an area is saved or deleted. A version stored in the Django cache is used to let the other
+    processes know they need to reload, with an expiry time as a fallback if the version is evicted.
+    Areas are only kept when the Django cache is shared between processes, since the others wouldn't see the version.
+    """
+
+    VERSION_CACHE_KEY = "NEMO_area_tree_version"
+    CACHE_TTL = quiet_int(getattr(settings, "AREA_TREE_CACHE_SECONDS", 60), 60)
+    _areas: Optional[List] = None
+    _version = None
+    _expiry = 0
+    _lock = Lock()
+
+    @classmethod
+    def get_areas(cls) -> List:
+        from NEMO.models import Area
+
+        if not is_cache_shared():
+            return list(Area.objects.only(*AREA_TREE_ONLY_FIELDS, "parent_area"))
+        areas = cls._areas
+        if areas is None or time.time() > cls._expiry or cache.get(cls.VERSION_CACHE_KEY) != cls._version:
+            with cls._lock:
+                if cls._areas is None or cls._areas is areas:
+                    version = cache.get(cls.VERSION_CACHE_KEY)
+                    cls._areas = list(Area.objects.only(*AREA_TREE_ONLY_FIELDS, "parent_area"))
+                    cls._version = version
+                    cls._expiry = time.time() + cls.CACHE_TTL
+                areas = cls._areas
+        return areas
+
+    @classmethod
+    def invalidate(cls):
+        cache.set(cls.VERSION_CACHE_KEY, uuid4().hex, None)
+        with cls._lock:
+            cls._areas = None
+
+    @staticmethod
+    def invalidate_on_change(sender, **kwargs):
+        AreaTreeCache.invalidate()
+        transaction.on_commit(AreaTreeCache.invalidate)
+
+
+def get_area_model_tree() -> ModelTreeHelper:
     from NEMO.models import Area
 
-    only_fields = [
-        "name",
-        "category",
-        "maximum_capacity",
-        "reservation_warning",
-        "count_staff_in_occupancy",
-        "count_service_personnel_in_occupancy",
-    ]
-    return ModelTreeHelper(Area(), "parent_area", "area_children_set", only_fields)
+    # Copy the cached areas so callers can't modify the shared instances
+    areas = [copy(area) for area in AreaTreeCache.get_areas()]
+    return ModelTreeHelper(Area(), "parent_area", "area_children_set", AREA_TREE_ONLY_FIELDS, model_items=areas)
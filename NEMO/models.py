@@ -10,7 +10,7 @@ from html import escape
 from json import loads
 from logging import getLogger
 from re import match
-from typing import Dict, List, Optional, Set, TYPE_CHECKING, Union
+from typing import Callable, Dict, List, Optional, Set, TYPE_CHECKING, Union
 
 from django.conf import settings
 from django.contrib.auth.models import BaseUserManager, Group, Permission, PermissionsMixin
@@ -18,7 +18,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelatio
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.core.validators import MinValueValidator, validate_comma_separated_integer_list
-from django.db import connections, models, transaction
+from django.db import IntegrityError, connections, models, transaction
 from django.db.models import BooleanField, Case, Exists, IntegerChoices, OuterRef, Q, Value, When
 from django.db.models.manager import Manager
 from django.db.models.signals import pre_delete
@@ -42,6 +42,7 @@ from NEMO.constants import (
     MEDIA_PROTECTED,
 )
 from NEMO.mixins import BillableItemMixin, CalendarDisplayMixin, ConfigurationMixin, RecurrenceMixin
+from NEMO.model_tree import AreaTreeCache
 from NEMO.typing import QuerySetType
 from NEMO.utilities import (
     EmailCategory,
@@ -219,15 +220,19 @@ class BaseDocumentModel(BaseModel):
 
 
 # These two auto-delete documents from filesystem when they are unneeded:
-@receiver(models.signals.post_delete)
 def auto_delete_file_on_document_delete(sender, instance: BaseDocumentModel, **kwargs):
-    if not issubclass(sender, BaseDocumentModel):
-        return
-    """	Deletes file from filesystem when corresponding object is deleted.	"""
+    """Deletes file from filesystem when corresponding object is deleted."""
     if instance.document:
         instance.document.delete(False)
 
 
+# Only connected for document models, since a post_delete receiver for all models prevents fast (single query) deletes
+@receiver(models.signals.class_prepared)
+def connect_document_delete_signal(sender, **kwargs):
+    if issubclass(sender, BaseDocumentModel):
+        models.signals.post_delete.connect(auto_delete_file_on_document_delete, sender=sender)
+
+
 @receiver(models.signals.pre_save)
 def auto_update_file_on_document_change(sender, instance: BaseDocumentModel, **kwargs):
     """Updates old file from filesystem when corresponding object is updated with new file."""
@@ -2979,6 +2984,33 @@ class Area(MPTTModel):
         return self.name
 
 
+class SequenceCounter(BaseModel):
+    """
+    Named counters giving unique increasing numbers (used for the has_ended values of usage events and area access).
+    The counter row is only locked while it is incremented, so this is safe when done concurrently, and it doesn't
+    need to compute the max value of a whole table.
+    """
+
+    name = models.CharField(max_length=CHAR_FIELD_SMALL_LENGTH, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def next_value(cls, name: str, initial_value: Callable[[], int] = None) -> int:
+        """Increments the counter and returns its new value. A new counter starts after initial_value() (or 0)"""
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(value=models.F("value") + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, value=(initial_value() if initial_value else 0) + 1)
+                except IntegrityError:
+                    # The counter was created concurrently
+                    cls.objects.filter(name=name).update(value=models.F("value") + 1)
+            return cls.objects.filter(name=name).values_list("value", flat=True).get()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class AreaAccessRecord(BaseModel, CalendarDisplayMixin, BillableItemMixin):
     area = TreeForeignKey(Area, on_delete=models.CASCADE)
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -2986,6 +3018,9 @@ class AreaAccessRecord(BaseModel, CalendarDisplayMixin, BillableItemMixin):
     start = models.DateTimeField(default=timezone.now)
     end = models.DateTimeField(null=True, blank=True)
     has_ended = models.PositiveBigIntegerField(default=0)
+    last_updated = models.DateTimeField(
+        auto_now=True, null=True, blank=True, help_text="The last time this record was modified."
+    )
     staff_charge = models.ForeignKey(StaffCharge, blank=True, null=True, on_delete=models.CASCADE)
     validated = models.BooleanField(default=False)
     validated_by = models.ForeignKey(
@@ -3007,6 +3042,10 @@ class AreaAccessRecord(BaseModel, CalendarDisplayMixin, BillableItemMixin):
     class Meta:
         indexes = [
             models.Index(fields=["end"]),
+            models.Index(fields=["area", "start", "end"], name="area_access_area_time_idx"),
+            models.Index(fields=["customer", "start"], name="area_access_customer_start_idx"),
+            # Users currently logged in to an area (skipped on MySQL)
+            models.Index(fields=["area", "customer"], condition=Q(end__isnull=True), name="area_access_occupancy_idx"),
         ]
         # This constraint is to get around db limitations with null values for end date being sometimes unique, sometimes not
         constraints = [
@@ -3017,13 +3056,15 @@ class AreaAccessRecord(BaseModel, CalendarDisplayMixin, BillableItemMixin):
         return str(self.id)
 
     def save(self, *args, **kwargs):
-        # Set has_ended to 0 if the end is NULL (always), otherwise set it to a unique number (max +1)
+        # Set has_ended to 0 if the end is NULL (always), otherwise set it to a unique number (next in the sequence)
         if self.end is None:
             self.has_ended = 0
         elif not self.has_ended:
             # Covers cases where has_ended was not set (None) or previously set to 0 but now has an end.
-            last_custom = AreaAccessRecord.objects.aggregate(models.Max("has_ended"))["has_ended__max"] or 0
-            self.has_ended = last_custom + 1
+            self.has_ended = SequenceCounter.next_value(
+                "area_access_record_has_ended",
+                lambda: AreaAccessRecord.objects.aggregate(models.Max("has_ended"))["has_ended__max"] or 0,
+            )
         super().save(*args, **kwargs)
 
 
@@ -3160,6 +3201,9 @@ class Reservation(BaseModel, CalendarDisplayMixin, BillableItemMixin):
     user = models.ForeignKey(User, related_name="reservation_user", on_delete=models.CASCADE)
     creator = models.ForeignKey(User, related_name="reservation_creator", on_delete=models.CASCADE)
     creation_time = models.DateTimeField(default=timezone.now)
+    last_updated = models.DateTimeField(
+        auto_now=True, null=True, blank=True, help_text="The last time this reservation was modified."
+    )
     tool = models.ForeignKey(Tool, null=True, blank=True, on_delete=models.CASCADE)
     area = TreeForeignKey(Area, null=True, blank=True, on_delete=models.CASCADE)
     project = models.ForeignKey(
@@ -3335,6 +3379,17 @@ class Reservation(BaseModel, CalendarDisplayMixin, BillableItemMixin):
 
     class Meta:
         ordering = ["-start"]
+        indexes = [
+            models.Index(fields=["tool", "start", "end"], name="reservation_tool_time_idx"),
+            models.Index(fields=["area", "start", "end"], name="reservation_area_time_idx"),
+            models.Index(fields=["user", "start"], name="reservation_user_start_idx"),
+            # Active reservations, the ones shown on the calendar and checked by policies (skipped on MySQL)
+            models.Index(
+                fields=["start", "end"],
+                condition=Q(cancelled=False, missed=False, shortened=False),
+                name="reservation_active_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -3389,6 +3444,9 @@ class UsageEvent(BaseModel, CalendarDisplayMixin, BillableItemMixin):
     start = models.DateTimeField(default=timezone.now)
     end = models.DateTimeField(null=True, blank=True)
     has_ended = models.PositiveBigIntegerField(default=0)
+    last_updated = models.DateTimeField(
+        auto_now=True, null=True, blank=True, help_text="The last time this usage event was modified."
+    )
     note = models.TextField(null=True, blank=True)
     staff_charge = models.ForeignKey(StaffCharge, blank=True, null=True, on_delete=models.CASCADE)
     validated = models.BooleanField(default=False)
@@ -3429,6 +3487,13 @@ class UsageEvent(BaseModel, CalendarDisplayMixin, BillableItemMixin):
 
     class Meta:
         ordering = ["-start"]
+        indexes = [
+            models.Index(fields=["tool", "start", "end"], name="usage_event_tool_time_idx"),
+            models.Index(fields=["user", "start"], name="usage_event_user_start_idx"),
+            models.Index(fields=["end"], name="usage_event_end_idx"),
+            # Tools currently in use (skipped on MySQL)
+            models.Index(fields=["tool"], condition=Q(end__isnull=True), name="usage_event_in_use_idx"),
+        ]
         # This constraint is to get around db limitations with null values for end date being sometimes unique, sometimes not
         constraints = [models.UniqueConstraint(fields=["tool", "has_ended"], name="unique_tool_has_ended")]
 
@@ -3436,13 +3501,15 @@ class UsageEvent(BaseModel, CalendarDisplayMixin, BillableItemMixin):
         return str(self.id)
 
     def save(self, *args, **kwargs):
-        # Set has_ended to 0 if the end is NULL (always), otherwise set it to a unique number (max +1)
+        # Set has_ended to 0 if the end is NULL (always), otherwise set it to a unique number (next in the sequence)
         if self.end is None:
             self.has_ended = 0
         elif not self.has_ended:
             # Covers cases where has_ended was not set (None) or previously set to 0 but now has an end.
-            last_custom = UsageEvent.objects.aggregate(models.Max("has_ended"))["has_ended__max"] or 0
-            self.has_ended = last_custom + 1
+            self.has_ended = SequenceCounter.next_value(
+                "usage_event_has_ended",
+                lambda: UsageEvent.objects.aggregate(models.Max("has_ended"))["has_ended__max"] or 0,
+            )
         super().save(*args, **kwargs)
 
 
@@ -4613,6 +4680,9 @@ class ScheduledOutage(BaseModel):
     start = models.DateTimeField()
     end = models.DateTimeField()
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
+    last_updated = models.DateTimeField(
+        auto_now=True, null=True, blank=True, help_text="The last time this outage was modified."
+    )
     title = models.CharField(
         max_length=CHAR_FIELD_SMALL_LENGTH, help_text="A brief description to quickly inform users about the outage"
     )
@@ -4693,6 +4763,13 @@ class ScheduledOutage(BaseModel):
                 }
             )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["tool", "start", "end"], name="outage_tool_time_idx"),
+            models.Index(fields=["area", "start", "end"], name="outage_area_time_idx"),
+            models.Index(fields=["resource", "start", "end"], name="outage_resource_time_idx"),
+        ]
+
     def __str__(self):
         return str(self.title)
 
@@ -5305,13 +5382,17 @@ class AdjustmentRequest(BaseModel):
         adjustment_id = self.id
         super().delete(using, keep_parents)
         # If adjustment requests is being deleted, remove associated notifications
-        Notification.objects.filter(
+        deleted, _ = Notification.objects.filter(
             object_id=adjustment_id,
             notification_type__in=[
                 Notification.Types.ADJUSTMENT_REQUEST,
                 Notification.Types.ADJUSTMENT_REQUEST_REPLY,
             ],
         ).delete()
+        if deleted:
+            from NEMO.views.notifications import invalidate_notification_counts
+
+            invalidate_notification_counts()
 
     def save(self, *args, **kwargs):
         # We are removing new start, new end, new quantity and new project just in case
@@ -5535,6 +5616,10 @@ def track_tool_operational_status(sender, instance: Tool, **kwargs):
         tool_down.save()
 
 
+models.signals.post_save.connect(AreaTreeCache.invalidate_on_change, sender=Area)
+models.signals.post_delete.connect(AreaTreeCache.invalidate_on_change, sender=Area)
+
+
 @receiver(models.signals.post_save, sender=Resource)
 def track_resource_availability_status(sender, instance: Resource, **kwargs):
     resource_down = UnplannedOutage.objects.filter(resource=instance, end__isnull=True).first()
@@ -5649,9 +5734,26 @@ class EmailLog(BaseModel):
     content = models.TextField(null=False)
     ok = models.BooleanField(null=False, default=True)
     attachments = models.TextField(null=True)
+    queued = models.BooleanField(
+        default=False, help_text=_("Whether this email is waiting in the outbox to be sent by the email worker")
+    )
+    attempts = models.PositiveIntegerField(default=0, help_text=_("The number of attempts made to send this email"))
+    next_attempt = models.DateTimeField(
+        null=True, blank=True, help_text=_("The earliest time the email worker will try to send this email")
+    )
+    last_error = models.TextField(null=True, blank=True, help_text=_("The error received on the last failed attempt"))
+    message = models.TextField(
+        null=True, blank=True, help_text=_("The serialized email message, kept until the queued email is sent")
+    )
 
     class Meta:
         ordering = ["-when"]
+        indexes = [
+            models.Index(fields=["queued", "next_attempt"]),
+        ]
+
+    def get_recipients(self) -> List[str]:
+        return [recipient for recipient in self.to.split(", ") if recipient]
 
 
 def validate_waive_information(item: BillableItemMixin) -> Dict:
@@ -25,6 +25,7 @@ from NEMO.exceptions import (
     TrainingRequiredUserError,
     UnavailableResourcesUserError,
 )
+from NEMO.intervals import maximum_concurrency, merge_intervals
 from NEMO.models import (
     Area,
     AreaAccessRecord,
@@ -682,22 +683,42 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                     policy_problems.append(
                         f"{str(user)} already has a reservation that coincides with this one. Please choose a different time."
                     )
-            for area in new_reservation.area.get_ancestors(ascending=True, include_self=True):
+            ancestors = list(new_reservation.area.get_ancestors(ascending=True, include_self=True))
+            area_reservations = []
+            if any(area.maximum_capacity for area in ancestors):
+                # Get the reservations for all the areas in the tree at once, they are filtered for each area below
+                area_reservations = list(
+                    coincident_events.filter(area__tree_id=new_reservation.area.tree_id)
+                    .select_related("user", "area")
+                    .only(
+                        "start",
+                        "end",
+                        "user__is_staff",
+                        "user__is_service_personnel",
+                        "area__tree_id",
+                        "area__lft",
+                        "area__rght",
+                    )
+                )
+            count_staff, count_service_personnel = True, True
+            for area in ancestors:
                 # Check reservations for all other children of the parent areas
-                if not area.count_staff_in_occupancy:
-                    coincident_events = coincident_events.filter(user__is_staff=False)
-                if not area.count_service_personnel_in_occupancy:
-                    coincident_events = coincident_events.filter(user__is_service_personnel=False)
+                count_staff = count_staff and area.count_staff_in_occupancy
+                count_service_personnel = count_service_personnel and area.count_service_personnel_in_occupancy
                 apply_to_user = (
                     (not user.is_staff and not user.is_service_personnel)
                     or (user.is_staff and area.count_staff_in_occupancy)
                     or (user.is_service_personnel and area.count_service_personnel_in_occupancy)
                 )
                 if apply_to_user and area.maximum_capacity:
-                    children_events = coincident_events.filter(
-                        area_id__in=[area.id for area in area.get_descendants(include_self=True)]
-                    )
-                    reservations = list(children_events)
+                    reservations = [
+                        reservation
+                        for reservation in area_reservations
+                        if area.lft <= reservation.area.lft
+                        and reservation.area.rght <= area.rght
+                        and (count_staff or not reservation.user.is_staff)
+                        and (count_service_personnel or not reservation.user.is_service_personnel)
+                    ]
                     reservations.append(new_reservation)
                     # Check only distinct users since the same user could make reservations in different rooms
                     maximum_users, time = check_maximum_users_in_overlapping_reservations(reservations)
@@ -808,6 +829,34 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                 )
 
         user = new_reservation.user
+        now = timezone.now()
+
+        # Fetch the user's reservations for this item once, within the widest window needed by the rules below.
+        # All the rules are then evaluated in memory against that snapshot.
+        start_of_day = beginning_of_the_day(new_reservation.start.astimezone())
+        end_of_day = start_of_day + timedelta(days=1)
+        buffer_time = timedelta(minutes=item.minimum_time_between_reservations or 0)
+        must_end_before = (new_reservation.start - buffer_time).astimezone()
+        must_start_after = (new_reservation.end + buffer_time).astimezone()
+        user_reservations: List[Reservation] = []
+        if (
+            item.maximum_reservations_per_day
+            or item.maximum_future_reservations
+            or item.minimum_time_between_reservations
+            or item.maximum_future_reservation_time
+        ):
+            user_reservations = Reservation.objects.filter(
+                cancelled=False, user=user, end__gt=min(now, start_of_day, must_end_before)
+            )
+            user_reservations = user_reservations.filter(**new_reservation.reservation_item_filter)
+            # Exclude any reservation that is being cancelled.
+            if cancelled_reservation and cancelled_reservation.id:
+                user_reservations = user_reservations.exclude(id=cancelled_reservation.id)
+            user_reservations = list(user_reservations)
+            for reservation in user_reservations:
+                # Set the item, so we don't have to fetch it for each reservation
+                setattr(reservation, item_type.value, item)
+        not_shortened_reservations = [reservation for reservation in user_reservations if not reservation.shortened]
 
         # If there is a limit on number of reservations per user per day then verify that the user has not exceeded it.
         # Staff may break this rule.
@@ -816,27 +865,21 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
         # Reservations that overlap at any point should count
         # Weekends are fine since it's all day and the should_enforce_policy method should return False
         if item.maximum_reservations_per_day:
-            start_of_day = beginning_of_the_day(new_reservation.start.astimezone())
-            end_of_day = start_of_day + timedelta(days=1)
-            reservations_for_that_day = Reservation.objects.filter(
-                cancelled=False, shortened=False, start__gte=start_of_day, end__lte=end_of_day, user=user
-            )
+            reservations_for_that_day = [
+                r for r in not_shortened_reservations if r.start >= start_of_day and r.end <= end_of_day
+            ]
             if item.policy_off_between_times:
+                policy_off_start = datetime.combine(start_of_day.date(), item.policy_off_start_time).astimezone()
                 if item.policy_off_start_time < item.policy_off_end_time:
-                    reservations_for_that_day = reservations_for_that_day.exclude(
-                        start__gte=datetime.combine(start_of_day.date(), item.policy_off_start_time).astimezone(),
-                        end__lte=datetime.combine(start_of_day.date(), item.policy_off_end_time).astimezone(),
-                    )
+                    policy_off_end = datetime.combine(start_of_day.date(), item.policy_off_end_time).astimezone()
                 else:
-                    reservations_for_that_day = reservations_for_that_day.exclude(
-                        start__gte=datetime.combine(start_of_day.date(), item.policy_off_start_time).astimezone(),
-                        end__lte=datetime.combine(end_of_day.date(), item.policy_off_end_time).astimezone(),
-                    )
-            reservations_for_that_day = reservations_for_that_day.filter(**new_reservation.reservation_item_filter)
-            # Exclude any reservation that is being cancelled.
-            if cancelled_reservation and cancelled_reservation.id:
-                reservations_for_that_day = reservations_for_that_day.exclude(id=cancelled_reservation.id)
-            if reservations_for_that_day.count() >= item.maximum_reservations_per_day:
+                    policy_off_end = datetime.combine(end_of_day.date(), item.policy_off_end_time).astimezone()
+                reservations_for_that_day = [
+                    r
+                    for r in reservations_for_that_day
+                    if not (r.start >= policy_off_start and r.end <= policy_off_end)
+                ]
+            if len(reservations_for_that_day) >= item.maximum_reservations_per_day:
                 if user == user_creating_reservation:
                     item_policy_problems.append(
                         f"You may only have {str(item.maximum_reservations_per_day)} reservations for this {item_type.value} per day. Missed reservations are included when counting the number of reservations per day."
@@ -853,40 +896,12 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
         # Reservations that overlap at any point should count
         # Weekends are fine since it's all day and the should_enforce_policy method should return False
         if item.maximum_future_reservations:
-            future_reservations = Reservation.objects.filter(
-                cancelled=False, shortened=False, start__gte=timezone.now(), user=user
-            )
-            if item.policy_off_between_times:
-                if item.policy_off_start_time < item.policy_off_end_time:
-                    future_reservations = future_reservations.exclude(
-                        start__time__gte=item.policy_off_start_time,
-                        end__time__lte=item.policy_off_end_time,
-                    )
-                else:
-                    # Start on or after start and end before midnight
-                    start_end_before_midnight = Q(
-                        start__time__gte=item.policy_off_start_time,
-                        end__time__gte=item.policy_off_start_time,
-                        end__time__lte=time(hour=23, minute=59),
-                    )
-                    # Start after midnight and end within the same overnight range
-                    start_end_after_midnight = Q(
-                        start__time__lt=item.policy_off_end_time, end__time__lte=item.policy_off_end_time
-                    )
-                    # Start before midnight but end before policy end (overlap across midnight)
-                    start_end_overlap = Q(
-                        start__time__gte=item.policy_off_start_time, end__time__lt=item.policy_off_end_time
-                    )
-                    future_reservations = future_reservations.exclude(
-                        start_end_before_midnight | start_end_after_midnight | start_end_overlap
-                    )
-            if item.policy_off_weekend:
-                future_reservations = future_reservations.exclude(start__iso_week_day__gte=6, end__iso_week_day__gte=6)
-            future_reservations = future_reservations.filter(**new_reservation.reservation_item_filter)
-            # Exclude any reservation that is being cancelled.
-            if cancelled_reservation and cancelled_reservation.id:
-                future_reservations = future_reservations.exclude(id=cancelled_reservation.id)
-            if future_reservations.count() >= item.maximum_future_reservations:
+            future_reservations = [r for r in not_shortened_reservations if r.start >= now]
+            if item.policy_off_between_times or item.policy_off_weekend:
+                future_reservations = [
+                    r for r in future_reservations if not is_reservation_in_policy_off_time(item, r.start, r.end)
+                ]
+            if len(future_reservations) >= item.maximum_future_reservations:
                 if user == user_creating_reservation:
                     item_policy_problems.append(
                         f"You may only have {str(item.maximum_future_reservations)} future reservations for this {item_type.value}."
@@ -901,22 +916,15 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
         # An explicit policy override allows this rule to be broken.
         # Policy off: exclude reservations during policy off time and weekends
         if item.minimum_time_between_reservations:
-            buffer_time = timedelta(minutes=item.minimum_time_between_reservations)
-            must_end_before = (new_reservation.start - buffer_time).astimezone()
             # For weekends, we can just check that must_end_before is not within the policy off time
             skip_minimum_check = False
             if item.policy_off_weekend:
                 if must_end_before.weekday() in [5, 6]:
                     skip_minimum_check = True
             if not skip_minimum_check:
-                too_close = Reservation.objects.filter(
-                    cancelled=False,
-                    shortened=False,
-                    user=user,
-                    end__gt=must_end_before,
-                    start__lt=new_reservation.start,
-                )
-                too_close = too_close.filter(**new_reservation.reservation_item_filter)
+                too_close = [
+                    r for r in not_shortened_reservations if r.end > must_end_before and r.start < new_reservation.start
+                ]
                 if item.policy_off_between_times:
                     policy_start_today, policy_end_today = get_local_date_times_for_item_policy_times(
                         must_end_before, item.policy_off_start_time, item.policy_off_end_time
@@ -924,12 +932,13 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                     policy_start_yesterday, policy_end_yesterday = get_local_date_times_for_item_policy_times(
                         must_end_before - timedelta(days=1), item.policy_off_start_time, item.policy_off_end_time
                     )
-                    too_close = too_close.exclude(start__gte=policy_start_today, end__lte=policy_end_today).exclude(
-                        start__gte=policy_start_yesterday, end__lte=policy_end_yesterday
-                    )
-                if cancelled_reservation and cancelled_reservation.id:
-                    too_close = too_close.exclude(id=cancelled_reservation.id)
-                if too_close.exists():
+                    too_close = [
+                        r
+                        for r in too_close
+                        if not (r.start >= policy_start_today and r.end <= policy_end_today)
+                        and not (r.start >= policy_start_yesterday and r.end <= policy_end_yesterday)
+                    ]
+                if too_close:
                     if user == user_creating_reservation:
                         item_policy_problems.append(
                             f"Separate reservations for this {item_type.value} that belong to you must be at least {str(item.minimum_time_between_reservations)} minutes apart from each other. The proposed reservation begins too close to another reservation."
@@ -938,20 +947,16 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                         item_policy_problems.append(
                             f"Separate reservations for this {item_type.value} that belong to {str(user)} must be at least {str(item.minimum_time_between_reservations)} minutes apart from each other. The proposed reservation begins too close to another reservation."
                         )
-            must_start_after = (new_reservation.end + buffer_time).astimezone()
             # For weekends, we can just check that must_start_after is not within the policy off time
             skip_minimum_check = False
             if item.policy_off_weekend and must_start_after.weekday() in [5, 6]:
                 skip_minimum_check = True
             if not skip_minimum_check:
-                too_close = Reservation.objects.filter(
-                    cancelled=False,
-                    shortened=False,
-                    user=user,
-                    start__lt=must_start_after,
-                    end__gt=new_reservation.start,
-                )
-                too_close = too_close.filter(**new_reservation.reservation_item_filter)
+                too_close = [
+                    r
+                    for r in not_shortened_reservations
+                    if r.start < must_start_after and r.end > new_reservation.start
+                ]
                 if item.policy_off_between_times:
                     policy_start_today, policy_end_today = get_local_date_times_for_item_policy_times(
                         must_start_after, item.policy_off_start_time, item.policy_off_end_time
@@ -959,12 +964,13 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                     policy_start_tomorrow, policy_end_tomorrow = get_local_date_times_for_item_policy_times(
                         must_start_after + timedelta(days=1), item.policy_off_start_time, item.policy_off_end_time
                     )
-                    too_close = too_close.exclude(start__gte=policy_start_today, end__lte=policy_end_today).exclude(
-                        start__gte=policy_start_tomorrow, end__lte=policy_end_tomorrow
-                    )
-                if cancelled_reservation and cancelled_reservation.id:
-                    too_close = too_close.exclude(id=cancelled_reservation.id)
-                if too_close.exists():
+                    too_close = [
+                        r
+                        for r in too_close
+                        if not (r.start >= policy_start_today and r.end <= policy_end_today)
+                        and not (r.start >= policy_start_tomorrow and r.end <= policy_end_tomorrow)
+                    ]
+                if too_close:
                     if user == user_creating_reservation:
                         item_policy_problems.append(
                             f"Separate reservations for this {item_type.value} that belong to you must be at least {str(item.minimum_time_between_reservations)} minutes apart from each other. The proposed reservation ends too close to another reservation."
@@ -979,10 +985,7 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
         # An explicit policy override allows this rule to be broken.
         # Policy off: use policy duration
         if item.maximum_future_reservation_time:
-            reservations_after_now = Reservation.objects.filter(cancelled=False, user=user, start__gte=timezone.now())
-            reservations_after_now = reservations_after_now.filter(**new_reservation.reservation_item_filter)
-            if cancelled_reservation and cancelled_reservation.id:
-                reservations_after_now = reservations_after_now.exclude(id=cancelled_reservation.id)
+            reservations_after_now = [r for r in user_reservations if r.start >= now]
             amount_reserved_in_the_future = new_reservation.duration_for_policy()
             for r in reservations_after_now:
                 amount_reserved_in_the_future += r.duration_for_policy()
@@ -1189,6 +1192,29 @@ class DefaultNEMOPolicy(BaseNEMOPolicy):
                     raise ItemNotAllowedForProjectException(project, user, "Staff Charges", msg)
 
 
+def is_reservation_in_policy_off_time(item: Union[Tool, Area], start: datetime, end: datetime) -> bool:
+    """
+    Returns whether a reservation starts and ends inside the item's policy off time (or during the weekend).
+    Times are compared in the current timezone, like the database __time and __iso_week_day lookups.
+    """
+    local_start, local_end = timezone.localtime(start), timezone.localtime(end)
+    if item.policy_off_weekend and local_start.isoweekday() >= 6 and local_end.isoweekday() >= 6:
+        return True
+    if item.policy_off_between_times:
+        start_time, end_time = local_start.time(), local_end.time()
+        off_start, off_end = item.policy_off_start_time, item.policy_off_end_time
+        if off_start < off_end:
+            return start_time >= off_start and end_time <= off_end
+        # Start on or after start and end before midnight
+        start_end_before_midnight = start_time >= off_start and off_start <= end_time <= time(hour=23, minute=59)
+        # Start after midnight and end within the same overnight range
+        start_end_after_midnight = start_time < off_end and end_time <= off_end
+        # Start before midnight but end before policy end (overlap across midnight)
+        start_end_overlap = start_time >= off_start and end_time < off_end
+        return start_end_before_midnight or start_end_after_midnight or start_end_overlap
+    return False
+
+
 def check_maximum_users_in_overlapping_reservations(reservations: List[Reservation]) -> Tuple[int, datetime]:
     """
     Returns the maximum number of overlapping reservations and the earlier time the maximum is reached
@@ -1199,46 +1225,19 @@ def check_maximum_users_in_overlapping_reservations(reservations: List[Reservati
     # (and we should only count it as one)
     intervals_by_user = defaultdict(list)
     for r in reservations:
-        intervals_by_user[r.user.id].append((r.start, r.end))
+        intervals_by_user[r.user_id].append((r.start, r.end))
 
     merged_intervals = []
-    for user, intervals in intervals_by_user.items():
-        merged_intervals.extend(recursive_merge(sorted(intervals).copy()))
+    for intervals in intervals_by_user.values():
+        merged_intervals.extend(merge_intervals(intervals))
 
     # Now let's count the maximum overlapping reservations
-    times = []
-    for interval in merged_intervals:
-        start_time, end_time = interval[0], interval[1]
-        times.append((start_time, "start"))
-        times.append((end_time, "end"))
-    times = sorted(times)
-
-    count = 0
-    max_count = 0
-    max_time: Optional[datetime] = None
-    for time in times:
-        if time[1] == "start":
-            count += 1  # increment on arrival/start
-        else:
-            count -= 1  # decrement on departure/end
-        # maintain maximum
-        prev_count = max_count
-        max_count = max(count, max_count)
-        # maintain earlier time max is reached
-        if max_count > prev_count:
-            max_time = time[0]
-    return max_count, max_time
+    return maximum_concurrency(merged_intervals)
 
 
 def recursive_merge(intervals: List[tuple], start_index=0) -> List[tuple]:
-    for i in range(start_index, len(intervals) - 1):
-        if intervals[i][1] > intervals[i + 1][0]:
-            new_start = intervals[i][0]
-            new_end = intervals[i + 1][1]
-            intervals[i] = (new_start, new_end)
-            del intervals[i + 1]
-            return recursive_merge(intervals.copy(), start_index=i)
-    return intervals
+    # Kept for backwards compatibility, use NEMO.intervals.merge_intervals instead
+    return intervals[:start_index] + merge_intervals(intervals[start_index:])
 
 
 class NEMOPolicyChain:
@@ -0,0 +1,120 @@
+import csv
+from io import StringIO
+from tempfile import TemporaryFile
+from typing import Dict, Iterable, Iterator, List
+
+from drf_excel.fields import XLSXBooleanField, XLSXDateField, XLSXField, XLSXNumberField
+from drf_excel.utilities import XLSXStyle, sanitize_value, set_cell_style
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from rest_framework.fields import (
+    BooleanField,
+    DateField,
+    DateTimeField,
+    DecimalField,
+    Field,
+    FloatField,
+    IntegerField,
+    TimeField,
+)
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders a list of dictionaries as CSV.
+    The first line contains the field names.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0].keys()) if rows else []
+        return b"".join(csv_stream(rows, fields))
+
+
+def json_stream(rows: Iterable[Dict], rows_per_chunk=100) -> Iterator[bytes]:
+    """Encodes the rows as a JSON array, a few rows at a time"""
+    encoder = JSONEncoder(separators=(",", ":"))
+    chunk: List[str] = []
+    separator = ""
+    yield b"["
+    for row in rows:
+        chunk.append(separator + encoder.encode(row))
+        separator = ","
+        if len(chunk) >= rows_per_chunk:
+            yield "".join(chunk).encode()
+            chunk = []
+    yield ("".join(chunk) + "]").encode()
+
+
+def csv_stream(rows: Iterable[Dict], fields: List[str], rows_per_chunk=100) -> Iterator[bytes]:
+    """Encodes the rows as CSV with a header line, a few rows at a time"""
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for index, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if index % rows_per_chunk == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def xlsx_field(key: str, value, field: Field) -> XLSXField:
+    """Returns the drf_excel field for the value, chosen from the serializer field type like the XLSX renderer"""
+    kwargs = {"key": key, "value": value, "field": field, "style": None, "mapping": None, "cell_style": None}
+    if isinstance(field, BooleanField):
+        return XLSXBooleanField(boolean_display=None, **kwargs)
+    elif isinstance(field, (IntegerField, FloatField, DecimalField)):
+        return XLSXNumberField(**kwargs)
+    elif isinstance(field, (DateTimeField, DateField, TimeField)):
+        return XLSXDateField(**kwargs)
+    return XLSXField(**kwargs)
+
+
+def xlsx_cell(worksheet, key: str, value, field: Field) -> WriteOnlyCell:
+    """Returns a typed cell (numbers, naive local dates etc.) with the number format the XLSX renderer would use"""
+    cell_field = xlsx_field(key, value, field)
+    cell_value = cell_field.prep_value()
+    cell = WriteOnlyCell(worksheet, sanitize_value(cell_value) if cell_field.sanitize else cell_value)
+    cell_field.prep_cell(cell)
+    return cell
+
+
+def xlsx_file(rows: Iterable[Dict], fields: Dict[str, Field], column_header: Dict = None):
+    """
+    Writes the rows to a temporary XLSX file with a header line and returns the file, ready to be read.
+    Cells are typed from the serializer fields, and the header is styled the same way as drf_excel's renderer
+    (using the view's column_header). The workbook is written in write-only mode, so rows are not kept in memory.
+    """
+    column_header = column_header or {}
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Report")
+    column_width = column_header.get("column_width", 20)
+    for index in range(len(fields)):
+        width = column_width[index] if isinstance(column_width, list) else column_width
+        worksheet.column_dimensions[get_column_letter(index + 1)].width = width
+    worksheet.row_dimensions[1].height = column_header.get("height", 45)
+    column_header_style = XLSXStyle(column_header["style"]) if "style" in column_header else None
+    titles = column_header.get("titles", [])
+    header = []
+    for index, field_name in enumerate(fields):
+        cell = WriteOnlyCell(worksheet, titles[index] if index < len(titles) else field_name)
+        set_cell_style(cell, column_header_style)
+        header.append(cell)
+    worksheet.append(header)
+    for row in rows:
+        worksheet.append([xlsx_cell(worksheet, key, row.get(key), field) for key, field in fields.items()])
+    file = TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return file
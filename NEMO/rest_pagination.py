@@ -1,5 +1,19 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class NEMOPageNumberPagination(PageNumberPagination):
     page_size_query_param = "page_size"
+
+
+class NEMOCursorPagination(CursorPagination):
+    """
+    Cursor pagination, which doesn't need to count or skip rows so every page is as fast as the first one.
+    Pages are ordered using the view's get_cursor_ordering(), by id by default.
+    """
+
+    page_size_query_param = "page_size"
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, "get_cursor_ordering"):
+            return view.get_cursor_ordering()
+        return ("id",)
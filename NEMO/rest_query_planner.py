@@ -0,0 +1,132 @@
+from typing import Dict, Optional, Set
+
+from django.db.models import Field, QuerySet
+from rest_flex_fields.serializers import FlexFieldsSerializerMixin
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+class QueryPlan:
+    """
+    The lookups needed to serialize a queryset without issuing queries for each row.
+    only is None when the columns needed cannot be known (for example when a field reads a model property).
+    """
+
+    def __init__(self):
+        self.select_related: Set[str] = set()
+        self.prefetch_related: Set[str] = set()
+        self.only: Optional[Set[str]] = set()
+        # Related objects read as a whole (by a property, or str() for example), so all their columns are needed
+        self.all_columns: Set[str] = set()
+
+    def apply(self, queryset: QuerySet, restrict_columns=False) -> QuerySet:
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        # prefetch_related fetches every level of a lookup, so only the longest ones are needed
+        prefetch_related = [
+            lookup
+            for lookup in self.prefetch_related
+            if not any(other.startswith(lookup + "__") for other in self.prefetch_related)
+        ]
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(prefetch_related))
+        if restrict_columns and self.only:
+            only = [
+                column
+                for column in self.only
+                if not any(column.startswith(prefix + "__") for prefix in self.all_columns)
+            ]
+            queryset = queryset.only(*sorted(only))
+        return queryset
+
+
+def plan_queryset(serializer: BaseSerializer) -> QueryPlan:
+    """
+    Walks the serializer fields, including nested and expanded serializers, and returns the select_related,
+    prefetch_related and only() lookups needed by its model queryset.
+    The serializer should be the root serializer of the request, so expand, fields and omit parameters are used.
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    if isinstance(serializer, FlexFieldsSerializerMixin) and not serializer._flex_fields_rep_applied:
+        # Query parameters are only applied when serializing, so apply them now to know what will be expanded
+        serializer.apply_flex_fields(serializer.fields, serializer._flex_options_rep_only)
+        serializer._flex_fields_rep_applied = True
+    plan = QueryPlan()
+    if not _plan_serializer(serializer, serializer.Meta.model, "", False, plan):
+        plan.only = None
+    return plan
+
+
+def columns_requested(serializer: BaseSerializer) -> bool:
+    """Returns True when the fields or omit parameters were used, so restricting columns is worth it"""
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    options = getattr(serializer, "_flex_options_all", {})
+    return bool(options.get("fields") or options.get("omit"))
+
+
+def _model_attributes(model) -> Dict[str, Field]:
+    # Reverse relations are accessed by their accessor name (i.e. configurationoption_set)
+    attributes = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            attributes[field.get_accessor_name()] = field
+        else:
+            attributes[field.name] = field
+    return attributes
+
+
+def _plan_serializer(serializer: BaseSerializer, model, prefix: str, in_prefetch: bool, plan: QueryPlan) -> bool:
+    """
+    Adds the lookups needed by the serializer fields to the plan. prefix is the lookup path from the root model.
+    Returns False if the serializer reads attributes that are not model fields, so the columns needed are unknown.
+    """
+    columns = {model._meta.pk.name}
+    known_columns = True
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        nested = field.child if isinstance(field, ListSerializer) else field
+        nested = nested if isinstance(nested, BaseSerializer) and hasattr(nested, "Meta") else None
+        # Primary key related fields use the foreign key column and don't need the related object
+        relation = field.child_relation if isinstance(field, ManyRelatedField) else field
+        pk_only = isinstance(relation, RelatedField) and relation.use_pk_only_optimization()
+        source_attrs = field.source_attrs
+        current_model, current_prefix, current_in_prefetch = model, prefix, in_prefetch
+        for index, attribute in enumerate(source_attrs or [None]):
+            model_field = _model_attributes(current_model).get(attribute)
+            if model_field is None:
+                # A property, a method or the whole instance
+                if index:
+                    plan.all_columns.add(current_prefix[:-2])
+                known_columns = known_columns and index > 0
+                break
+            if model_field.concrete and not model_field.many_to_many and not current_in_prefetch:
+                columns.add(current_prefix[len(prefix) :] + model_field.name)
+            if not model_field.is_relation:
+                break
+            last = index == len(source_attrs) - 1
+            if last and pk_only and model_field.concrete and not model_field.many_to_many:
+                break
+            if model_field.concrete and (model_field.many_to_one or model_field.one_to_one):
+                lookup = current_prefix + model_field.name
+            else:
+                # Many to many, reverse relations and generic foreign keys
+                lookup = current_prefix + attribute
+                current_in_prefetch = True
+                if not model_field.concrete and not model_field.auto_created:
+                    # Generic foreign keys also need their content type and object id columns
+                    known_columns = known_columns and index > 0
+            (plan.prefetch_related if current_in_prefetch else plan.select_related).add(lookup)
+            current_model, current_prefix = model_field.related_model, lookup + "__"
+            if current_model is None:
+                break
+            if last and nested is not None:
+                if not _plan_serializer(nested, current_model, current_prefix, current_in_prefetch, plan):
+                    plan.all_columns.add(lookup)
+            elif last and not pk_only:
+                plan.all_columns.add(lookup)
+    if known_columns and not in_prefetch and plan.only is not None:
+        plan.only.update(prefix + column for column in columns)
+    return known_columns
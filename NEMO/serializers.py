@@ -699,9 +699,9 @@ class BillableItemSerializer(serializers.Serializer):
     end = DateTimeField(read_only=True)
     quantity = DecimalField(read_only=True, decimal_places=2, max_digits=8)
     validated = BooleanField(read_only=True)
-    validated_by = CharField(read_only=True, source="validated_by.username", allow_null=True)
+    validated_by = CharField(read_only=True, allow_null=True)
     waived = BooleanField(read_only=True)
-    waived_by = CharField(read_only=True, source="waived_by.username", allow_null=True)
+    waived_by = CharField(read_only=True, allow_null=True)
     waived_on = DateTimeField(read_only=True)
 
     def update(self, instance, validated_data):
@@ -718,49 +718,53 @@ class ToolStatusSerializer(serializers.Serializer):
     id = IntegerField(read_only=True)
     name = CharField(max_length=CHAR_FIELD_MEDIUM_LENGTH, read_only=True)
     category = CharField(max_length=CHAR_FIELD_MEDIUM_LENGTH, read_only=True)
-    in_use = BooleanField(read_only=True)
+    in_use = BooleanField(source="status.in_use", read_only=True)
     visible = BooleanField(read_only=True)
     operational = BooleanField(read_only=True)
-    non_operational_since = DateTimeField(default=None, read_only=True)
-    problematic = BooleanField(read_only=True)
-    problematic_since = DateTimeField(default=None, read_only=True)
+    non_operational_since = DateTimeField(default=None, source="status.non_operational_since", read_only=True)
+    problematic = BooleanField(source="status.problematic", read_only=True)
+    problematic_since = DateTimeField(default=None, source="status.problematic_since", read_only=True)
     problem_descriptions = CharField(default=None, max_length=CHAR_FIELD_LARGE_LENGTH, read_only=True)
-    customer_id = IntegerField(default=None, source="get_current_usage_event.user.id", read_only=True)
+    customer_id = IntegerField(default=None, source="status.current_usage_event.user.id", read_only=True)
     customer_name = CharField(
         default=None,
-        source="get_current_usage_event.user.get_name",
+        source="status.current_usage_event.user.get_name",
         max_length=CHAR_FIELD_MEDIUM_LENGTH,
         read_only=True,
     )
     customer_username = CharField(
         default=None,
-        source="get_current_usage_event.user.username",
+        source="status.current_usage_event.user.username",
         max_length=CHAR_FIELD_MEDIUM_LENGTH,
         read_only=True,
     )
-    operator_id = IntegerField(default=None, source="get_current_usage_event.operator.id", read_only=True)
+    operator_id = IntegerField(default=None, source="status.current_usage_event.operator.id", read_only=True)
     operator_name = CharField(
         default=None,
-        source="get_current_usage_event.operator.get_name",
+        source="status.current_usage_event.operator.get_name",
         max_length=CHAR_FIELD_MEDIUM_LENGTH,
         read_only=True,
     )
     operator_username = CharField(
         default=None,
-        source="get_current_usage_event.operator.username",
+        source="status.current_usage_event.operator.username",
         max_length=CHAR_FIELD_MEDIUM_LENGTH,
         read_only=True,
     )
-    current_usage_id = IntegerField(default=None, source="get_current_usage_event.id", read_only=True)
-    current_usage_start = DateTimeField(default=None, source="get_current_usage_event.start", read_only=True)
+    current_usage_id = IntegerField(default=None, source="status.current_usage_event.id", read_only=True)
+    current_usage_start = DateTimeField(default=None, source="status.current_usage_event.start", read_only=True)
     outages = CharField(default=None, max_length=2000, read_only=True)
     outages_since = DateTimeField(default=None, read_only=True)
     partial_outages = CharField(default=None, max_length=2000, read_only=True)
     partial_outages_since = DateTimeField(default=None, read_only=True)
     required_resources_unavailable = CharField(default=None, max_length=2000, read_only=True)
-    required_resources_unavailable_since = DateTimeField(default=None, read_only=True)
+    required_resources_unavailable_since = DateTimeField(
+        default=None, source="status.required_resources_unavailable_since", read_only=True
+    )
     optional_resources_unavailable = CharField(default=None, max_length=2000, read_only=True)
-    optional_resources_unavailable_since = DateTimeField(default=None, read_only=True)
+    optional_resources_unavailable_since = DateTimeField(
+        default=None, source="status.optional_resources_unavailable_since", read_only=True
+    )
 
     def update(self, instance, validated_data):
         pass
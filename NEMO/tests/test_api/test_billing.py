@@ -1,13 +1,34 @@
+import csv
+import json
 from datetime import datetime, timedelta
+from io import StringIO
 
 from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase
 from django.utils import timezone
+from openpyxl import load_workbook
 from rest_framework import ISO_8601
 from rest_framework.settings import api_settings
 
-from NEMO.models import Account, Area, AreaAccessRecord, Project, Tool, UsageEvent, User
+from NEMO.models import (
+    Account,
+    Area,
+    AreaAccessRecord,
+    Consumable,
+    ConsumableWithdraw,
+    Project,
+    Reservation,
+    StaffCharge,
+    Tool,
+    TrainingSession,
+    UsageEvent,
+    User,
+)
+from NEMO.renderers import xlsx_file
+from NEMO.serializers import BillableItemSerializer
 from NEMO.tests.test_utilities import NEMOTestCaseMixin
+from NEMO.views.api_billing import get_billing_charges
 
 
 class BillingAPITestCase(NEMOTestCaseMixin, TestCase):
@@ -90,16 +111,128 @@ class BillingAPITestCase(NEMOTestCaseMixin, TestCase):
         staff_user.save()
         response = self.client.get("/api/billing", data, follow=True)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), results_number)
+        self.assertTrue(response.streaming)
+        billing_items = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(billing_items), results_number)
 
         date_format = (
             "%Y-%m-%dT%H:%M:%S.%f%z"
             if api_settings.DATETIME_FORMAT.lower() == ISO_8601
             else api_settings.DATETIME_FORMAT
         )
-        for billing_item in response.data:
+        for billing_item in billing_items:
             start = datetime.strptime(billing_item["start"], date_format)
             end = datetime.strptime(billing_item["end"], date_format)
             self.assertEqual(datetime.now().date(), start.date())
             self.assertEqual(datetime.now().date(), end.date())
             self.assertEqual(billing_item.get(result_attribute_name), attribute_value)
+
+    def billing_data(self):
+        today = datetime.now().strftime("%m/%d/%Y")
+        return {"start": today, "end": today}
+
+    def login_with_billing_permission(self):
+        staff_user = self.login_as_staff()
+        staff_user.user_permissions.add(Permission.objects.get(codename="use_billing_api"))
+
+    def test_billing_charges_order(self):
+        charges = list(get_billing_charges(self.billing_data()))
+        self.assertEqual(len(charges), 4)
+        self.assertEqual(charges, sorted(charges, key=lambda x: x.start, reverse=True))
+        self.assertEqual({charge.type for charge in charges}, {"tool_usage", "area_access"})
+
+    def test_billing_csv(self):
+        self.login_with_billing_permission()
+        response = self.client.get("/api/billing/", {**self.billing_data(), "format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]["account"], self.account.name)
+
+    def test_billing_xlsx_file(self):
+        fields = BillableItemSerializer().fields
+        rows = [
+            {"type": "tool_usage", "quantity": "1.50", "start": "2024-02-01T10:30:00-05:00", "validated": True},
+            {"type": "consumable", "quantity": "2.00", "start": None, "validated": False},
+        ]
+        column_header = {"style": {"font": {"bold": True}}}
+        worksheet = load_workbook(xlsx_file(rows, fields, column_header)).active
+        header = [cell.value for cell in worksheet[1]]
+        self.assertEqual(header, list(fields))
+        self.assertTrue(worksheet["A1"].font.b)
+        self.assertEqual(worksheet.row_dimensions[1].height, 45)
+        self.assertEqual(worksheet.column_dimensions["A"].width, 20)
+        values = {key: cell for key, cell in zip(header, worksheet[2])}
+        self.assertEqual(values["type"].value, "tool_usage")
+        self.assertEqual(values["quantity"].data_type, "n")
+        self.assertEqual(values["quantity"].value, 1.5)
+        self.assertEqual(values["quantity"].number_format, "0.00")
+        self.assertTrue(values["start"].is_date)
+        self.assertEqual(values["start"].value, datetime(2024, 2, 1, 10, 30))
+        self.assertIs(values["validated"].value, True)
+        self.assertIsNone(dict(zip(header, worksheet[3]))["start"].value)
+
+    def test_billing_xlsx_charges(self):
+        serializer = BillableItemSerializer()
+        rows = map(serializer.to_representation, get_billing_charges(self.billing_data()))
+        worksheet = load_workbook(xlsx_file(rows, serializer.fields)).active
+        header = [cell.value for cell in worksheet[1]]
+        rows = [dict(zip(header, cells)) for cells in worksheet.iter_rows(min_row=2)]
+        self.assertEqual(len(rows), 4)
+        for row in rows:
+            self.assertEqual(row["quantity"].data_type, "n")
+            self.assertTrue(row["start"].is_date)
+            self.assertTrue(row["end"].is_date)
+            self.assertEqual(row["start"].value.date(), datetime.now().date())
+
+    def test_billable_items_from_rows(self):
+        now = timezone.now()
+        trainer = User.objects.create(username="trainer", first_name="Train", last_name="Er")
+        tool = Tool.objects.get(name="test_tool1")
+        StaffCharge.objects.create(
+            staff_member=trainer, customer=self.owner2, project=self.project, start=now, end=now, note="Note"
+        )
+        consumable = Consumable.objects.create(name="Gloves", quantity=10, reminder_threshold=1)
+        ConsumableWithdraw.objects.create(
+            customer=self.owner2, merchant=trainer, consumable=consumable, quantity=2, project=self.project
+        )
+        Reservation.objects.create(
+            user=self.owner2,
+            creator=self.owner2,
+            tool=tool,
+            project=self.project,
+            start=now - timedelta(hours=1),
+            end=now,
+            short_notice=False,
+            missed=True,
+        )
+        TrainingSession.objects.create(
+            trainer=trainer, trainee=self.owner2, tool=tool, project=self.project, duration=30, type=0, qualified=True
+        )
+        UsageEvent.objects.filter(user=self.owner2).update(validated=True, validated_by=trainer, operator=trainer)
+        charges = list(get_billing_charges(self.billing_data()))
+        self.assertEqual(len(charges), 8)
+        for charge in charges:
+            content_type = ContentType.objects.get_for_id(charge.item_content_type_id)
+            instance = content_type.get_object_for_this_type(id=charge.item_id)
+            charged_user = getattr(instance, "customer", None) or getattr(instance, "trainee", None) or instance.user
+            self.assertEqual(charge.user, str(charged_user))
+            self.assertEqual(charge.username, charged_user.username)
+            self.assertEqual(charge.user_id, charged_user.id)
+            self.assertEqual(charge.project, self.project.name)
+            self.assertEqual(charge.account, self.account.name)
+            self.assertEqual(charge.account_id, self.account.id)
+            self.assertEqual(charge.application, self.project.application_identifier)
+            self.assertEqual(charge.validated, instance.validated)
+            self.assertEqual(charge.validated_by, instance.validated_by.username if instance.validated_by else None)
+            self.assertEqual(charge.as_dict()["type"], charge.type)
+        details = {charge.type: charge.details for charge in charges if charge.details}
+        self.assertEqual(details["tool_usage"], f"Work performed by {trainer} on user's behalf")
+        self.assertEqual(details["staff_charge"], "Note")
+        self.assertEqual(details["training_session"], f"Individual training provided by {trainer}")
+        names = {charge.type: charge.name for charge in charges}
+        self.assertEqual(names["missed_reservation"], tool.name)
+        self.assertEqual(names["consumable"], "Gloves")
+        self.assertEqual(names["staff_charge"], f"Work performed by {trainer}")
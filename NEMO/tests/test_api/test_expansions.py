@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from NEMO.models import Reservation, Tool, UsageEvent
+from NEMO.rest_query_planner import plan_queryset
+from NEMO.serializers import ReservationSerializer, UsageEventSerializer
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+
+
+class ExpansionQueriesTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.start = timezone.now() - timedelta(days=1)
+        self.login_as_user_with_permissions(["view_usageevent", "view_reservation", "view_user"])
+
+    def create_rows(self, count):
+        for i in range(count):
+            user, project = create_user_and_project()
+            tool = Tool.objects.create(name=f"Tool {Tool.objects.count()}", _category="Tools", _operational=True)
+            start = self.start + timedelta(hours=UsageEvent.objects.count())
+            UsageEvent.objects.create(
+                user=user, operator=user, project=project, tool=tool, start=start, end=start + timedelta(minutes=30)
+            )
+            Reservation.objects.create(
+                user=user,
+                creator=user,
+                project=project,
+                tool=tool,
+                start=start,
+                end=start + timedelta(minutes=30),
+                short_notice=False,
+            )
+
+    def count_queries(self, url, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # Exports are not paginated
+        results = response.data if isinstance(response.data, list) else response.data["results"]
+        return len(context.captured_queries), results
+
+    def assert_constant_queries(self, url, params):
+        self.create_rows(2)
+        queries, results = self.count_queries(url, params)
+        self.assertEqual(len(results), 2)
+        self.create_rows(5)
+        self.assertEqual(self.count_queries(url, params)[0], queries)
+        # Cursor pagination uses the page size
+        params = {**params, "pagination": "cursor"}
+        self.assertEqual(self.count_queries(url, {**params, "page_size": 1})[0], queries)
+        self.assertEqual(self.count_queries(url, {**params, "page_size": 6})[0], queries)
+        return results
+
+    def test_usage_event_expansions(self):
+        results = self.assert_constant_queries(
+            reverse("usageevent-list"), {"expand": "user.projects,project.account,tool,operator"}
+        )
+        usage_event = results[0]
+        self.assertEqual(usage_event["user"]["username"], UsageEvent.objects.get(id=usage_event["id"]).user.username)
+        self.assertEqual(len(usage_event["user"]["projects"]), 1)
+        self.assertIn("name", usage_event["user"]["projects"][0])
+        self.assertIn("name", usage_event["project"]["account"])
+
+    def test_reservation_expansions(self):
+        results = self.assert_constant_queries(reverse("reservation-list"), {"expand": "user,tool,project"})
+        self.assertEqual(results[0]["configuration_options"], [])
+
+    def test_sparse_fields(self):
+        results = self.assert_constant_queries(
+            reverse("usageevent-list"), {"expand": "user", "fields": "id,start,user.username"}
+        )
+        self.assertEqual(set(results[0]), {"id", "start", "user"})
+        self.assertEqual(set(results[0]["user"]), {"username"})
+
+    def test_plan(self):
+        plan = plan_queryset(UsageEventSerializer(expand=["user.projects", "project.account"], fields=["id", "user"]))
+        self.assertEqual(plan.select_related, {"user"})
+        self.assertIn("user__projects", plan.prefetch_related)
+        self.assertIn("user__user_documents", plan.prefetch_related)
+        self.assertEqual({"id", "user", "user__id", "user__username"} - plan.only, set())
+        self.assertNotIn("start", plan.only)
+        # question_data reads a property, so columns needed are unknown
+        plan = plan_queryset(ReservationSerializer(expand=["tool"]))
+        self.assertEqual(plan.select_related, {"tool"})
+        self.assertIn("configurationoption_set", plan.prefetch_related)
+        self.assertIsNone(plan.only)
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from NEMO.models import Tool, UsageEvent
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+
+
+class CursorPaginationTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        user, project = create_user_and_project()
+        tool = Tool.objects.create(name="Tool", _category="Tools", _operational=True)
+        start = timezone.now() - timedelta(days=1)
+        # Created out of order, so ordering by id and by start are different
+        for hours in [5, 1, 3, 0, 6, 2, 4]:
+            UsageEvent.objects.create(
+                user=user,
+                operator=user,
+                project=project,
+                tool=tool,
+                start=start + timedelta(hours=hours),
+                end=start + timedelta(hours=hours, minutes=30),
+            )
+        self.login_as_user_with_permissions(["view_usageevent", "view_user"])
+
+    def get_all_pages(self, url, params):
+        results, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            results.extend(response.data["results"])
+            pages += 1
+            if not response.data["next"]:
+                return results, pages
+            response = self.client.get(response.data["next"])
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(reverse("usageevent-list"), {"page_size": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 7)
+        self.assertIn("results", response.data)
+
+    def test_cursor_pagination(self):
+        results, pages = self.get_all_pages(reverse("usageevent-list"), {"pagination": "cursor", "page_size": 3})
+        self.assertEqual(pages, 3)
+        expected_ids = list(UsageEvent.objects.order_by("start", "id").values_list("id", flat=True))
+        self.assertEqual([usage_event["id"] for usage_event in results], expected_ids)
+
+    def test_cursor_pagination_by_id(self):
+        results, pages = self.get_all_pages(reverse("user-list"), {"pagination": "cursor", "page_size": 1})
+        self.assertEqual(pages, 2)
+        self.assertEqual([user["id"] for user in results], sorted(user["id"] for user in results))
+
+    def test_updated_since(self):
+        since = timezone.now() + timedelta(minutes=1)
+        updated_ids = list(UsageEvent.objects.order_by("id").values_list("id", flat=True)[:3])
+        for minutes, usage_event_id in enumerate(reversed(updated_ids), 2):
+            UsageEvent.objects.filter(id=usage_event_id).update(last_updated=since + timedelta(minutes=minutes))
+        params = {"updated_since": since.isoformat(), "page_size": 2}
+        results, pages = self.get_all_pages(reverse("usageevent-list"), params)
+        self.assertEqual(pages, 2)
+        # Ordered by last update
+        self.assertEqual([usage_event["id"] for usage_event in results], list(reversed(updated_ids)))
+
+    def test_updated_since_errors(self):
+        response = self.client.get(reverse("usageevent-list"), {"updated_since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("updated_since", response.data)
+        response = self.client.get(reverse("user-list"), {"updated_since": timezone.now().isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("updated_since", response.data)
@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from NEMO.models import Resource, ScheduledOutage, Task, Tool, UnplannedOutage, UsageEvent
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.tool_status import ToolStatusHelper
+
+
+class ToolStatusTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.user, self.project = create_user_and_project(is_staff=True)
+        self.parent = Tool.objects.create(name="Parent", _category="Tools", _operational=True)
+        self.child = Tool.objects.create(name="Child", parent_tool=self.parent, visible=False)
+        self.tool = Tool.objects.create(name="Tool", _category="Tools", _operational=False)
+        required = Resource.objects.create(name="Required", available=False)
+        required.fully_dependent_tools.add(self.parent)
+        optional = Resource.objects.create(name="Optional", available=False)
+        optional.partially_dependent_tools.add(self.tool)
+        UnplannedOutage.objects.create(resource=required, start=now - timedelta(hours=2))
+        UnplannedOutage.objects.create(resource=optional, start=now - timedelta(hours=3))
+        UnplannedOutage.objects.create(tool=self.tool, start=now - timedelta(hours=4))
+        Task.objects.create(
+            tool=self.parent,
+            urgency=Task.Urgency.HIGH,
+            force_shutdown=False,
+            safety_hazard=False,
+            creator=self.user,
+            problem_description="1",
+        )
+        Task.objects.create(
+            tool=self.parent,
+            urgency=Task.Urgency.LOW,
+            force_shutdown=False,
+            safety_hazard=False,
+            creator=self.user,
+            problem_description="2",
+        )
+        ScheduledOutage.objects.create(
+            tool=self.tool,
+            title="Outage",
+            start=now - timedelta(hours=1),
+            end=now + timedelta(hours=1),
+            creator=self.user,
+        )
+        ScheduledOutage.objects.create(
+            resource=optional,
+            title="Partial",
+            start=now - timedelta(hours=1),
+            end=now + timedelta(hours=1),
+            creator=self.user,
+        )
+        UsageEvent.objects.create(user=self.user, operator=self.user, project=self.project, tool=self.child, start=now)
+        self.login_as_user_with_permissions(["view_tool"])
+
+    def get_statuses(self):
+        response = self.client.get("/api/tool_status/")
+        self.assertEqual(response.status_code, 200)
+        return {status["id"]: status for status in response.data}
+
+    def test_tool_status(self):
+        statuses = self.get_statuses()
+        parent, child, tool = statuses[self.parent.id], statuses[self.child.id], statuses[self.tool.id]
+        for status in [parent, child]:
+            self.assertTrue(status["in_use"])
+            self.assertEqual(status["customer_username"], self.user.username)
+            self.assertTrue(status["problematic"])
+            self.assertEqual(status["problem_descriptions"], "1, 2")
+            self.assertEqual(status["required_resources_unavailable"], "Required")
+            self.assertIsNotNone(status["required_resources_unavailable_since"])
+            self.assertIsNone(status["optional_resources_unavailable"])
+        self.assertFalse(tool["in_use"])
+        self.assertIsNone(tool["customer_username"])
+        self.assertFalse(tool["problematic"])
+        self.assertFalse(tool["operational"])
+        self.assertIsNotNone(tool["non_operational_since"])
+        self.assertEqual(tool["outages"], "Outage")
+        self.assertEqual(tool["partial_outages"], "Partial")
+        self.assertEqual(tool["optional_resources_unavailable"], "Optional")
+        self.assertIsNotNone(tool["optional_resources_unavailable_since"])
+
+    def test_same_as_tool_methods(self):
+        tool_statuses = ToolStatusHelper(Tool.objects.all())
+        for tool in Tool.objects.all():
+            status = tool_statuses.get(tool)
+            self.assertEqual(status.in_use, tool.in_use())
+            self.assertEqual(status.current_usage_event, tool.get_current_usage_event())
+            self.assertEqual(status.delayed_logoff_in_progress, tool.delayed_logoff_in_progress())
+            self.assertEqual(set(status.problems), set(tool.problems()))
+            self.assertEqual(set(status.outages), set(tool.scheduled_outages()))
+            self.assertEqual(set(status.partial_outages), set(tool.scheduled_partial_outages()))
+            self.assertEqual(set(status.unavailable_required_resources), set(tool.unavailable_required_resources()))
+            self.assertEqual(
+                set(status.unavailable_nonrequired_resources), set(tool.unavailable_nonrequired_resources())
+            )
+            self.assertEqual(tool_statuses.name_or_child_in_use_name(tool), tool.name_or_child_in_use_name())
+
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_statuses()
+        queries = len(context.captured_queries)
+        for i in range(5):
+            tool = Tool.objects.create(name=f"Other tool {i}", _category="Tools", _operational=True)
+            Task.objects.create(
+                tool=tool,
+                urgency=Task.Urgency.LOW,
+                force_shutdown=False,
+                safety_hazard=False,
+                creator=self.user,
+                problem_description="3",
+            )
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(self.get_statuses()), 8)
+        self.assertEqual(len(context.captured_queries), queries)
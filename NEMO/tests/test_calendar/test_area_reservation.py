@@ -767,6 +767,40 @@ class AreaReservationTestCase(NEMOTestCaseMixin, TransactionTestCase):
 
         reservation.delete()
 
+    def test_reservation_maximum_capacity(self):
+        building = Area.objects.create(name="building", maximum_capacity=2)
+        area.parent_area = building
+        area.save()
+        other_area = Area.objects.create(name="other_area", parent_area=building)
+        other_user = User.objects.create(username="other", first_name="Other", last_name="User")
+        dt_now = datetime.now()
+        start = datetime(dt_now.year, dt_now.month, dt_now.day) + timedelta(days=1, hours=8)
+        end = start + timedelta(hours=2)
+        # Same user in two areas only counts once, staff is counted by default
+        for reservation_area, reservation_user in [(area, other_user), (other_area, other_user), (other_area, staff)]:
+            Reservation.objects.create(
+                area=reservation_area,
+                start=start.astimezone(),
+                end=end.astimezone(),
+                creator=reservation_user,
+                user=reservation_user,
+                short_notice=False,
+            )
+        self.login_as(consumer)
+        data = self.get_reservation_data(start + timedelta(hours=1), end + timedelta(hours=1), area)
+        response = self.client.post(reverse("create_reservation"), data, follow=True)
+        self.assertContains(response, "The building would be over its maximum capacity")
+        # Back-to-back reservations don't overlap
+        data = self.get_reservation_data(end, end + timedelta(hours=1), area)
+        response = self.client.post(reverse("create_reservation"), data, follow=True)
+        self.assertNotContains(response, "maximum capacity")
+        # Staff is not counted anymore
+        building.count_staff_in_occupancy = False
+        building.save()
+        data = self.get_reservation_data(start + timedelta(hours=1), end + timedelta(hours=1), area)
+        response = self.client.post(reverse("create_reservation"), data, follow=True)
+        self.assertNotContains(response, "maximum capacity")
+
     def test_reservation_with_area_configuration(self):
         # TODO: create those tests
         self.assertTrue(True)
@@ -0,0 +1,325 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from NEMO.models import (
+    Area,
+    AreaAccessRecord,
+    Configuration,
+    ConfigurationOption,
+    Reservation,
+    ScheduledOutage,
+    StaffCharge,
+    Tool,
+    UsageEvent,
+    User,
+)
+from NEMO.views.customization import CalendarCustomization
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.utilities import localize
+
+
+class EventFeedTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.staff, self.staff_project = create_user_and_project(is_staff=True)
+        self.user, self.project = create_user_and_project()
+        self.tool_staff, self.tool_staff_project = create_user_and_project()
+        self.area = Area.objects.create(name="Clean & Room", requires_reservation=True, area_calendar_color="#123456")
+        self.tool = Tool.objects.create(name='Saw "Big"', primary_owner=self.staff, _tool_calendar_color="#654321")
+        self.tool._staff.add(self.tool_staff)
+        self.child_tool = Tool.objects.create(name="Child saw", parent_tool=self.tool, visible=False)
+        self.configuration = Configuration.objects.create(
+            tool=self.tool,
+            name="Blade type",
+            configurable_item_name="Blade",
+            advance_notice_limit=0,
+            display_order=0,
+            prompt="What blade type do you need to use?",
+            current_settings="SiC Blade",
+            available_settings="Metal Blade, SiC Blade",
+            calendar_colors="#111111, #222222",
+        )
+        self.start = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        self.create_events(3)
+
+    def create_events(self, count: int):
+        for i in range(count):
+            start = self.start + timedelta(hours=i)
+            end = start + timedelta(minutes=30)
+            for tool in [self.tool, self.child_tool]:
+                reservation = Reservation.objects.create(
+                    tool=tool,
+                    start=start,
+                    end=end,
+                    user=self.user,
+                    creator=self.staff,
+                    project=self.project,
+                    title=f"Reservation {i}",
+                    short_notice=False,
+                )
+                ConfigurationOption.objects.create(
+                    reservation=reservation,
+                    configuration=self.configuration,
+                    name="Blade type",
+                    current_setting="SiC Blade",
+                    available_settings="Metal Blade, SiC Blade",
+                )
+                Reservation.objects.create(
+                    tool=tool,
+                    start=start,
+                    end=end,
+                    user=self.user,
+                    creator=self.user,
+                    project=self.project,
+                    missed=True,
+                    short_notice=False,
+                )
+                UsageEvent.objects.create(
+                    tool=tool, user=self.user, operator=self.staff, project=self.project, start=start, end=end
+                )
+                ScheduledOutage.objects.create(tool=tool, start=start, end=end, title=f"Outage {i}", creator=self.staff)
+            Reservation.objects.create(
+                area=self.area, start=start, end=end, user=self.staff, creator=self.staff, short_notice=False
+            )
+            AreaAccessRecord.objects.create(
+                area=self.area,
+                customer=self.user,
+                project=self.project,
+                start=start,
+                end=end,
+                staff_charge=StaffCharge.objects.create(
+                    staff_member=self.staff, customer=self.user, project=self.project, start=start, end=end
+                ),
+            )
+
+    def get_feed(self, user: User, event_type: str, parameters: Dict = None) -> List[Dict]:
+        self.login_as(user)
+        return self.request_feed(event_type, parameters)
+
+    def request_feed(self, event_type: str, parameters: Dict = None) -> List[Dict]:
+        parameters = {
+            "start": (self.start - timedelta(days=1)).strftime("%Y-%m-%d"),
+            "end": (self.start + timedelta(days=2)).strftime("%Y-%m-%d"),
+            "event_type": event_type,
+            **(parameters or {}),
+        }
+        response = self.client.get(reverse("event_feed"), parameters)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def count_feed_queries(self, event_type: str, parameters: Dict = None) -> int:
+        with CaptureQueriesContext(connection) as context:
+            events = self.request_feed(event_type, parameters)
+        self.assertTrue(events)
+        return len(context.captured_queries)
+
+    def assert_feed_queries_constant(self, user: User, event_type: str, parameters: Dict = None):
+        # The number of queries should not depend on the number of events
+        self.get_feed(user, event_type, parameters)
+        queries = self.count_feed_queries(event_type, parameters)
+        self.create_events(5)
+        self.assertEqual(self.count_feed_queries(event_type, parameters), queries)
+
+    def test_reservation_feed(self):
+        CalendarCustomization.set("calendar_configuration_in_reservations", "enabled")
+        events = self.get_feed(self.user, "reservations", {"item_type": "tool", "item_id": self.tool.id})
+        reservation = Reservation.objects.filter(tool=self.tool, missed=False).earliest("start")
+        self.assertEqual(
+            next(event for event in events if event["id"] == f"Reservation {reservation.id}"),
+            {
+                "title": "Reservation 0\nBlade type: SiC Blade\n",
+                "colors": ["#222222"],
+                "color": "#654321",
+                "own-reservation": True,
+                "tooltip": f'Saw "Big" reservation for {self.user}, created by {self.staff}',
+                "id": f"Reservation {reservation.id}",
+                "editable": True,
+                "start": timezone.localtime(reservation.start).isoformat(),
+                "end": timezone.localtime(reservation.end).isoformat(),
+                "details_url": reverse("reservation_details", args=[reservation.id]),
+            },
+        )
+        outage_events = [event for event in events if event["id"].startswith("Outage")]
+        self.assertEqual(len(outage_events), 3)
+        self.assertNotIn("editable", outage_events[0])
+        # Tool staff can edit outages, including on child tools
+        for tool in [self.tool, self.child_tool]:
+            events = self.get_feed(self.tool_staff, "reservations", {"item_type": "tool", "item_id": tool.id})
+            self.assertTrue(all(event.get("editable") for event in events))
+        events = self.get_feed(self.user, "reservations", {"item_type": "area", "item_id": self.area.id})
+        self.assertEqual(events[0]["tooltip"], f"Clean & Room reservation for {self.staff}")
+        self.assertEqual(events[0]["color"], "#123456")
+        self.assertNotIn("editable", events[0])
+
+    def test_usage_feed(self):
+        events = self.get_feed(self.user, "facility use", {"all_areastools": "true"})
+        self.assertEqual(len(events), 15)
+        usage_event = UsageEvent.objects.filter(tool=self.tool).earliest("start")
+        usage_feed_event = next(event for event in events if event["id"] == usage_event.id)
+        self.assertEqual(
+            usage_feed_event["title"], f'Saw "Big" ({self.staff} on behalf of {self.user.username})\n {self.project}'
+        )
+        self.assertEqual(usage_feed_event["color"], "#654321")
+        area_access_event = next(event for event in events if "access billed" in event["title"])
+        self.assertEqual(
+            area_access_event["title"], f"Clean & Room access billed to project {self.project} by {self.staff}"
+        )
+        missed_event = events[-1]
+        self.assertEqual(missed_event["title"], f"Missed reservation by {self.user} \n {self.project}")
+
+    def test_specific_user_feed(self):
+        events = self.get_feed(self.staff, "specific user", {"user": self.user.id})
+        self.assertEqual(len(events), 21)
+        titles = [event["title"] for event in events]
+        self.assertIn('Usage of the Saw "Big"', titles)
+        self.assertIn("Missed reservation for the Child saw", titles)
+
+    def test_configuration_agenda_feed(self):
+        events = self.get_feed(self.tool_staff, "configuration agenda", {"all_tools": "true"})
+        self.assertEqual(len(events), 6)
+        tool_event = next(event for event in events if event["title"].startswith('Saw "Big"'))
+        self.assertEqual(tool_event["title"], f'Saw "Big" ({self.user.username})\nBlade type: SiC Blade\n')
+        self.assertTrue(tool_event["editable"])
+
+    @override_settings(CALENDAR_FEED_CACHE_SECONDS=0)
+    def test_feed_number_of_queries(self):
+        CalendarCustomization.set("calendar_configuration_in_reservations", "enabled")
+        self.assert_feed_queries_constant(self.user, "reservations", {"item_type": "tool", "item_id": self.tool.id})
+        self.assert_feed_queries_constant(self.tool_staff, "reservations", {"all_tools": "true"})
+        self.assert_feed_queries_constant(self.user, "reservations", {"personal_schedule": "true"})
+        self.assert_feed_queries_constant(self.user, "reservations and use", {"all_areastools": "true"})
+        self.assert_feed_queries_constant(self.staff, "specific user", {"user": self.user.id})
+        self.assert_feed_queries_constant(self.tool_staff, "configuration agenda", {"all_tools": "true"})
+
+    def test_reservations_and_use_feed(self):
+        parameters = {"item_type": "tool", "item_id": self.tool.id}
+        reservation_events = self.get_feed(self.user, "reservations", parameters)
+        usage_events = self.get_feed(self.user, "facility use", parameters)
+        self.assertEqual(
+            self.get_feed(self.user, "reservations and use", parameters), reservation_events + usage_events
+        )
+
+    def test_feed_time_window(self):
+        window_start = localize(datetime.strptime((self.start - timedelta(days=1)).strftime("%Y-%m-%d"), "%Y-%m-%d"))
+        window_end = window_start + timedelta(days=3)
+        # Ending when the window starts, or starting when it ends
+        for start, end in [
+            (window_start - timedelta(hours=1), window_start),
+            (window_end, window_end + timedelta(hours=1)),
+        ]:
+            UsageEvent.objects.create(
+                tool=self.tool, user=self.user, operator=self.user, project=self.project, start=start, end=end
+            )
+        # Overlapping the start of the window, and still in progress
+        overlapping = UsageEvent.objects.create(
+            tool=self.tool,
+            user=self.user,
+            operator=self.user,
+            project=self.project,
+            start=window_start - timedelta(hours=1),
+            end=window_start + timedelta(hours=1),
+        )
+        in_progress = UsageEvent.objects.create(
+            tool=self.tool, user=self.user, operator=self.user, project=self.project, start=self.start
+        )
+        events = self.get_feed(self.user, "facility use", {"item_type": "tool", "item_id": self.tool.id})
+        usage_event_ids = {event["id"] for event in events if event["details_url"].startswith("/event_details/usage")}
+        expected_ids = set(
+            UsageEvent.objects.filter(start__gte=self.start, start__lt=window_end).values_list("id", flat=True)
+        )
+        self.assertEqual(usage_event_ids, expected_ids | {overlapping.id})
+        self.assertIn(in_progress.id, usage_event_ids)
+
+    # Long cache time, so the version doesn't change during the test
+    @override_settings(CALENDAR_FEED_CACHE_SECONDS=10**9)
+    def test_feed_not_modified(self):
+        parameters = {
+            "start": (self.start - timedelta(days=1)).strftime("%Y-%m-%d"),
+            "end": (self.start + timedelta(days=2)).strftime("%Y-%m-%d"),
+            "event_type": "reservations",
+            "item_type": "tool",
+            "item_id": self.tool.id,
+        }
+        self.login_as(self.user)
+        response = self.client.get(reverse("event_feed"), parameters)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        # Same feed, with a cache busting parameter
+        response = self.client.get(reverse("event_feed"), {**parameters, "_": "123"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # Other parameters or user
+        response = self.client.get(
+            reverse("event_feed"), {**parameters, "display_name": "true"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.login_as(self.tool_staff)
+        response = self.client.get(reverse("event_feed"), parameters, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.login_as(self.user)
+        # Modified, created or deleted events
+        reservation = Reservation.objects.filter(tool=self.tool, missed=False).first()
+        reservation.title = "New title"
+        reservation.save()
+        response = self.client.get(reverse("event_feed"), parameters, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("New title", response.content.decode())
+        etag = response["ETag"]
+        ScheduledOutage.objects.filter(tool=self.tool).first().delete()
+        response = self.client.get(reverse("event_feed"), parameters, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(CALENDAR_FEED_CACHE_SECONDS=10**9)
+    def test_feed_cached(self):
+        parameters = {"item_type": "tool", "item_id": self.tool.id}
+        events = self.get_feed(self.user, "reservations", parameters)
+        # Only the session, user, and feed version queries
+        with self.assertNumQueries(5):
+            self.assertEqual(self.request_feed("reservations", parameters), events)
+
+    @override_settings(CALENDAR_FEED_CACHE_SECONDS=10**9)
+    def test_feed_version_only_includes_item(self):
+        parameters = {
+            "start": self.start.strftime("%Y-%m-%d"),
+            "end": (self.start + timedelta(days=1)).strftime("%Y-%m-%d"),
+        }
+        other_tool = Tool.objects.create(name="Other tool", primary_owner=self.staff)
+        self.login_as(self.user)
+        tool_parameters = {**parameters, "event_type": "facility use", "item_type": "tool", "item_id": self.tool.id}
+        area_parameters = {**parameters, "event_type": "facility use", "item_type": "area", "item_id": self.area.id}
+        tool_etag = self.client.get(reverse("event_feed"), tool_parameters)["ETag"]
+        area_etag = self.client.get(reverse("event_feed"), area_parameters)["ETag"]
+        # Usage of another tool doesn't change either feed
+        UsageEvent.objects.create(
+            tool=other_tool, user=self.user, operator=self.user, project=self.project, start=self.start
+        )
+        for feed_parameters, etag in [(tool_parameters, tool_etag), (area_parameters, area_etag)]:
+            response = self.client.get(reverse("event_feed"), feed_parameters, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        # Usage of a child tool changes the tool feed
+        UsageEvent.objects.create(
+            tool=self.child_tool, user=self.user, operator=self.user, project=self.project, start=self.start
+        )
+        response = self.client.get(reverse("event_feed"), tool_parameters, HTTP_IF_NONE_MATCH=tool_etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CALENDAR_FEED_CACHE_SECONDS=0)
+    def test_feed_cache_disabled(self):
+        self.login_as(self.user)
+        response = self.client.get(
+            reverse("event_feed"),
+            {
+                "start": self.start.strftime("%Y-%m-%d"),
+                "end": (self.start + timedelta(days=1)).strftime("%Y-%m-%d"),
+                "event_type": "reservations",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
@@ -7,6 +7,7 @@ from django.utils import timezone
 
 from NEMO.exceptions import NotAllowedToChargeProjectException
 from NEMO.models import Account, Area, Configuration, Project, Reservation, ScheduledOutage, Tool, User
+from NEMO.policy import policy_class
 from NEMO.tests.test_utilities import NEMOTestCaseMixin
 
 
@@ -658,6 +659,34 @@ class ReservationTestCase(NEMOTestCaseMixin, TransactionTestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_reservation_policy_for_item_single_query(self):
+        tool.maximum_reservations_per_day = 2
+        tool.maximum_future_reservations = 2
+        tool.minimum_time_between_reservations = 30
+        tool.maximum_future_reservation_time = 120
+        tool.save()
+        dt_now = datetime.now()
+        start = (datetime(dt_now.year, dt_now.month, dt_now.day) + timedelta(days=1, hours=8)).astimezone()
+        for i in range(2):
+            Reservation.objects.create(
+                tool=tool,
+                start=start + timedelta(hours=2 * i),
+                end=start + timedelta(hours=2 * i, minutes=45),
+                creator=consumer,
+                user=consumer,
+                short_notice=False,
+            )
+        new_reservation = Reservation(
+            tool=tool,
+            start=start + timedelta(minutes=55),
+            end=start + timedelta(hours=1, minutes=45),
+            creator=consumer,
+            user=consumer,
+        )
+        with self.assertNumQueries(1):
+            problems = policy_class.check_reservation_policy_for_item(consumer, new_reservation, None)
+        self.assertEqual(len(problems), 5)
+
     def test_reservation_with_tool_configuration(self):
         config = Configuration.objects.create(
             tool=tool,
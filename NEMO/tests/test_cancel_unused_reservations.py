@@ -0,0 +1,209 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from NEMO.models import Area, AreaAccessRecord, Reservation, Resource, ScheduledOutage, Tool, UsageEvent
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.views.customization import CustomizationBase
+from NEMO.views.timed_services import do_cancel_unused_reservations
+
+
+class CancelUnusedReservationsTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.user, self.project = create_user_and_project()
+        self.other_user, self.other_project = create_user_and_project()
+        self.tool = self.create_tool("Tool")
+        self.building = Area.objects.create(name="Building", category="Building")
+        self.room = Area.objects.create(name="Room", parent_area=self.building, missed_reservation_threshold=15)
+
+    def create_tool(self, name) -> Tool:
+        return Tool.objects.create(
+            name=name,
+            _category="Tools",
+            _operational=True,
+            _primary_owner=self.other_user,
+            _missed_reservation_threshold=15,
+        )
+
+    def create_reservation(self, **kwargs) -> Reservation:
+        # The missed reservation threshold is reached now
+        start = self.now - timedelta(minutes=15)
+        return Reservation.objects.create(
+            user=self.user,
+            creator=self.user,
+            project=self.project,
+            start=start,
+            end=start + timedelta(hours=1),
+            short_notice=False,
+            **kwargs,
+        )
+
+    def cancel_unused_reservations(self, now=None, processed_until=None):
+        # Each run starts from the given watermark (the first run only looks at the last minute)
+        CustomizationBase.set("cancel_unused_reservations_processed_until", processed_until)
+        self.run_cancel_unused_reservations(now)
+
+    def run_cancel_unused_reservations(self, now=None):
+        with mock.patch("django.utils.timezone.now", return_value=now or self.now):
+            do_cancel_unused_reservations()
+
+    def assert_missed(self, reservation: Reservation, missed: bool):
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.missed, missed)
+
+    def test_missed_tool_reservation(self):
+        reservation = self.create_reservation(tool=self.tool)
+        later = self.create_reservation(tool=self.create_tool("Other tool"))
+        later.start = later.start + timedelta(seconds=1)
+        later.save()
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, True)
+        self.assert_missed(later, False)
+
+    def test_tool_activity(self):
+        child = Tool.objects.create(name="Child", parent_tool=self.tool, visible=False)
+        reservation = self.create_reservation(tool=self.tool)
+        # Usage of another tool of the family since the threshold counts
+        UsageEvent.objects.create(
+            user=self.other_user,
+            operator=self.other_user,
+            project=self.other_project,
+            tool=child,
+            start=self.now - timedelta(hours=1),
+            end=self.now - timedelta(minutes=5),
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+
+    def test_tool_in_use(self):
+        reservation = self.create_reservation(tool=self.tool)
+        UsageEvent.objects.create(
+            user=self.other_user,
+            operator=self.other_user,
+            project=self.other_project,
+            tool=self.tool,
+            start=self.now - timedelta(hours=1),
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+
+    def test_tool_staff_and_outages(self):
+        reservation = self.create_reservation(tool=self.tool)
+        self.tool._staff.add(self.user)
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        self.tool._staff.remove(self.user)
+        resource = Resource.objects.create(name="Resource")
+        resource.fully_dependent_tools.add(self.tool)
+        ScheduledOutage.objects.create(
+            resource=resource, start=self.now, end=self.now + timedelta(hours=1), creator=self.user, title="Outage"
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        ScheduledOutage.objects.all().delete()
+        resource.available = False
+        resource.save()
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        resource.available = True
+        resource.save()
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, True)
+
+    def test_missed_area_reservation(self):
+        reservation = self.create_reservation(area=self.room)
+        # Someone else logging in doesn't count
+        AreaAccessRecord.objects.create(
+            area=self.room, customer=self.other_user, project=self.other_project, start=self.now
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, True)
+
+    def test_area_activity(self):
+        reservation = self.create_reservation(area=self.room)
+        AreaAccessRecord.objects.create(
+            area=self.room, customer=self.user, project=self.project, start=self.now - timedelta(hours=1)
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+
+    def test_parent_area_resource_and_outage(self):
+        reservation = self.create_reservation(area=self.room)
+        resource = Resource.objects.create(name="Resource", available=False)
+        resource.dependent_areas.add(self.building)
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        resource.available = True
+        resource.save()
+        ScheduledOutage.objects.create(
+            area=self.building, start=self.now, end=self.now + timedelta(hours=1), creator=self.user, title="Outage"
+        )
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        ScheduledOutage.objects.all().delete()
+        self.cancel_unused_reservations()
+        self.assert_missed(reservation, True)
+
+    def test_catch_up(self):
+        reservation = self.create_reservation(tool=self.tool)
+        earlier = self.create_reservation(tool=self.create_tool("Other tool"))
+        earlier.start = earlier.start - timedelta(minutes=30)
+        earlier.save()
+        # The previous run was 45 minutes ago, both reservations are caught up
+        self.cancel_unused_reservations(processed_until=(self.now - timedelta(minutes=45)).isoformat())
+        self.assert_missed(reservation, True)
+        self.assert_missed(earlier, True)
+        self.assertEqual(
+            CustomizationBase.get("cancel_unused_reservations_processed_until", use_cache=False),
+            self.now.isoformat(),
+        )
+        # Running again doesn't process the same interval
+        Reservation.objects.update(missed=False)
+        self.run_cancel_unused_reservations()
+        self.assert_missed(reservation, False)
+        # After a long downtime, only the last catch up minutes are processed
+        earlier.start = self.now - timedelta(minutes=105)
+        earlier.end = self.now + timedelta(hours=1)
+        earlier.save()
+        Reservation.objects.update(missed=False)
+        self.cancel_unused_reservations(processed_until=(self.now - timedelta(days=1)).isoformat())
+        self.assert_missed(reservation, True)
+        self.assert_missed(earlier, False)
+
+    def test_constant_queries(self):
+        self.create_reservation(tool=self.tool)
+        self.create_reservation(area=self.room, missed=True)
+        # Customizations are cached after the first run
+        self.cancel_unused_reservations()
+        Reservation.objects.filter(tool=self.tool).update(missed=False)
+        CustomizationBase.set("cancel_unused_reservations_processed_until", None)
+        with CaptureQueriesContext(connection) as context:
+            self.run_cancel_unused_reservations()
+        queries = len(context.captured_queries)
+        for i in range(10):
+            tool = self.create_tool(f"Tool {i}")
+            self.create_reservation(tool=tool)
+            UsageEvent.objects.create(
+                user=self.other_user, operator=self.other_user, project=self.other_project, tool=tool, start=self.now
+            )
+        Reservation.objects.filter(tool=self.tool).update(missed=False)
+        CustomizationBase.set("cancel_unused_reservations_processed_until", None)
+        with CaptureQueriesContext(connection) as context:
+            self.run_cancel_unused_reservations()
+        self.assertEqual(len(context.captured_queries), queries)
+
+    def test_watermark_does_not_invalidate_customizations(self):
+        CustomizationBase.set("cancel_unused_reservations_processed_until", None)
+        with mock.patch.object(CustomizationBase, "invalidate_all_caches") as invalidate_all_caches:
+            self.run_cancel_unused_reservations()
+            self.run_cancel_unused_reservations(self.now + timedelta(minutes=1))
+        invalidate_all_caches.assert_not_called()
+        self.assertEqual(
+            CustomizationBase.get("cancel_unused_reservations_processed_until", use_cache=False),
+            (self.now + timedelta(minutes=1)).isoformat(),
+        )
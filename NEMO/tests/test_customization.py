@@ -1,8 +1,13 @@
 from datetime import date, datetime
 
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 
+from NEMO.context_processors import base_context
 from NEMO.exceptions import InvalidCustomizationException
+from NEMO.models import Customization
 from NEMO.tests.test_utilities import NEMOTestCaseMixin
 from NEMO.utilities import date_input_format, datetime_input_format
 from NEMO.views.customization import ApplicationCustomization, CustomizationBase, ToolCustomization
@@ -148,3 +153,41 @@ class CustomizationGetMethodsTestCase(NEMOTestCaseMixin, TestCase):
         CustomizationBase.invalidate_cache()
         value = ApplicationCustomization.get("facility_name")
         self.assertEqual(value, "Before Invalidate")
+
+
+class CustomizationCacheTestCase(NEMOTestCaseMixin, TestCase):
+    """Tests for the process-level customization cache and its cross-process version."""
+
+    def customization_queries(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        return [query for query in context.captured_queries if Customization._meta.db_table in query["sql"]]
+
+    def test_get_all_does_not_reload(self):
+        ApplicationCustomization.set("facility_name", "My Lab")
+        self.assertTrue(self.customization_queries(CustomizationBase.get_all))
+        self.assertFalse(self.customization_queries(CustomizationBase.get_all))
+        self.assertEqual(CustomizationBase.get_all()["facility_name"], "My Lab")
+
+    def test_base_context_steady_state(self):
+        request = RequestFactory().get("/")
+        request.session = {}
+        request.user = AnonymousUser()
+        base_context(request)
+        self.assertFalse(self.customization_queries(lambda: base_context(request)))
+
+    def test_direct_model_change_invalidates_cache(self):
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Facility")
+        Customization.objects.create(name="facility_name", value="Admin Lab")
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Admin Lab")
+        Customization.objects.filter(name="facility_name").delete()
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Facility")
+
+    def test_shared_version_change_reloads_cache(self):
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Facility")
+        # Simulate a change made by another process: update the db without signals and bump the shared version
+        Customization.objects.bulk_create([Customization(name="facility_name", value="Other Lab")])
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Facility")
+        CustomizationBase._bump_shared_version()
+        CustomizationBase._version_check_expiry = 0
+        self.assertEqual(ApplicationCustomization.get("facility_name"), "Other Lab")
@@ -0,0 +1,146 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from NEMO.facility_status import FacilityStatusSnapshot
+from NEMO.models import Area, AreaAccessRecord, Resource, ScheduledOutage, Task, Tool, UsageEvent
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.views.status_dashboard import create_area_summary, create_tool_summary
+
+
+class FacilityStatusSnapshotTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        # The test cache is a local memory cache, pretend it is shared between processes
+        for module in ["NEMO.facility_status", "NEMO.model_tree"]:
+            shared_cache_patcher = mock.patch(f"{module}.is_cache_shared", return_value=True)
+            shared_cache_patcher.start()
+            self.addCleanup(shared_cache_patcher.stop)
+        self.user, self.project = create_user_and_project()
+        self.tool = Tool.objects.create(name="Tool", _category="Tools", _operational=True, _primary_owner=self.user)
+        self.other_tool = Tool.objects.create(
+            name="Other tool", _category="Other", _operational=True, _primary_owner=self.user
+        )
+        self.building = Area.objects.create(name="Building", category="Building")
+        self.room = Area.objects.create(name="Room", parent_area=self.building)
+
+    def tool_summary(self, **kwargs):
+        return {tool["id"]: tool for tool in create_tool_summary(**kwargs)}
+
+    def area_summary(self):
+        return {area["id"]: area for area in create_area_summary()}
+
+    def test_reads_without_queries(self):
+        create_tool_summary(tooltip_info=True)
+        create_area_summary()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(create_tool_summary(tooltip_info=True)), 2)
+            create_area_summary()
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_tool_categories_and_tooltip(self):
+        self.assertEqual(list(self.tool_summary(tool_categories=["tools"])), [self.tool.id])
+        self.assertNotIn("get_tool_info_html", self.tool_summary()[self.tool.id])
+        self.assertIn("get_tool_info_html", self.tool_summary(tooltip_info=True)[self.tool.id])
+        self.assertNotIn("family_ids", self.tool_summary()[self.tool.id])
+
+    def test_only_changed_tools_are_updated(self):
+        self.assertFalse(self.tool_summary()[self.tool.id]["in_use"])
+        usage_event = UsageEvent.objects.create(
+            user=self.user, operator=self.user, project=self.project, tool=self.tool, start=timezone.now()
+        )
+        snapshot = FacilityStatusSnapshot.get()
+        self.assertTrue(snapshot["tools"][self.tool.id]["in_use"])
+        self.assertEqual(snapshot["generation"], FacilityStatusSnapshot.generation())
+        # A new task only marks its tool as stale, without rewriting the snapshot
+        Task.objects.create(
+            tool=self.other_tool,
+            urgency=Task.Urgency.LOW,
+            force_shutdown=False,
+            safety_hazard=False,
+            creator=self.user,
+            problem_description="Broken",
+        )
+        self.assertEqual(cache.get(FacilityStatusSnapshot.CACHE_KEY), snapshot)
+        markers = FacilityStatusSnapshot.stale_markers(snapshot["generation"], FacilityStatusSnapshot.generation())
+        self.assertEqual([marker["tool_ids"] for marker in markers], [[self.other_tool.id]])
+        summary = self.tool_summary()
+        self.assertTrue(summary[self.other_tool.id]["problematic"])
+        self.assertTrue(summary[self.tool.id]["in_use"])
+        usage_event.end = timezone.now()
+        usage_event.save()
+        self.assertFalse(self.tool_summary()[self.tool.id]["in_use"])
+        # Hidden tools are removed
+        self.other_tool.visible = False
+        self.other_tool.save()
+        self.assertEqual(list(self.tool_summary()), [self.tool.id])
+
+    def test_occupancy(self):
+        self.assertEqual(self.area_summary()[self.room.id]["occupancy"], 0)
+        record = AreaAccessRecord.objects.create(
+            area=self.room, customer=self.user, project=self.project, start=timezone.now()
+        )
+        areas = self.area_summary()
+        self.assertEqual(areas[self.room.id]["occupancy"], 1)
+        # Parents include the occupants of their children
+        self.assertEqual(areas[self.building.id]["occupancy"], 1)
+        self.assertIn(str(self.user), areas[self.building.id]["occupants"])
+        record.end = timezone.now()
+        record.save()
+        self.assertEqual(self.area_summary()[self.room.id]["occupancy"], 0)
+
+    def test_resources_and_outages(self):
+        resource = Resource.objects.create(name="Resource")
+        resource.fully_dependent_tools.add(self.tool)
+        resource.dependent_areas.add(self.room)
+        self.assertFalse(self.tool_summary()[self.tool.id]["required_resource_is_unavailable"])
+        resource.available = False
+        resource.save()
+        self.assertTrue(self.tool_summary()[self.tool.id]["required_resource_is_unavailable"])
+        self.assertTrue(self.area_summary()[self.room.id]["required_resource_is_unavailable"])
+        # An outage starting later is shown without any change when it starts
+        start = timezone.now() + timedelta(seconds=30)
+        ScheduledOutage.objects.create(
+            tool=self.other_tool, start=start, end=start + timedelta(hours=1), creator=self.user, title="Outage"
+        )
+        self.assertFalse(self.tool_summary()[self.other_tool.id]["scheduled_outage"])
+        self.assertEqual(FacilityStatusSnapshot.get()["valid_until"], start)
+
+    def test_rebuild_command(self):
+        create_tool_summary()
+        # Changes made outside NEMO (without signals) are only seen after a rebuild
+        Tool.objects.filter(id=self.tool.id).update(name="Renamed")
+        self.assertEqual(self.tool_summary()[self.tool.id]["name"], "Tool")
+        call_command("rebuild_facility_status")
+        self.assertEqual(self.tool_summary()[self.tool.id]["name"], "Renamed")
+
+    def test_concurrent_refresh_keeps_stale_markers(self):
+        create_tool_summary()
+        outdated_snapshot = cache.get(FacilityStatusSnapshot.CACHE_KEY)
+        UsageEvent.objects.create(
+            user=self.user, operator=self.user, project=self.project, tool=self.tool, start=timezone.now()
+        )
+        self.assertTrue(self.tool_summary()[self.tool.id]["in_use"])
+        # Another process writing back a snapshot computed before the change doesn't lose it
+        cache.set(FacilityStatusSnapshot.CACHE_KEY, outdated_snapshot, None)
+        self.assertTrue(self.tool_summary()[self.tool.id]["in_use"])
+
+    def test_missing_markers_rebuild(self):
+        create_tool_summary()
+        Tool.objects.filter(id=self.tool.id).update(name="Renamed")
+        self.other_tool.save()
+        cache.delete_many([f"{FacilityStatusSnapshot.STALE_KEY_PREFIX}{FacilityStatusSnapshot.generation()}"])
+        self.assertEqual(self.tool_summary()[self.tool.id]["name"], "Renamed")
+
+    def test_built_live_without_shared_cache(self):
+        with mock.patch("NEMO.facility_status.is_cache_shared", return_value=False):
+            create_tool_summary()
+            self.assertIsNone(cache.get(FacilityStatusSnapshot.CACHE_KEY))
+            # Changes made by other processes are seen right away
+            Tool.objects.filter(id=self.tool.id).update(name="Renamed")
+            self.assertEqual(self.tool_summary()[self.tool.id]["name"], "Renamed")
@@ -0,0 +1,78 @@
+import threading
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from NEMO.models import Area, AreaAccessRecord, SequenceCounter, Tool, UsageEvent
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+
+
+def start_usage_events(count):
+    user, project = create_user_and_project()
+    usage_events = []
+    for i in range(count):
+        tool = Tool.objects.create(name=f"Tool {i}", _category="Tools", _operational=True)
+        usage_events.append(
+            UsageEvent.objects.create(user=user, operator=user, project=project, tool=tool, start=timezone.now())
+        )
+    return usage_events
+
+
+class HasEndedSequenceTestCase(NEMOTestCaseMixin, TestCase):
+    def test_usage_event_has_ended(self):
+        usage_events = start_usage_events(5)
+        self.assertEqual({usage_event.has_ended for usage_event in usage_events}, {0})
+        for usage_event in usage_events:
+            usage_event.end = timezone.now()
+            with CaptureQueriesContext(connection) as context:
+                usage_event.save()
+            self.assertFalse([query for query in context.captured_queries if "MAX(" in query["sql"].upper()])
+        self.assertEqual([usage_event.has_ended for usage_event in usage_events], [1, 2, 3, 4, 5])
+        # Saving an ended event again doesn't change its number
+        usage_events[0].save()
+        self.assertEqual(usage_events[0].has_ended, 1)
+        self.assertEqual(SequenceCounter.objects.get(name="usage_event_has_ended").value, 5)
+
+    def test_counter_starts_after_existing_values(self):
+        user, project = create_user_and_project()
+        area = Area.objects.create(name="Area")
+        record = AreaAccessRecord.objects.create(area=area, customer=user, project=project, start=timezone.now())
+        AreaAccessRecord.objects.filter(id=record.id).update(end=timezone.now(), has_ended=41)
+        # Counters are created by the migration, a missing one starts after the last value
+        SequenceCounter.objects.all().delete()
+        record = AreaAccessRecord.objects.create(area=area, customer=user, project=project, start=timezone.now())
+        record.end = timezone.now()
+        record.save()
+        self.assertEqual(record.has_ended, 42)
+        self.assertEqual(SequenceCounter.next_value("area_access_record_has_ended"), 43)
+        self.assertEqual(SequenceCounter.next_value("other_counter"), 1)
+
+
+@skipUnless(connection.vendor in ["postgresql", "mysql"], "Concurrent writes are not supported by this database")
+class ConcurrentHasEndedSequenceTestCase(NEMOTestCaseMixin, TransactionTestCase):
+    def test_disable_tools_in_parallel(self):
+        usage_events = start_usage_events(20)
+        errors = []
+        barrier = threading.Barrier(len(usage_events))
+
+        def disable_tool(usage_event: UsageEvent):
+            try:
+                barrier.wait(5)
+                usage_event.end = timezone.now()
+                usage_event.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=disable_tool, args=[usage_event]) for usage_event in usage_events]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        has_ended_values = list(UsageEvent.objects.values_list("has_ended", flat=True))
+        self.assertEqual(sorted(has_ended_values), list(range(1, len(usage_events) + 1)))
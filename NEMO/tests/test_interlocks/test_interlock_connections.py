@@ -0,0 +1,176 @@
+import socket
+import threading
+import time
+
+from django.test import TestCase, override_settings
+
+from NEMO.interlocks import (
+    INTERLOCK_STATUS_CARD_DISABLED,
+    INTERLOCK_STATUS_NO_CONNECTION,
+    INTERLOCK_STATUS_OK,
+    INTERLOCK_STATUS_TIMED_OUT,
+    ProXrInterlock,
+    get_interlock_report,
+    ping_interlocks,
+    proxr_connection_pool,
+)
+from NEMO.models import Interlock, InterlockCard, InterlockCardCategory
+from NEMO.tests.test_utilities import NEMOTestCaseMixin
+
+
+class LocalCardServer:
+    """Local socket stand-in for an interlock card, replying to each request with a relay state after a delay"""
+
+    def __init__(self, delay: float = 0, reply: bool = True, close_after_requests: int = None):
+        self.delay = delay
+        self.reply = reply
+        self.close_after_requests = close_after_requests
+        self.connections = 0
+        self.requests = 0
+        self.server_socket = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server_socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, address = self.server_socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=[connection], daemon=True).start()
+
+    def handle(self, connection: socket.socket):
+        connection_requests = 0
+        with connection:
+            while connection.recv(64):
+                self.requests += 1
+                connection_requests += 1
+                if self.reply:
+                    time.sleep(self.delay)
+                    connection.sendall(bytes([1]))
+                if connection_requests == self.close_after_requests:
+                    return
+
+    def close(self):
+        self.server_socket.close()
+
+
+@override_settings(INTERLOCKS_ENABLED=True)
+class InterlockTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+        proxr_connection_pool.close_all()
+        super().tearDown()
+
+    def create_card(self, category_key: str, server: LocalCardServer = None, **kwargs) -> InterlockCard:
+        if server:
+            self.servers.append(server)
+            port = server.port
+        else:
+            # Closed port
+            with socket.create_server(("127.0.0.1", 0)) as closed_socket:
+                port = closed_socket.getsockname()[1]
+        category = InterlockCardCategory.objects.get(key=category_key)
+        return InterlockCard.objects.create(server="127.0.0.1", port=port, number=1, category=category, **kwargs)
+
+    def test_ping_statuses(self):
+        stanford_card = self.create_card("stanford", LocalCardServer())
+        offline_card = self.create_card("stanford")
+        disabled_card = self.create_card("stanford", enabled=False)
+        proxr_server = LocalCardServer()
+        proxr_card = self.create_card("proxr", proxr_server)
+        stanford_interlock = Interlock.objects.create(card=stanford_card, channel=1)
+        offline_interlock = Interlock.objects.create(card=offline_card, channel=1)
+        disabled_interlock = Interlock.objects.create(card=disabled_card, channel=1)
+        proxr_interlocks = [Interlock.objects.create(card=proxr_card, channel=i, unit_id=1) for i in range(1, 4)]
+        statuses = ping_interlocks(Interlock.objects.select_related("card__category"))
+        self.assertEqual(statuses[stanford_interlock.id], INTERLOCK_STATUS_OK)
+        self.assertEqual(statuses[offline_interlock.id], INTERLOCK_STATUS_NO_CONNECTION)
+        self.assertEqual(statuses[disabled_interlock.id], INTERLOCK_STATUS_CARD_DISABLED)
+        for proxr_interlock in proxr_interlocks:
+            self.assertEqual(statuses[proxr_interlock.id], INTERLOCK_STATUS_OK)
+        # One connection for all the interlocks on the card
+        self.assertEqual(proxr_server.connections, 1)
+
+    def test_cards_pinged_concurrently(self):
+        for i in range(4):
+            card = self.create_card("proxr", LocalCardServer(delay=0.5))
+            Interlock.objects.create(card=card, channel=1, unit_id=1)
+        start = time.monotonic()
+        statuses = ping_interlocks(Interlock.objects.select_related("card__category"))
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(list(statuses.values()), [INTERLOCK_STATUS_OK] * 4)
+
+    @override_settings(INTERLOCKS_PING_DEADLINE=0.5)
+    def test_deadline(self):
+        silent_card = self.create_card("proxr", LocalCardServer(reply=False))
+        silent_interlock = Interlock.objects.create(card=silent_card, channel=1, unit_id=1)
+        good_card = self.create_card("stanford", LocalCardServer())
+        good_interlock = Interlock.objects.create(card=good_card, channel=1)
+        start = time.monotonic()
+        statuses = ping_interlocks(Interlock.objects.select_related("card__category"))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(statuses[silent_interlock.id], INTERLOCK_STATUS_TIMED_OUT)
+        self.assertEqual(statuses[good_interlock.id], INTERLOCK_STATUS_OK)
+
+    def test_interlock_report(self):
+        card = self.create_card("stanford", LocalCardServer())
+        interlock = Interlock.objects.create(card=card, channel=1, name="Interlock 1")
+        report = get_interlock_report(Interlock.objects.all())
+        self.assertEqual(len(report.rows), 1)
+        self.assertEqual(report.rows[0]["status"], INTERLOCK_STATUS_OK)
+        self.assertEqual(report.rows[0]["id"], interlock.id)
+
+    @override_settings(INTERLOCKS_CONNECTION_IDLE_TIMEOUT=30)
+    def test_connection_reused(self):
+        server = LocalCardServer()
+        card = self.create_card("proxr", server)
+        interlock = Interlock.objects.create(card=card, channel=1, unit_id=1)
+        self.assertTrue(interlock.unlock())
+        self.assertTrue(interlock.unlock())
+        self.assertEqual(interlock.ping(), INTERLOCK_STATUS_OK)
+        self.assertEqual(server.connections, 1)
+
+    @override_settings(INTERLOCKS_CONNECTION_IDLE_TIMEOUT=30)
+    def test_reconnect_when_closed_by_card(self):
+        server = LocalCardServer(close_after_requests=2)
+        card = self.create_card("proxr", server)
+        interlock = Interlock.objects.create(card=card, channel=1, unit_id=1)
+        self.assertTrue(interlock.unlock())
+        time.sleep(0.1)
+        self.assertTrue(interlock.unlock())
+        self.assertEqual(server.connections, 2)
+
+    def test_no_pooling_by_default(self):
+        server = LocalCardServer()
+        card = self.create_card("proxr", server)
+        interlock = Interlock.objects.create(card=card, channel=1, unit_id=1)
+        self.assertTrue(interlock.unlock())
+        self.assertTrue(interlock.unlock())
+        self.assertEqual(server.connections, 2)
+
+    @override_settings(INTERLOCKS_CONNECTION_IDLE_TIMEOUT=30)
+    def test_concurrent_commands_are_serialized(self):
+        server = LocalCardServer(delay=0.05)
+        card = self.create_card("proxr", server)
+        interlocks = [Interlock.objects.create(card=card, channel=i, unit_id=1) for i in range(1, 6)]
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda i=i: results.append(ProXrInterlock()._send_command(i, Interlock.State.UNLOCKED))
+            )
+            for i in interlocks
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [Interlock.State.UNLOCKED] * 5)
+        self.assertEqual(server.connections, 1)
+        # Each command sends the relay command and reads the state
+        self.assertEqual(server.requests, 10)
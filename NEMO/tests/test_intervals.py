@@ -0,0 +1,61 @@
+import time
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from NEMO.intervals import maximum_concurrency, merge_intervals, occupancy_profile
+from NEMO.models import Reservation
+from NEMO.policy import check_maximum_users_in_overlapping_reservations
+
+
+def hours(*values):
+    start = datetime(2024, 1, 1)
+    return tuple(start + timedelta(hours=value) for value in values)
+
+
+class IntervalsTestCase(TestCase):
+    def test_merge_intervals(self):
+        self.assertEqual(merge_intervals([]), [])
+        # Unsorted, contained, overlapping and back-to-back intervals
+        intervals = [hours(5, 6), hours(0, 4), hours(1, 2), hours(3, 5), hours(7, 9), hours(8, 9)]
+        self.assertEqual(merge_intervals(intervals), [hours(0, 5), hours(5, 6), hours(7, 9)])
+
+    def test_maximum_concurrency(self):
+        self.assertEqual(maximum_concurrency([]), (0, None))
+        intervals = [hours(0, 4), hours(1, 2), hours(2, 5), hours(3, 6), hours(4, 7)]
+        self.assertEqual(maximum_concurrency(intervals), (3, hours(3)[0]))
+        # Back-to-back intervals don't overlap
+        self.assertEqual(maximum_concurrency([hours(0, 1), hours(1, 2)]), (1, hours(0)[0]))
+
+    def test_occupancy_profile(self):
+        intervals = [hours(0, 4), hours(1, 2), hours(2, 5), hours(3, 6)]
+        self.assertEqual(
+            occupancy_profile(intervals),
+            [hours(0) + (1,), hours(1) + (2,), hours(3) + (3,), hours(4) + (2,), hours(5) + (1,), hours(6) + (0,)],
+        )
+        self.assertEqual(occupancy_profile(intervals, *hours(3.5, 5)), [hours(3.5) + (3,), hours(4) + (2,)])
+        self.assertEqual(occupancy_profile(intervals, *hours(-2, -1)), [hours(-2) + (0,)])
+        self.assertEqual(occupancy_profile(intervals, *hours(-1, 1)), [hours(-1) + (0,), hours(0) + (1,)])
+
+    def test_maximum_users_in_overlapping_reservations(self):
+        reservations = [
+            Reservation(user_id=1, start=hours(0)[0], end=hours(2)[0]),
+            Reservation(user_id=1, start=hours(1)[0], end=hours(3)[0]),
+            Reservation(user_id=2, start=hours(2)[0], end=hours(4)[0]),
+            Reservation(user_id=3, start=hours(3)[0], end=hours(4)[0]),
+        ]
+        self.assertEqual(check_maximum_users_in_overlapping_reservations(reservations), (2, hours(2)[0]))
+
+    def test_10000_reservations(self):
+        # 100 users with 100 overlapping back-to-back reservations each
+        reservations = [
+            Reservation(user_id=user, start=hours(i + user / 100)[0], end=hours(i + 1.5 + user / 100)[0])
+            for user in range(100)
+            for i in range(100)
+        ]
+        start = time.perf_counter()
+        maximum_users, maximum_time = check_maximum_users_in_overlapping_reservations(reservations)
+        duration = time.perf_counter() - start
+        self.assertEqual(maximum_users, 100)
+        self.assertEqual(maximum_time, hours(0.99)[0])
+        self.assertLess(duration, 5)
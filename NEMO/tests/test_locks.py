@@ -0,0 +1,153 @@
+import gc
+import threading
+import time
+from abc import ABC, abstractmethod
+from unittest import skipUnless
+
+from django.db import ProgrammingError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from NEMO.decorators import synchronized
+from NEMO.exceptions import LockTimeoutError
+from NEMO.locks import CacheLockBackend, DatabaseLockBackend, InProcessLockBackend, LockBackend
+from NEMO.tests.test_utilities import NEMOTestCaseMixin
+
+
+class LockBackendTestMixin(ABC):
+    @abstractmethod
+    def create_backend(self) -> LockBackend:
+        pass
+
+    def test_mutual_exclusion(self):
+        backend = self.create_backend()
+        running, max_running = [0], [0]
+
+        def run():
+            with backend.lock("lock_name", "group"):
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+                time.sleep(0.02)
+                running[0] -= 1
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max_running[0], 1)
+        metrics = backend.metrics()["group"]
+        self.assertEqual(metrics["acquisitions"], 5)
+        self.assertGreater(metrics["contentions"], 0)
+        self.assertEqual(metrics["timeouts"], 0)
+
+    def test_timeout(self):
+        backend, other_backend = self.create_backend(), self.create_backend()
+        held, done = threading.Event(), threading.Event()
+
+        def hold():
+            with backend.lock("lock_name"):
+                held.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait(5)
+        try:
+            with self.assertRaises(LockTimeoutError):
+                with other_backend.lock("lock_name", timeout=0.1):
+                    pass
+            self.assertEqual(other_backend.metrics()["lock_name"]["timeouts"], 1)
+            # Other names are not locked
+            with other_backend.lock("other_lock_name", timeout=0.1):
+                pass
+        finally:
+            done.set()
+            thread.join()
+        with other_backend.lock("lock_name", timeout=0.1):
+            pass
+
+
+class InProcessLockBackendTestCase(LockBackendTestMixin, TestCase):
+    backend = None
+
+    def create_backend(self) -> LockBackend:
+        # Locks are only shared within the same backend instance
+        if self.backend is None:
+            self.backend = InProcessLockBackend()
+        return self.backend
+
+    def test_registry_is_bounded(self):
+        backend = self.create_backend()
+        for i in range(100):
+            with backend.lock(f"tool_{i}"):
+                pass
+        gc.collect()
+        self.assertEqual(len(backend), 0)
+
+
+class CacheLockBackendTestCase(NEMOTestCaseMixin, LockBackendTestMixin, TestCase):
+    def create_backend(self) -> LockBackend:
+        # Different instances simulate different processes sharing the cache
+        return CacheLockBackend()
+
+    @override_settings(SYNCHRONIZED_LOCK_EXPIRY=0.1)
+    def test_expired_lock(self):
+        backend = self.create_backend()
+        with backend.lock("lock_name"):
+            time.sleep(0.2)
+            # The lock expired, so another process can acquire it
+            with self.create_backend().lock("lock_name", timeout=0):
+                pass
+
+
+@skipUnless(connection.vendor in ["postgresql", "mysql"], "Advisory locks are not supported by this database")
+class DatabaseLockBackendTestCase(LockBackendTestMixin, TransactionTestCase):
+    def create_backend(self) -> LockBackend:
+        return DatabaseLockBackend()
+
+    def test_release_after_failed_query(self):
+        # The original exception is raised, not the one from releasing the lock in the aborted transaction
+        with self.assertRaises(ProgrammingError):
+            with transaction.atomic():
+                with self.create_backend().lock("lock_name"):
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT * FROM NEMO_table_that_does_not_exist")
+        # The lock was released, so another connection can acquire it
+        acquired = []
+
+        def acquire():
+            with self.create_backend().lock("lock_name", timeout=1):
+                acquired.append(True)
+            connection.close()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+        self.assertEqual(acquired, [True])
+
+
+class SynchronizedTestCase(TestCase):
+    def test_synchronized(self):
+        calls = []
+
+        @synchronized("item_id", timeout=0.1)
+        def run(item_id, wait_for: threading.Event = None):
+            calls.append(item_id)
+            if wait_for:
+                wait_for.wait(5)
+
+        done = threading.Event()
+        thread = threading.Thread(target=run, args=[1, done])
+        thread.start()
+        while not calls:
+            time.sleep(0.01)
+        try:
+            # Same argument is locked, a different one is not
+            with self.assertRaises(LockTimeoutError):
+                run(1)
+            run(2)
+        finally:
+            done.set()
+            thread.join()
+        run(1)
+        self.assertEqual(calls, [1, 2, 1])
@@ -0,0 +1,92 @@
+import time
+from unittest import mock
+
+from django.test import TestCase
+
+from NEMO.model_tree import AREA_TREE_ONLY_FIELDS, ModelTreeHelper, get_area_model_tree
+from NEMO.models import Area
+from NEMO.tests.test_utilities import NEMOTestCaseMixin
+
+
+class ModelTreeTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        # Three levels of areas: 3 roots, each with 3 children, each with 3 children
+        for i in range(3):
+            root = Area.objects.create(name=f"Root {i}", category="Building")
+            for j in range(3):
+                child = Area.objects.create(name=f"Child {i}-{j}", parent_area=root)
+                for k in range(3):
+                    Area.objects.create(name=f"Leaf {i}-{j}-{k}", parent_area=child)
+
+    def test_tree_matches_database(self):
+        with self.assertNumQueries(1):
+            tree = ModelTreeHelper(Area(), "parent_area", "area_children_set", AREA_TREE_ONLY_FIELDS)
+        self.assertEqual(len(tree.items), Area.objects.count())
+        self.assertCountEqual(
+            [root.id for root in tree.roots], Area.objects.filter(parent_area=None).values_list("id", flat=True)
+        )
+        self.assertCountEqual(tree.leaf_ids, [area.id for area in Area.objects.all() if area.is_leaf_node()])
+        for area in Area.objects.all():
+            tree_item = tree.get_area(area.id)
+            self.assertEqual(tree_item.is_root, area.is_root_node())
+            self.assertEqual(tree_item.is_leaf, area.is_leaf_node())
+            self.assertEqual(tree_item.tree_category, area.tree_category())
+            self.assertEqual(tree_item.ancestor_ids(), list(area.get_ancestors().values_list("id", flat=True)))
+            if not tree_item.is_leaf:
+                self.assertCountEqual(
+                    [child.id for child in tree_item.children], area.get_children().values_list("id", flat=True)
+                )
+                self.assertCountEqual(
+                    [d.id for d in tree_item.descendants], area.get_descendants().values_list("id", flat=True)
+                )
+
+    def test_area_model_tree_is_cached(self):
+        # The test cache is a local memory cache, pretend it is shared between processes
+        with mock.patch("NEMO.model_tree.is_cache_shared", return_value=True):
+            get_area_model_tree()
+            with self.assertNumQueries(0):
+                tree = get_area_model_tree()
+            self.assertEqual(len(tree.items), 39)
+            # Modifying the tree returned doesn't affect the next one
+            tree.get_area(tree.roots[0].id).item.name = "Modified"
+            self.assertNotEqual(get_area_model_tree().get_area(tree.roots[0].id).item.name, "Modified")
+            # Saving an area invalidates the cache
+            new_area = Area.objects.create(name="New area", parent_area=tree.roots[0])
+            tree = get_area_model_tree()
+            self.assertEqual(len(tree.items), 40)
+            self.assertIn(
+                new_area.id,
+                tree.get_area(tree.roots[0].id).ancestor_ids()
+                + [d.id for d in tree.get_area(tree.roots[0].id).descendants],
+            )
+            new_area.delete()
+            self.assertEqual(len(get_area_model_tree().items), 39)
+
+    def test_area_model_tree_not_cached_without_shared_cache(self):
+        get_area_model_tree()
+        # Areas created by another process are seen right away
+        Area.objects.bulk_create([Area(name="New area", lft=0, rght=0, tree_id=0, level=0)])
+        self.assertEqual(len(get_area_model_tree().items), 40)
+
+
+class ModelTreeBenchmarkTestCase(NEMOTestCaseMixin, TestCase):
+    def test_2000_nested_areas(self):
+        # 2,000 areas: 10 roots, each with 9 children, each with 20 grandchildren, plus one deep chain of 100 areas
+        for i in range(10):
+            root = Area.objects.create(name=f"Root {i}")
+            for j in range(9):
+                child = Area.objects.create(name=f"Child {i}-{j}", parent_area=root)
+                for k in range(20):
+                    Area.objects.create(name=f"Leaf {i}-{j}-{k}", parent_area=child)
+        parent = None
+        for i in range(2000 - Area.objects.count()):
+            parent = Area.objects.create(name=f"Chain {i}", parent_area=parent)
+        self.assertEqual(Area.objects.count(), 2000)
+        start = time.perf_counter()
+        with self.assertNumQueries(1):
+            tree = ModelTreeHelper(Area(), "parent_area", "area_children_set", AREA_TREE_ONLY_FIELDS)
+        duration = time.perf_counter() - start
+        self.assertEqual(len(tree.items), 2000)
+        self.assertEqual(len(tree.get_area(parent.id).ancestors), 99)
+        # Previously a few minutes (one query per parent, quadratic descendants), now well under a second
+        self.assertLess(duration, 5)
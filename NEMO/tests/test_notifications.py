@@ -0,0 +1,194 @@
+import math
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from NEMO.context_processors import base_context, get_site_feature_flags
+from NEMO.models import Area, BuddyRequest, News, Notification, SafetyIssue, Tool, User, UserPreferences
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.views.notifications import (
+    NOTIFICATIONS_BATCH_SIZE,
+    create_buddy_request_notification,
+    create_news_notification,
+    create_safety_notification,
+    delete_notification,
+    get_notification_counts,
+    get_notifications,
+)
+
+
+def create_news_story() -> News:
+    now = timezone.now()
+    return News.objects.create(
+        title="Story",
+        created=now,
+        original_content="content",
+        all_content="content",
+        last_updated=now,
+        last_update_content="content",
+        update_count=0,
+    )
+
+
+class NotificationCountsTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        # The test cache is a local memory cache, pretend it is shared between processes
+        shared_cache_patcher = mock.patch("NEMO.views.notifications.is_cache_shared", return_value=True)
+        shared_cache_patcher.start()
+        self.addCleanup(shared_cache_patcher.stop)
+        self.user, self.project = create_user_and_project()
+        self.other_user, self.other_project = create_user_and_project()
+        self.story = create_news_story()
+
+    def test_counts_are_cached(self):
+        self.assertEqual(get_notification_counts(self.user), {})
+        with self.assertNumQueries(0):
+            get_notification_counts(self.user)
+
+    def test_counts_updated_on_create_and_delete(self):
+        self.assertEqual(get_notification_counts(self.user), {})
+        create_news_notification(self.story)
+        self.assertEqual(get_notification_counts(self.user), {Notification.Types.NEWS: 1})
+        self.assertEqual(get_notification_counts(self.other_user), {Notification.Types.NEWS: 1})
+        # Seeing the notifications only clears it for that user
+        get_notifications(self.user, Notification.Types.NEWS)
+        self.assertEqual(get_notification_counts(self.user), {})
+        self.assertEqual(get_notification_counts(self.other_user), {Notification.Types.NEWS: 1})
+        delete_notification(Notification.Types.NEWS, self.story.id)
+        self.assertEqual(get_notification_counts(self.other_user), {})
+
+    def test_counts_not_cached_without_shared_cache(self):
+        with mock.patch("NEMO.views.notifications.is_cache_shared", return_value=False):
+            self.assertEqual(get_notification_counts(self.user), {})
+            # Notifications deleted by another process are seen right away
+            Notification.objects.create(
+                user=self.user,
+                notification_type=Notification.Types.NEWS,
+                content_type=ContentType.objects.get_for_model(self.story),
+                object_id=self.story.id,
+                expiration=timezone.now() + timedelta(days=1),
+            )
+            self.assertEqual(get_notification_counts(self.user), {Notification.Types.NEWS: 1})
+
+
+class NotificationFanOutTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.user, self.project = create_user_and_project()
+        self.staff, self.staff_project = create_user_and_project(is_staff=True)
+
+    def test_existing_notifications_are_updated(self):
+        issue = SafetyIssue.objects.create(reporter=self.user, concern="Concern")
+        create_safety_notification(issue)
+        notification = Notification.objects.get(user=self.staff, notification_type=Notification.Types.SAFETY)
+        notification.expiration = timezone.now()
+        notification.save()
+        create_safety_notification(issue)
+        notifications = Notification.objects.filter(notification_type=Notification.Types.SAFETY)
+        self.assertEqual(list(notifications.values_list("user_id", flat=True)), [self.staff.id])
+        self.assertGreater(notifications.get().expiration, timezone.now() + timedelta(days=29))
+
+    def test_buddy_request_preferences(self):
+        no_notification_user, project = create_user_and_project()
+        no_notification_user.preferences = UserPreferences.objects.create(display_new_buddy_request_notification=False)
+        no_notification_user.save()
+        self.assertIsNone(self.staff.preferences)
+        buddy_request = BuddyRequest.objects.create(
+            start=date.today(),
+            end=date.today(),
+            description="Buddy",
+            area=Area.objects.create(name="Area"),
+            user=self.user,
+        )
+        ContentType.objects.get_for_model(buddy_request)
+        # Users with their preferences, existing notifications and the new ones
+        with self.assertNumQueries(3):
+            create_buddy_request_notification(buddy_request)
+        notifications = Notification.objects.filter(notification_type=Notification.Types.BUDDY_REQUEST)
+        self.assertEqual(list(notifications.values_list("user_id", flat=True)), [self.staff.id])
+
+    def test_delete_notifications(self):
+        story = create_news_story()
+        create_news_notification(story)
+        self.assertEqual(Notification.objects.filter(object_id=story.id).count(), 2)
+        with CaptureQueriesContext(connection) as context:
+            delete_notification(Notification.Types.NEWS, story.id)
+        self.assertEqual([query["sql"].split()[0] for query in context.captured_queries], ["SELECT", "DELETE"])
+        self.assertFalse(Notification.objects.exists())
+
+
+class NotificationFanOutBenchmarkTestCase(NEMOTestCaseMixin, TestCase):
+    def test_10000_users(self):
+        User.objects.bulk_create(
+            User(username=f"user{i}", first_name="User", last_name=f"{i}", email=f"user{i}@example.com")
+            for i in range(10000)
+        )
+        story = create_news_story()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            create_news_notification(story)
+            # Publishing it again replaces the notifications
+            create_news_notification(story)
+        duration = time.perf_counter() - start
+        self.assertEqual(Notification.objects.filter(notification_type=Notification.Types.NEWS).count(), 10000)
+        # Previously one insert per user, now one per batch (SQLite also limits batches to 999 parameters)
+        fields = ["user", "expiration", "notification_type", "content_type", "object_id"]
+        batch_size = min(NOTIFICATIONS_BATCH_SIZE, connection.ops.bulk_batch_size(fields, []))
+        self.assertLessEqual(len(context.captured_queries), 2 * math.ceil(10000 / batch_size) + 10)
+        self.assertLess(duration, 10)
+        with CaptureQueriesContext(connection) as context:
+            delete_notification(Notification.Types.NEWS, story.id)
+        self.assertEqual(len(context.captured_queries), 2)
+
+
+class SiteFeatureFlagsTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        # The test cache is a local memory cache, pretend it is shared between processes
+        shared_cache_patcher = mock.patch("NEMO.context_processors.is_cache_shared", return_value=True)
+        shared_cache_patcher.start()
+        self.addCleanup(shared_cache_patcher.stop)
+
+    def test_flags_are_cached_and_invalidated(self):
+        owner, project = create_user_and_project()
+        self.assertFalse(get_site_feature_flags()["tools_exist"])
+        with self.assertNumQueries(0):
+            get_site_feature_flags()
+        tool = Tool.objects.create(name="test_tool", primary_owner=owner)
+        self.assertTrue(get_site_feature_flags()["tools_exist"])
+        tool.delete()
+        self.assertFalse(get_site_feature_flags()["tools_exist"])
+
+    def test_flags_kept_on_login(self):
+        user, project = create_user_and_project()
+        get_site_feature_flags()
+        user.last_login = timezone.now()
+        user.save(update_fields=["last_login"])
+        with self.assertNumQueries(0):
+            get_site_feature_flags()
+        user.is_facility_manager = True
+        user.save(update_fields=["is_facility_manager"])
+        self.assertTrue(get_site_feature_flags()["facility_managers_exist"])
+
+    def test_flags_not_cached_without_shared_cache(self):
+        owner, project = create_user_and_project()
+        with mock.patch("NEMO.context_processors.is_cache_shared", return_value=False):
+            self.assertFalse(get_site_feature_flags()["tools_exist"])
+            # Tools created by another process are seen right away
+            Tool.objects.bulk_create([Tool(name="test_tool", primary_owner=owner)])
+            self.assertTrue(get_site_feature_flags()["tools_exist"])
+
+    def test_base_context_steady_state(self):
+        user, project = create_user_and_project()
+        request = RequestFactory().get("/")
+        request.session = {}
+        with mock.patch("NEMO.views.notifications.is_cache_shared", return_value=True):
+            for request.user in [AnonymousUser(), user]:
+                base_context(request)
+                with self.assertNumQueries(0):
+                    base_context(request)
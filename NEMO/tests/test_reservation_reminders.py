@@ -0,0 +1,77 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+
+from NEMO.models import Area, AreaAccessRecord, Reservation
+from NEMO.tests.test_utilities import NEMOTestCaseMixin, create_user_and_project
+from NEMO.views.customization import CustomizationBase, EmailsCustomization
+from NEMO.views.timed_services import send_email_reservation_ending_reminders, send_email_reservation_reminders
+
+
+class ReservationRemindersTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        EmailsCustomization.set("user_office_email_address", "user_office@example.com")
+        self.user, self.project = create_user_and_project()
+        self.area = Area.objects.create(name="Cleanroom")
+        AreaAccessRecord.objects.create(
+            area=self.area, customer=self.user, project=self.project, start=self.now - timedelta(hours=3)
+        )
+
+    def create_reservation(self, start, end) -> Reservation:
+        return Reservation.objects.create(
+            user=self.user,
+            creator=self.user,
+            project=self.project,
+            area=self.area,
+            start=start,
+            end=end,
+            short_notice=False,
+        )
+
+    def run_service(self, service, variable, processed_until):
+        CustomizationBase.set(variable, processed_until.isoformat())
+        with mock.patch("django.utils.timezone.now", return_value=self.now):
+            service()
+
+    def test_ending_reminders_catch_up(self):
+        # Reached 30 minutes before its end while the service was not running
+        self.create_reservation(self.now - timedelta(hours=1), self.now + timedelta(minutes=10))
+        self.run_service(
+            send_email_reservation_ending_reminders,
+            "reservation_ending_reminders_processed_until",
+            self.now - timedelta(minutes=25),
+        )
+        self.assertEqual([email.subject for email in mail.outbox], [f"{self.area.name} reservation ending soon"])
+        self.assertEqual(
+            CustomizationBase.get("reservation_ending_reminders_processed_until", use_cache=False),
+            self.now.isoformat(),
+        )
+        # The next run doesn't send it again
+        mail.outbox.clear()
+        with mock.patch("django.utils.timezone.now", return_value=self.now + timedelta(minutes=1)):
+            send_email_reservation_ending_reminders()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_ending_reminders_skip_ended_reservations(self):
+        # Reached 15 minutes before its end 40 minutes ago, and already ended
+        self.create_reservation(self.now - timedelta(hours=1), self.now - timedelta(minutes=25))
+        self.run_service(
+            send_email_reservation_ending_reminders,
+            "reservation_ending_reminders_processed_until",
+            self.now - timedelta(minutes=45),
+        )
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_reminders_catch_up(self):
+        # Reached 2 hours before its start while the service was not running
+        self.create_reservation(self.now + timedelta(minutes=90), self.now + timedelta(hours=3))
+        # Not reached yet
+        self.create_reservation(self.now + timedelta(hours=3), self.now + timedelta(hours=4))
+        self.run_service(
+            send_email_reservation_reminders, "reservation_reminders_processed_until", self.now - timedelta(minutes=45)
+        )
+        self.assertEqual([email.subject for email in mail.outbox], [f"{self.area.name} reservation reminder"])
@@ -1,10 +1,19 @@
+import socket
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
 from smtplib import SMTPConnectError, SMTPDataError, SMTPServerDisconnected, SMTPHeloError
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
+from NEMO.email_outbox import RateLimiter, SerializedMessage, claim_email, send_queued_emails
+from NEMO.models import EmailLog
 from NEMO.tests.test_utilities import NEMOTestCaseMixin
-from NEMO.utilities import send_mail
+from NEMO.utilities import create_email_attachment, email_batch, send_mail
 
 
 class TestSendMailRetries(NEMOTestCaseMixin, TestCase):
@@ -47,3 +56,204 @@ class TestSendMailRetries(NEMOTestCaseMixin, TestCase):
         result = send_mail(self.subject, self.content, self.from_email, self.to, fail_silently=True)
         self.assertEqual(result, 0)
         self.assertEqual(mock_send.call_count, 2)
+
+
+class LocalSMTPServer:
+    """Minimal local SMTP stand-in, counting connections and received messages"""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+        self.server_socket = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server_socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, address = self.server_socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=[connection], daemon=True).start()
+
+    def handle(self, connection: socket.socket):
+        with connection, connection.makefile("rb") as reader:
+            connection.sendall(b"220 localhost ready\r\n")
+            for line in reader:
+                command = line.strip().upper()
+                if command.startswith(b"EHLO") or command.startswith(b"HELO"):
+                    connection.sendall(b"250 localhost\r\n")
+                elif command == b"DATA":
+                    connection.sendall(b"354 go ahead\r\n")
+                    data = b""
+                    for data_line in reader:
+                        if data_line == b".\r\n":
+                            break
+                        data += data_line
+                    self.messages.append(data)
+                    connection.sendall(b"250 OK\r\n")
+                elif command == b"QUIT":
+                    connection.sendall(b"221 bye\r\n")
+                    return
+                else:
+                    connection.sendall(b"250 OK\r\n")
+
+    def close(self):
+        self.server_socket.close()
+
+
+class TestEmailBatch(NEMOTestCaseMixin, TestCase):
+    def send_emails(self, count):
+        with email_batch() as batch:
+            for i in range(count):
+                send_mail(f"Subject {i}", "<p>Content</p>", "test@example.com", [f"recipient{i}@example.com"])
+        return batch
+
+    def test_batch_with_locmem_backend(self):
+        with self.assertNumQueries(1):
+            batch = self.send_emails(5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual([success for email, success in batch.results], [True] * 5)
+        self.assertEqual(EmailLog.objects.filter(ok=True).count(), 5)
+        self.assertEqual(EmailLog.objects.get(subject="Subject 3").to, "recipient3@example.com")
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_batch_size(self):
+        with email_batch() as batch:
+            for i in range(3):
+                send_mail(f"Subject {i}", "<p>Content</p>", "test@example.com", [f"recipient{i}@example.com"])
+            self.assertEqual(len(mail.outbox), 2)
+            # Nested blocks use the same batch
+            with email_batch() as nested_batch:
+                self.assertIs(nested_batch, batch)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(len(batch.results), 3)
+
+    @patch("NEMO.utilities.EmailMessage.send", side_effect=[1, SMTPServerDisconnected(), SMTPServerDisconnected(), 1])
+    def test_batch_per_message_result(self, mock_send):
+        batch = self.send_emails(3)
+        self.assertEqual([success for email, success in batch.results], [True, False, True])
+        self.assertEqual(EmailLog.objects.filter(ok=False).get().subject, "Subject 1")
+
+    @patch("NEMO.utilities.EmailMessage.send", side_effect=SMTPServerDisconnected())
+    def test_batch_not_failing_silently(self, mock_send):
+        with self.assertRaises(SMTPServerDisconnected):
+            with email_batch():
+                send_mail(
+                    "Subject", "<p>Content</p>", "test@example.com", ["recipient@example.com"], fail_silently=False
+                )
+        self.assertFalse(EmailLog.objects.get().ok)
+
+    def test_batch_with_smtp_server(self):
+        server = LocalSMTPServer()
+        try:
+            with self.settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=server.port,
+            ):
+                batch = self.send_emails(10)
+        finally:
+            server.close()
+        self.assertEqual([success for email, success in batch.results], [True] * 10)
+        self.assertEqual(len(server.messages), 10)
+        self.assertEqual(server.connections, 1)
+
+
+class TestEmailOutbox(NEMOTestCaseMixin, TestCase):
+    def queue_email(self, subject="Subject", content="<p>Content é</p>", **kwargs):
+        send_mail(subject, content, "test@example.com", ["recipient@example.com"], enqueue=True, **kwargs)
+        return EmailLog.objects.latest("id")
+
+    def test_enqueue(self):
+        email_log = self.queue_email()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(email_log.queued)
+        self.assertFalse(email_log.ok)
+        self.assertTrue(email_log.message)
+        self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].recipients(), ["recipient@example.com"])
+        email_log.refresh_from_db()
+        self.assertTrue(email_log.ok)
+        self.assertFalse(email_log.queued)
+        self.assertEqual(email_log.attempts, 1)
+        self.assertIsNone(email_log.message)
+        # Nothing left to send
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_serialized_message_line_endings(self):
+        email_log = self.queue_email(content="<p>Page\x0cbreak\u2028line \x1c separators\x85</p>")
+        message = SerializedMessage(email_log.message)
+        self.assertEqual(message.as_string(), email_log.message)
+        self.assertEqual(message.as_bytes(linesep="\r\n"), email_log.message.replace("\n", "\r\n").encode())
+        self.assertIn("Page\x0cbreak\u2028line \x1c separators\x85".encode(), message.as_bytes(linesep="\r\n"))
+
+    @override_settings(EMAIL_OUTBOX_ENABLED=True)
+    def test_outbox_enabled(self):
+        send_mail("Subject", "<p>Content</p>", "test@example.com", ["recipient@example.com"])
+        self.assertTrue(EmailLog.objects.get().queued)
+        send_mail("Subject", "<p>Content</p>", "test@example.com", ["recipient@example.com"], enqueue=False)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailLog.objects.filter(queued=True).count(), 1)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    @patch("NEMO.utilities.EmailMessage.send", side_effect=SMTPServerDisconnected("Disconnected"))
+    def test_retry_with_backoff(self, mock_send):
+        email_log = self.queue_email()
+        self.assertEqual(send_queued_emails(), 0)
+        email_log.refresh_from_db()
+        self.assertTrue(email_log.queued)
+        self.assertFalse(email_log.ok)
+        self.assertEqual(email_log.attempts, 1)
+        self.assertEqual(email_log.last_error, "Disconnected")
+        self.assertGreater(email_log.next_attempt, timezone.now() + timedelta(seconds=50))
+        # Not due yet
+        send_queued_emails()
+        self.assertEqual(EmailLog.objects.get().attempts, 1)
+        EmailLog.objects.update(next_attempt=timezone.now())
+        send_queued_emails()
+        email_log.refresh_from_db()
+        self.assertFalse(email_log.queued)
+        self.assertFalse(email_log.ok)
+        self.assertEqual(email_log.attempts, 2)
+
+    def test_claimed_email_not_sent_twice(self):
+        email_log = self.queue_email()
+        self.assertIsNotNone(claim_email(email_log.id))
+        self.assertIsNone(claim_email(email_log.id))
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_limit_and_order(self):
+        for i in range(3):
+            self.queue_email(f"Subject {i}")
+        self.assertEqual(send_queued_emails(limit=2), 2)
+        self.assertEqual([email.subject for email in mail.outbox], ["Subject 0", "Subject 1"])
+        self.assertEqual(send_queued_emails(), 1)
+
+    def test_rate_limit(self):
+        rate_limiter = RateLimiter(20)
+        start = time.monotonic()
+        for i in range(4):
+            rate_limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_queued_email_with_smtp_server(self):
+        attachment = create_email_attachment(BytesIO(b"attachment content"), "attachment.txt")
+        email_log = self.queue_email(attachments=[attachment])
+        server = LocalSMTPServer()
+        try:
+            with self.settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=server.port,
+            ):
+                self.assertEqual(send_queued_emails(), 1)
+        finally:
+            server.close()
+        self.assertEqual(len(server.messages), 1)
+        self.assertIn(b"Subject: Subject", server.messages[0])
+        self.assertIn(b'filename="attachment.txt"', server.messages[0])
+        email_log.refresh_from_db()
+        self.assertEqual(email_log.attachments, "attachment.txt")
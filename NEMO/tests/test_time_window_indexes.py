@@ -0,0 +1,23 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from NEMO.tests.test_utilities import NEMOTestCaseMixin
+
+
+class TimeWindowIndexesTestCase(NEMOTestCaseMixin, TestCase):
+    def test_explain_time_window_queries(self):
+        out = StringIO()
+        call_command("explain_time_window_queries", "--timing", stdout=out)
+        output = out.getvalue()
+        self.assertIn("Tools in use", output)
+        self.assertIn("row(s) in", output)
+
+    @skipUnless(connection.vendor == "sqlite", "Plans are only checked on SQLite")
+    def test_time_window_queries_use_indexes(self):
+        out = StringIO()
+        call_command("explain_time_window_queries", "--quiet", stdout=out)
+        self.assertIn("0 of 16 queries read whole tables", out.getvalue())
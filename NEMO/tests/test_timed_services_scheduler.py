@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from NEMO.locks import get_lock_backend
+from NEMO.tests.test_utilities import NEMOTestCaseMixin
+from NEMO.timed_services_scheduler import (
+    DAY,
+    DEFAULT_SCHEDULE,
+    TIMED_SERVICES,
+    TimedServicesScheduler,
+    get_last_runs,
+    get_schedule,
+    get_timed_services_metrics,
+)
+from NEMO.views.timed_services import do_cancel_unused_reservations, timed_service, timed_service_lock_name
+
+
+class TimedServicesSchedulerTestCase(NEMOTestCaseMixin, TestCase):
+    def setUp(self):
+        self.minute_service = mock.Mock()
+        self.hour_service = mock.Mock(side_effect=Exception("Service error"))
+        services = {
+            "cancel_unused_reservations": timed_service("cancel_unused_reservations")(self.minute_service),
+            "email_usage_reminders": self.hour_service,
+        }
+        patcher = mock.patch.dict(TIMED_SERVICES, services)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = TimedServicesScheduler({"cancel_unused_reservations": 60, "email_usage_reminders": 3600})
+
+    def test_run_due_services(self):
+        self.assertEqual(self.scheduler.run_pending(), ["cancel_unused_reservations", "email_usage_reminders"])
+        self.assertEqual(self.scheduler.run_pending(), [])
+        self.assertEqual(self.minute_service.call_count, 1)
+        # A minute later, only the first service is due
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual(self.scheduler.due_services(later), ["cancel_unused_reservations"])
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            self.assertEqual(self.scheduler.run_pending(), ["cancel_unused_reservations"])
+        self.assertEqual(self.minute_service.call_count, 2)
+        self.assertEqual(self.hour_service.call_count, 1)
+
+    def test_metrics(self):
+        self.scheduler.run_pending()
+        metrics = get_timed_services_metrics()
+        self.assertEqual(metrics["cancel_unused_reservations"]["runs"], 1)
+        self.assertEqual(metrics["cancel_unused_reservations"]["failures"], 0)
+        self.assertIsNone(metrics["cancel_unused_reservations"]["last_error"])
+        self.assertGreaterEqual(metrics["cancel_unused_reservations"]["last_duration"], 0)
+        # Failures are recorded, and the service is not run again before its interval
+        self.assertEqual(metrics["email_usage_reminders"]["failures"], 1)
+        self.assertEqual(metrics["email_usage_reminders"]["last_error"], "Service error")
+        self.assertNotIn("email_usage_reminders", self.scheduler.due_services(timezone.now()))
+        output = StringIO()
+        call_command("run_timed_services", "--metrics", stdout=output)
+        self.assertIn("email_usage_reminders: last run", output.getvalue())
+        self.assertIn("last error: Service error", output.getvalue())
+
+    def test_leader_and_overlap(self):
+        lock_backend = get_lock_backend()
+        # Another scheduler is the leader
+        lock_backend.acquire(TimedServicesScheduler.LEADER_LOCK_NAME, 0)
+        try:
+            self.assertEqual(self.scheduler.run_pending(), [])
+        finally:
+            lock_backend.release(TimedServicesScheduler.LEADER_LOCK_NAME)
+        # The service is still running from somewhere else
+        lock_backend.acquire(timed_service_lock_name("cancel_unused_reservations"), 0)
+        try:
+            self.assertEqual(self.scheduler.run_pending(), ["email_usage_reminders"])
+            # Its url and management command are skipped too
+            self.assertEqual(do_cancel_unused_reservations().status_code, 409)
+        finally:
+            lock_backend.release(timed_service_lock_name("cancel_unused_reservations"))
+        self.minute_service.assert_not_called()
+        self.assertNotIn("cancel_unused_reservations", get_timed_services_metrics())
+        self.assertEqual(self.scheduler.run_pending(), ["cancel_unused_reservations"])
+        self.assertEqual(do_cancel_unused_reservations().status_code, 200)
+
+    def test_schedule_settings(self):
+        self.assertEqual(set(DEFAULT_SCHEDULE), set(TIMED_SERVICES))
+        with override_settings(TIMED_SERVICES_SCHEDULE={"cancel_unused_reservations": 300, "auto_logout_users": None}):
+            schedule = get_schedule()
+            self.assertEqual(schedule["cancel_unused_reservations"], 300)
+            self.assertNotIn("auto_logout_users", schedule)
+        with override_settings(TIMED_SERVICES_SCHEDULE={"unknown_service": 60}):
+            self.assertRaises(ValueError, get_schedule)
+
+    def test_service_arguments(self):
+        with override_settings(TIMED_SERVICES_ARGUMENTS={"email_usage_reminders": {"projects_to_exclude": [1, 2]}}):
+            TimedServicesScheduler({"cancel_unused_reservations": 60, "email_usage_reminders": 3600}).run_pending()
+        self.hour_service.assert_called_once_with(projects_to_exclude=[1, 2])
+        self.minute_service.assert_called_once_with()
+        with override_settings(TIMED_SERVICES_ARGUMENTS={"unknown_service": {}}):
+            self.assertRaises(ValueError, TimedServicesScheduler)
+
+    def test_command_once(self):
+        schedule = {name: None for name in DEFAULT_SCHEDULE}
+        schedule["cancel_unused_reservations"] = 60
+        output, errors = StringIO(), StringIO()
+        with override_settings(TIMED_SERVICES_SCHEDULE=schedule):
+            call_command("run_timed_services", "--once", stdout=output, stderr=errors)
+        self.assertEqual(output.getvalue().strip(), "Ran 1 timed service(s): cancel_unused_reservations")
+        self.minute_service.assert_called_once()
+        # The default lock backend doesn't exclude other scheduler processes
+        self.assertIn("in-process lock backend", errors.getvalue())
+
+    def test_last_runs_survive_restarts(self):
+        self.scheduler.run_pending()
+        self.assertEqual(set(get_last_runs()), {"cancel_unused_reservations", "email_usage_reminders"})
+        # A new scheduler doesn't run the services again
+        scheduler = TimedServicesScheduler({"cancel_unused_reservations": 60, "email_usage_reminders": 3600})
+        self.assertEqual(scheduler.run_pending(), [])
+        self.assertEqual(self.minute_service.call_count, 1)
+        self.assertEqual(self.hour_service.call_count, 1)
+
+    def test_daily_time(self):
+        scheduler = TimedServicesScheduler({"cancel_unused_reservations": 60, "email_usage_reminders": DAY}, "06:00")
+        last_start = timezone.make_aware(datetime(2024, 3, 1, 9, 15))
+        self.assertEqual(
+            scheduler.next_run("email_usage_reminders", last_start), timezone.make_aware(datetime(2024, 3, 2, 6))
+        )
+        # A run delayed until just before the next slot is still followed by that slot
+        last_start = timezone.make_aware(datetime(2024, 3, 2, 5, 59))
+        self.assertEqual(
+            scheduler.next_run("email_usage_reminders", last_start), timezone.make_aware(datetime(2024, 3, 2, 6))
+        )
+        self.assertEqual(
+            scheduler.next_run("cancel_unused_reservations", last_start), last_start + timedelta(minutes=1)
+        )
+        self.assertRaises(ValueError, TimedServicesScheduler, {}, "6 o'clock")
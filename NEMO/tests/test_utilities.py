@@ -2,11 +2,13 @@ from typing import List, Tuple
 
 from django.apps import apps
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import connection, models
 from django.test import Client, TestCase
 from requests import Response
 
+from NEMO.model_tree import AreaTreeCache
 from NEMO.models import Account, Project, User
 from NEMO.views.customization import CustomizationBase
 
@@ -50,8 +52,10 @@ class NEMOTestCaseMixin:
     """
 
     def tearDown(self):
-        # Clear the cache after each test case execution
+        # Clear the caches after each test case execution
         CustomizationBase.invalidate_cache()
+        AreaTreeCache.invalidate()
+        cache.clear()
         # Make sure to call the parent tearDown method to preserve functionality
         super().tearDown()
 
@@ -0,0 +1,217 @@
+import json
+import time
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from logging import getLogger
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from NEMO.locks import InProcessLockBackend, get_lock_backend
+from NEMO.views import timed_services
+from NEMO.views.customization import CustomizationBase
+
+scheduler_logger = getLogger(__name__)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Functions run by the scheduler, by service name (the same as the timed services url names)
+TIMED_SERVICES: Dict[str, Callable] = {
+    "auto_logout_users": timed_services.do_auto_logout_users,
+    "cancel_unused_reservations": timed_services.do_cancel_unused_reservations,
+    "check_and_update_wait_list": timed_services.do_check_and_update_wait_list,
+    "create_closure_alerts": timed_services.do_create_closure_alerts,
+    "deactivate_access_expired_users": timed_services.do_deactivate_access_expired_users,
+    "email_out_of_time_reservation_notification": timed_services.send_email_out_of_time_reservation_notification,
+    "email_reservation_ending_reminders": timed_services.send_email_reservation_ending_reminders,
+    "email_reservation_reminders": timed_services.send_email_reservation_reminders,
+    "email_scheduled_outage_reminders": timed_services.send_email_scheduled_outage_reminders,
+    "email_usage_reminders": timed_services.send_email_usage_reminders,
+    "email_user_access_expiration_reminders": timed_services.send_email_user_access_expiration_reminders,
+    "email_weekend_access_notification": timed_services.send_email_weekend_access_notification,
+    "manage_recurring_charges": timed_services.do_manage_recurring_charges,
+    "manage_tool_qualifications": timed_services.do_manage_tool_qualifications,
+}
+
+# Default interval (in seconds) between runs of each service, as recommended for the management commands
+DEFAULT_SCHEDULE: Dict[str, Optional[int]] = {
+    "auto_logout_users": MINUTE,
+    "cancel_unused_reservations": MINUTE,
+    "check_and_update_wait_list": MINUTE,
+    "create_closure_alerts": DAY,
+    "deactivate_access_expired_users": DAY,
+    "email_out_of_time_reservation_notification": MINUTE,
+    "email_reservation_ending_reminders": 15 * MINUTE,
+    "email_reservation_reminders": 15 * MINUTE,
+    "email_scheduled_outage_reminders": DAY,
+    "email_usage_reminders": HOUR,
+    "email_user_access_expiration_reminders": DAY,
+    "email_weekend_access_notification": HOUR,
+    "manage_recurring_charges": DAY,
+    "manage_tool_qualifications": DAY,
+}
+
+
+# Local time of day at which the services running daily (or less often) are run
+TIMED_SERVICES_DAILY_TIME = getattr(settings, "TIMED_SERVICES_DAILY_TIME", "00:00")
+
+# Customization variable holding the start of the last run of each service
+LAST_RUNS_VARIABLE = "timed_services_last_runs"
+# Customization variable holding the run durations and errors of each service
+METRICS_VARIABLE = "timed_services_metrics"
+
+
+def get_schedule() -> Dict[str, int]:
+    """Returns the interval of each enabled service, with TIMED_SERVICES_SCHEDULE overriding the defaults"""
+    schedule = {**DEFAULT_SCHEDULE, **getattr(settings, "TIMED_SERVICES_SCHEDULE", {})}
+    for name in schedule:
+        if name not in TIMED_SERVICES:
+            raise ValueError(f"Unknown timed service in TIMED_SERVICES_SCHEDULE: {name}")
+    return {name: interval for name, interval in schedule.items() if interval}
+
+
+def get_service_arguments() -> Dict[str, Dict]:
+    """Returns the keyword arguments each service is called with, from TIMED_SERVICES_ARGUMENTS"""
+    arguments = getattr(settings, "TIMED_SERVICES_ARGUMENTS", {})
+    for name in arguments:
+        if name not in TIMED_SERVICES:
+            raise ValueError(f"Unknown timed service in TIMED_SERVICES_ARGUMENTS: {name}")
+    return arguments
+
+
+def get_last_runs() -> Dict[str, datetime]:
+    """Returns the start of the last run of each service, persisted in the database so it survives restarts"""
+    last_runs = CustomizationBase.get(LAST_RUNS_VARIABLE, use_cache=False)
+    return {name: parse_datetime(start) for name, start in json.loads(last_runs).items()} if last_runs else {}
+
+
+def get_timed_services_metrics() -> Dict[str, Dict]:
+    """
+    Returns the last run and the durations of each service run by the scheduler, by service name.
+    They are saved in the database, so they can be read from any process.
+    """
+    metrics = CustomizationBase.get(METRICS_VARIABLE, use_cache=False)
+    metrics = json.loads(metrics) if metrics else {}
+    for service_metrics in metrics.values():
+        service_metrics["last_start"] = parse_datetime(service_metrics["last_start"])
+    return metrics
+
+
+class TimedServicesScheduler:
+    """
+    Runs the timed services at their configured intervals, one after the other in this process.
+    Services running daily (or less often) are run at TIMED_SERVICES_DAILY_TIME.
+    Only one scheduler runs the services at a time: the one holding the leader lock. This requires a lock backend
+    shared between processes (see SYNCHRONIZED_LOCK_BACKEND), the default in-process backend only excludes threads.
+    A service that is still running (from its url or its management command for example) is skipped until the next
+    tick, each service holding its own lock while running (see NEMO.views.timed_services.timed_service).
+    The last run of each service is saved in the database, so restarting or replacing a scheduler doesn't run
+    the services again before they are due.
+    """
+
+    LEADER_LOCK_NAME = "NEMO_timed_services_scheduler"
+
+    def __init__(self, schedule: Dict[str, int] = None, daily_time: str = None):
+        self.schedule = get_schedule() if schedule is None else schedule
+        self.arguments = get_service_arguments()
+        self.daily_time = parse_time(daily_time or TIMED_SERVICES_DAILY_TIME)
+        if self.daily_time is None:
+            raise ValueError(f"Invalid TIMED_SERVICES_DAILY_TIME: {daily_time or TIMED_SERVICES_DAILY_TIME}")
+        self.lock_backend = get_lock_backend()
+
+    def excludes_other_processes(self) -> bool:
+        return not isinstance(self.lock_backend, InProcessLockBackend)
+
+    def next_run(self, name: str, last_start: datetime) -> datetime:
+        interval = timedelta(seconds=self.schedule[name])
+        if self.schedule[name] < DAY:
+            return last_start + interval
+        # Daily services are due at the chosen time, whenever they actually ran
+        last_start = timezone.localtime(last_start)
+        slot = last_start.replace(
+            hour=self.daily_time.hour, minute=self.daily_time.minute, second=self.daily_time.second, microsecond=0
+        )
+        if slot > last_start:
+            slot -= timedelta(days=1)
+        return slot + interval
+
+    def due_services(self, now: datetime) -> List[str]:
+        last_runs = get_last_runs()
+        return [name for name in self.schedule if name not in last_runs or now >= self.next_run(name, last_runs[name])]
+
+    def run_pending(self) -> List[str]:
+        """Runs the services that are due if this scheduler is the leader, and returns their names"""
+        # Start each tick with a usable database connection (closed if broken or older than CONN_MAX_AGE)
+        close_old_connections()
+        if not self.lock_backend.acquire(self.LEADER_LOCK_NAME, 0):
+            return []
+        try:
+            return [name for name in self.due_services(timezone.now()) if self.run_service(name)]
+        finally:
+            self.lock_backend.release(self.LEADER_LOCK_NAME)
+
+    def run_service(self, name: str) -> bool:
+        start, start_time = timezone.now(), time.monotonic()
+        previous_start = get_last_runs().get(name)
+        error = None
+        try:
+            # Saved before running, so a service that brings the process down is not run again on restart
+            self.save_last_run(name, start)
+            response = TIMED_SERVICES[name](**self.arguments.get(name, {}))
+        except Exception as e:
+            error = str(e)
+            scheduler_logger.exception(f"Timed service {name} failed")
+        else:
+            if isinstance(response, HttpResponse) and response.status_code == HTTPStatus.CONFLICT:
+                # Still running from somewhere else, so it is still due at the next tick
+                self.save_last_run(name, previous_start)
+                return False
+        duration = time.monotonic() - start_time
+        self.record_run(name, start, duration, error)
+        if duration > self.schedule.get(name, duration):
+            scheduler_logger.warning(
+                f"Timed service {name} took {duration:.1f}s, longer than its {self.schedule[name]}s interval"
+            )
+        else:
+            scheduler_logger.debug(f"Timed service {name} ran in {duration:.3f}s")
+        return True
+
+    def save_last_run(self, name: str, start: Optional[datetime]):
+        last_runs = {service: last_start.isoformat() for service, last_start in get_last_runs().items()}
+        if start:
+            last_runs[name] = start.isoformat()
+        else:
+            last_runs.pop(name, None)
+        CustomizationBase.set_without_invalidation(LAST_RUNS_VARIABLE, json.dumps(last_runs))
+
+    def record_run(self, name: str, start: datetime, duration: float, error: Optional[str]):
+        metrics = get_timed_services_metrics()
+        service_metrics = metrics.get(name, {"runs": 0, "failures": 0, "total_duration": 0.0, "max_duration": 0.0})
+        service_metrics["runs"] += 1
+        service_metrics["failures"] += 1 if error else 0
+        service_metrics["total_duration"] += duration
+        service_metrics["max_duration"] = max(service_metrics["max_duration"], duration)
+        service_metrics["last_start"] = start
+        service_metrics["last_duration"] = duration
+        service_metrics["last_error"] = error
+        metrics[name] = service_metrics
+        for service_metrics in metrics.values():
+            service_metrics["last_start"] = service_metrics["last_start"].isoformat()
+        CustomizationBase.set_without_invalidation(METRICS_VARIABLE, json.dumps(metrics))
+
+    def run_forever(self, tick: float = 10):
+        if not self.excludes_other_processes():
+            scheduler_logger.warning(
+                "The in-process lock backend doesn't prevent other schedulers from running the same services, "
+                "only run one scheduler process or set SYNCHRONIZED_LOCK_BACKEND to a backend shared between processes"
+            )
+        scheduler_logger.info(f"Running timed services: {', '.join(self.schedule)}")
+        while True:
+            self.run_pending()
+            time.sleep(tick)
@@ -0,0 +1,156 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db.models import Q
+from django.utils import timezone
+
+from NEMO.models import Resource, ScheduledOutage, Task, Tool, UnplannedOutage, UsageEvent
+
+
+class ToolStatus:
+    """Status of a tool, as given by Tool.problems(), Tool.get_current_usage_event(), Tool.scheduled_outages() etc."""
+
+    def __init__(self, tool: Tool):
+        self.tool = tool
+        self.problems: List[Task] = []
+        self.current_usage_event: Optional[UsageEvent] = None
+        self.delayed_logoff_in_progress = False
+        self.outages: List[ScheduledOutage] = []
+        self.partial_outages: List[ScheduledOutage] = []
+        self.unavailable_required_resources: List[Resource] = []
+        self.unavailable_nonrequired_resources: List[Resource] = []
+        self.non_operational_since = None
+        self.required_resources_unavailable_since = None
+        self.optional_resources_unavailable_since = None
+
+    @property
+    def in_use(self) -> bool:
+        return self.current_usage_event is not None
+
+    @property
+    def problematic(self) -> bool:
+        return bool(self.problems)
+
+    @property
+    def problematic_since(self):
+        return min((problem.creation_time for problem in self.problems), default=None)
+
+
+class ToolStatusHelper:
+    """
+    Helper class to get the status of many tools at once.
+    Problems, usage, outages and resources of all the tools are retrieved in a fixed number of queries
+    and grouped by tool id, instead of running each Tool method for every tool.
+    """
+
+    def __init__(self, tools: Iterable[Tool]):
+        now = timezone.now()
+        self.tools: List[Tool] = list(tools)
+        self.statuses: Dict[int, ToolStatus] = {tool.id: ToolStatus(tool) for tool in self.tools}
+        tool_or_parent_ids = {tool.tool_or_parent_id() for tool in self.tools}
+
+        children_ids: Dict[int, List[int]] = defaultdict(list)
+        for tool_id, parent_tool_id in Tool.objects.filter(parent_tool__isnull=False).values_list(
+            "id", "parent_tool_id"
+        ):
+            children_ids[parent_tool_id].append(tool_id)
+        self.parent_ids: Set[int] = set(children_ids)
+
+        # Problems are on the parent tool
+        problems: Dict[int, List[Task]] = defaultdict(list)
+        tasks = Task.objects.filter(resolved=False, cancelled=False, tool_id__in=tool_or_parent_ids)
+        for task in tasks.only("tool_id", "problem_description", "creation_time").order_by("creation_time"):
+            problems[task.tool_id].append(task)
+
+        # Usage is shared by a parent tool and its children
+        current_usage_events: Dict[int, UsageEvent] = {}
+        delayed_logoff_tool_ids = set()
+        usage_events = UsageEvent.objects.filter(Q(end=None) | Q(end__gt=now)).order_by("start")
+        for usage_event in usage_events.select_related("user", "operator", "tool"):
+            if usage_event.end is None:
+                current_usage_events.setdefault(usage_event.tool_id, usage_event)
+            else:
+                delayed_logoff_tool_ids.add(usage_event.tool_id)
+
+        outages = ScheduledOutage.objects.filter(start__lte=now, end__gt=now).filter(
+            Q(tool_id__in=tool_or_parent_ids) | Q(resource__isnull=False)
+        )
+        outages = list(outages.only("tool_id", "resource_id", "title", "start").order_by("start"))
+        unavailable_resources = list(Resource.objects.filter(available=False).only("name").order_by("name"))
+        resource_ids = {outage.resource_id for outage in outages if outage.resource_id}
+        resource_ids.update(resource.id for resource in unavailable_resources)
+        fully_dependent_tool_ids = self.dependent_tool_ids(Resource.fully_dependent_tools.through, resource_ids)
+        partially_dependent_tool_ids = self.dependent_tool_ids(Resource.partially_dependent_tools.through, resource_ids)
+
+        unplanned_outages_since: Dict[str, Dict[int, object]] = {"tool_id": {}, "resource_id": {}}
+        for unplanned_outage in UnplannedOutage.objects.filter(end=None).only("tool_id", "resource_id", "start"):
+            for key in unplanned_outages_since:
+                if getattr(unplanned_outage, key):
+                    since = unplanned_outages_since[key]
+                    item_id = getattr(unplanned_outage, key)
+                    since[item_id] = min(since.get(item_id, unplanned_outage.start), unplanned_outage.start)
+
+        for tool in self.tools:
+            status = self.statuses[tool.id]
+            tool_or_parent_id = tool.tool_or_parent_id()
+            family_ids = [
+                *children_ids.get(tool.id, []),
+                *([tool.parent_tool_id] if tool.parent_tool_id else []),
+                tool.id,
+            ]
+            status.problems = problems.get(tool_or_parent_id, [])
+            status.current_usage_event = next(
+                (current_usage_events[tool_id] for tool_id in family_ids if tool_id in current_usage_events), None
+            )
+            status.delayed_logoff_in_progress = any(tool_id in delayed_logoff_tool_ids for tool_id in family_ids)
+            status.outages = [
+                outage
+                for outage in outages
+                if outage.tool_id == tool_or_parent_id
+                or tool_or_parent_id in fully_dependent_tool_ids.get(outage.resource_id, ())
+            ]
+            status.partial_outages = [
+                outage
+                for outage in outages
+                if tool_or_parent_id in partially_dependent_tool_ids.get(outage.resource_id, ())
+            ]
+            status.unavailable_required_resources = [
+                resource
+                for resource in unavailable_resources
+                if tool_or_parent_id in fully_dependent_tool_ids.get(resource.id, ())
+            ]
+            status.unavailable_nonrequired_resources = [
+                resource
+                for resource in unavailable_resources
+                if tool_or_parent_id in partially_dependent_tool_ids.get(resource.id, ())
+            ]
+            resource_since = unplanned_outages_since["resource_id"]
+            status.non_operational_since = unplanned_outages_since["tool_id"].get(tool.id)
+            status.required_resources_unavailable_since = min(
+                (resource_since[r.id] for r in status.unavailable_required_resources if r.id in resource_since),
+                default=None,
+            )
+            status.optional_resources_unavailable_since = min(
+                (resource_since[r.id] for r in status.unavailable_nonrequired_resources if r.id in resource_since),
+                default=None,
+            )
+
+    @staticmethod
+    def dependent_tool_ids(through_model, resource_ids) -> Dict[int, Set[int]]:
+        tool_ids = defaultdict(set)
+        if resource_ids:
+            for resource_id, tool_id in through_model.objects.filter(resource_id__in=resource_ids).values_list(
+                "resource_id", "tool_id"
+            ):
+                tool_ids[resource_id].add(tool_id)
+        return tool_ids
+
+    def get(self, tool: Tool) -> ToolStatus:
+        return self.statuses[tool.id]
+
+    def name_or_child_in_use_name(self, tool: Tool) -> str:
+        """Same as Tool.name_or_child_in_use_name without any query"""
+        status = self.get(tool)
+        if tool.id in self.parent_ids and status.in_use:
+            return status.current_usage_event.tool.name
+        return tool.name
@@ -5,6 +5,7 @@ import importlib
 import os
 import warnings
 from calendar import monthrange
+from contextlib import contextmanager
 from copy import deepcopy
 from datetime import date, datetime, time, timedelta, timezone
 from email import encoders
@@ -14,6 +15,7 @@ from io import BytesIO, StringIO
 from logging import getLogger
 from smtplib import SMTPServerDisconnected, SMTPResponseException
 from string import Formatter
+from threading import local
 from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TYPE_CHECKING, Tuple, Union
 from urllib.parse import urljoin, urlparse
 
@@ -25,11 +27,14 @@ from django.conf import global_settings, settings
 from django.contrib.admin import ModelAdmin
 from django.contrib.auth import get_permission_codename
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
 from django.db import OperationalError, ProgrammingError
 from django.db.models import FileField, IntegerChoices, Model, QuerySet
 from django.http import HttpRequest, HttpResponse, QueryDict
@@ -348,6 +353,14 @@ def quiet_int(value_to_convert, default_upon_failure=0):
     return result
 
 
+def is_cache_shared(alias: str = DEFAULT_CACHE_ALIAS) -> bool:
+    """
+    Return whether the given Django cache is shared between processes.
+    The local memory cache (Django's default when CACHES is not set) and the dummy cache are not.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
 def parse_parameter_string(
     parameter_dictionary, parameter_key, maximum_length=3000, raise_on_error=False, default_return=""
 ):
@@ -624,7 +637,15 @@ def send_mail(
     attachments=None,
     email_category: EmailCategory = EmailCategory.GENERAL,
     fail_silently=True,
+    enqueue: bool = None,
 ) -> int:
+    """
+    Sends an email and logs it. Returns the number of emails sent.
+    When called inside an email_batch() block, the email is added to the batch and sent when the batch is, so 0 is
+    returned and the result is available in the batch results instead.
+    When enqueue is True (defaults to EMAIL_OUTBOX_ENABLED), the email is only added to the outbox and 0 is returned.
+    It will be sent by the send_queued_emails command.
+    """
     try:
         clean_to = filter(None, remove_duplicates(to))
         clean_bcc = filter(None, remove_duplicates(bcc))
@@ -652,20 +673,16 @@ def send_mail(
     mail.content_subtype = "html"
     msg_sent = 0
     if mail.recipients():
+        if enqueue or enqueue is None and getattr(settings, "EMAIL_OUTBOX_ENABLED", False):
+            queue_email(mail, email_category, fail_silently)
+            return msg_sent
+        batch = EmailBatch.current()
+        if batch:
+            batch.add(mail, email_category, fail_silently)
+            return msg_sent
         email_record = create_email_log(mail, email_category)
         try:
-            # retry once if we get one of the connection errors
-            for i in range(2):
-                try:
-                    msg_sent = mail.send()
-                    break
-                except (SMTPResponseException, SMTPServerDisconnected) as e:
-                    if i == 0:
-                        utilities_logger.exception(str(e))
-                        utilities_logger.warning(f"Email sending got an error, retrying once")
-                    else:
-                        utilities_logger.warning(f"Retrying didn't work")
-                        raise
+            msg_sent = send_email_message(mail)
         except Exception as e:
             email_record.ok = False
             if not fail_silently:
@@ -677,16 +694,133 @@ def send_mail(
     return msg_sent
 
 
-def create_email_log(email: EmailMessage, email_category: EmailCategory):
+def queue_email(mail: EmailMessage, email_category: EmailCategory, fail_silently=True):
+    """Adds the email to the outbox, storing the serialized message in its email log"""
+    email_record = create_email_log(mail, email_category, save=False)
+    # Only set once the email has actually been sent
+    email_record.ok = False
+    try:
+        email_record.message = mail.message().as_string()
+        email_record.queued = True
+        email_record.next_attempt = django_timezone.now()
+    except Exception as e:
+        email_record.last_error = str(e)
+        if not fail_silently:
+            raise
+        else:
+            utilities_logger.error(e)
+    finally:
+        email_record.save()
+
+
+def send_email_message(mail: EmailMessage) -> int:
+    # retry once if we get one of the connection errors
+    for i in range(2):
+        try:
+            if i and mail.connection:
+                # Reopen the connection explicitly, so it stays open for the next messages
+                mail.connection.open()
+            return mail.send()
+        except (SMTPResponseException, SMTPServerDisconnected) as e:
+            if i == 0:
+                utilities_logger.exception(str(e))
+                utilities_logger.warning(f"Email sending got an error, retrying once")
+                if mail.connection:
+                    mail.connection.close()
+            else:
+                utilities_logger.warning(f"Retrying didn't work")
+                raise
+
+
+class EmailBatch:
+    """
+    Collects the emails sent with send_mail in an email_batch() block, and sends them using a single connection
+    every EMAIL_BATCH_SIZE emails and at the end of the block. Email logs are created in bulk.
+    The result of each email is available in results, as (email, success) tuples, once it has been sent.
+    """
+
+    _local = local()
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or getattr(settings, "EMAIL_BATCH_SIZE", 100)
+        self.pending: List[Tuple[EmailMessage, Any, bool]] = []
+        self.results: List[Tuple[EmailMessage, bool]] = []
+
+    @classmethod
+    def current(cls) -> Optional[EmailBatch]:
+        return getattr(cls._local, "batch", None)
+
+    def add(self, mail: EmailMessage, email_category: EmailCategory, fail_silently=True):
+        self.pending.append((mail, create_email_log(mail, email_category, save=False), fail_silently))
+        if len(self.pending) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        from NEMO.models import EmailLog
+
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        error = None
+        connection = get_connection()
+        try:
+            # Open the connection now, so it is kept open between messages
+            connection.open()
+        except Exception as e:
+            utilities_logger.error(e)
+        try:
+            for mail, email_record, fail_silently in pending:
+                mail.connection = connection
+                try:
+                    email_record.ok = bool(send_email_message(mail))
+                except Exception as e:
+                    email_record.ok = False
+                    utilities_logger.error(e)
+                    if not fail_silently and error is None:
+                        error = e
+                self.results.append((mail, email_record.ok))
+        finally:
+            connection.close()
+            EmailLog.objects.bulk_create([email_record for mail, email_record, fail_silently in pending])
+        if error is not None:
+            raise error
+
+
+@contextmanager
+def email_batch(batch_size: int = None) -> Iterator[EmailBatch]:
+    """
+    Context manager sending the emails from send_mail in batches, reusing the same connection.
+    For example:
+    with email_batch():
+        for user in users:
+            user.email_user(...)
+    Nested blocks use the outer batch.
+    """
+    batch = EmailBatch.current()
+    if batch:
+        yield batch
+        return
+    batch = EmailBatch(batch_size)
+    EmailBatch._local.batch = batch
+    try:
+        yield batch
+    finally:
+        EmailBatch._local.batch = None
+        batch.send()
+
+
+def create_email_log(email: EmailMessage, email_category: EmailCategory, save=True):
     from NEMO.models import EmailLog
 
-    email_record: EmailLog = EmailLog.objects.create(
+    email_record: EmailLog = EmailLog(
         category=email_category,
         sender=email.from_email,
         to=", ".join(email.recipients()),
         subject=email.subject,
         content=email.body,
     )
+    if save:
+        email_record.save()
     if email.attachments:
         email_attachments = []
         for attachment in email.attachments:
@@ -35,7 +35,12 @@ from NEMO.views.customization import (
     UserRequestsCustomization,
     get_media_file_contents,
 )
-from NEMO.views.notifications import create_access_request_notification, delete_notification, get_notifications
+from NEMO.views.notifications import (
+    create_access_request_notification,
+    delete_notification,
+    get_notifications,
+    invalidate_notification_counts,
+)
 
 access_request_logger = getLogger(__name__)
 
@@ -79,9 +84,11 @@ def access_requests(request):
     }
 
     # Delete notifications for seen requests
-    Notification.objects.filter(
+    deleted, _ = Notification.objects.filter(
         user=request.user, notification_type=Notification.Types.TEMPORARY_ACCESS_REQUEST, object_id__in=my_requests
     ).delete()
+    if deleted:
+        invalidate_notification_counts([request.user.id])
     return render(request, "requests/access_requests/access_requests.html", dictionary)
 
 
@@ -9,6 +9,7 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, QueryDict
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_GET, require_POST, require_http_methods
 
@@ -367,9 +368,9 @@ def get_charges_for_project_and_user(
     if not dictionary.get("end"):
         dictionary["end"] = datetime.now().strftime(date_input_format)
     charges = get_billing_charges(dictionary)
-    charge_classes = [ct.model_class() for ct in form.cleaned_data.get("charge_types", [])]
+    charge_type_ids = [ct.id for ct in form.cleaned_data.get("charge_types", [])]
     # filter charges by type
-    charges = [charge for charge in charges if isinstance(charge.item, tuple(charge_classes))]
+    charges = [charge for charge in charges if charge.item_content_type_id in charge_type_ids]
     # filter charges by checked ones
     if filter_selected and "confirm" in params:
         charges = [c for c in charges if f"{c.item_content_type_id}_{c.item_id}" in params.getlist("selected_charges")]
@@ -397,10 +398,12 @@ def do_transfer_charges(charges: List[BillableItem], new_project_id: int):
             staff_charge_ids.append(charge.item_id)
         elif charge.type == "training_session":
             training_session_ids.append(charge.item_id)
-    UsageEvent.objects.filter(id__in=usage_event_ids).update(project_id=new_project_id)
-    AreaAccessRecord.objects.filter(id__in=area_access_record_ids).update(project_id=new_project_id)
+    # Update the last updated time as well, since update() doesn't do it
+    now = timezone.now()
+    UsageEvent.objects.filter(id__in=usage_event_ids).update(project_id=new_project_id, last_updated=now)
+    AreaAccessRecord.objects.filter(id__in=area_access_record_ids).update(project_id=new_project_id, last_updated=now)
     ConsumableWithdraw.objects.filter(id__in=consumable_withdrawal_ids).update(project_id=new_project_id)
-    Reservation.objects.filter(id__in=missed_reservation_ids).update(project_id=new_project_id)
+    Reservation.objects.filter(id__in=missed_reservation_ids).update(project_id=new_project_id, last_updated=now)
     StaffCharge.objects.filter(id__in=staff_charge_ids).update(project_id=new_project_id)
     TrainingSession.objects.filter(id__in=training_session_ids).update(project_id=new_project_id)
 
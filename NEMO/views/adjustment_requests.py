@@ -45,6 +45,7 @@ from NEMO.views.notifications import (
     create_request_message_notification,
     delete_notification,
     get_notifications,
+    invalidate_notification_counts,
 )
 from NEMO.views.pagination import SortedPaginator
 
@@ -145,9 +146,11 @@ def adjustment_requests(request, status: int):
     }
 
     # Delete notifications for seen requests
-    Notification.objects.filter(
+    deleted, _ = Notification.objects.filter(
         user=request.user, notification_type=Notification.Types.ADJUSTMENT_REQUEST, object_id__in=my_requests
     ).delete()
+    if deleted:
+        invalidate_notification_counts([request.user.id])
     return render(request, "requests/adjustment_requests/adjustment_requests.html", dictionary)
 
 
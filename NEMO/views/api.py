@@ -1,13 +1,22 @@
 import mimetypes
 import platform
 from importlib import metadata
+from typing import List
 from urllib.parse import unquote
 
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.storage import default_storage
 from django.db import transaction
-from django.http import FileResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound
+from django.http import (
+    FileResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotFound,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.safestring import mark_safe
 from drf_excel.mixins import XLSXFileMixin
 from rest_framework import mixins, status, viewsets
@@ -66,7 +75,9 @@ from NEMO.models import (
     UserDocuments,
     UserPreferences,
 )
-from NEMO.rest_pagination import NEMOPageNumberPagination
+from NEMO.renderers import CSVRenderer, csv_stream, json_stream, xlsx_file
+from NEMO.rest_pagination import NEMOCursorPagination, NEMOPageNumberPagination
+from NEMO.rest_query_planner import columns_requested, plan_queryset
 from NEMO.serializers import (
     AccountSerializer,
     AccountTypeSerializer,
@@ -120,7 +131,7 @@ from NEMO.serializers import (
     UserSerializer,
 )
 from NEMO.templatetags.custom_tags_and_filters import app_version
-from NEMO.typing import QuerySetType
+from NEMO.tool_status import ToolStatusHelper
 from NEMO.utilities import export_format_datetime, load_properties_schemas, remove_duplicates
 from NEMO.views.api_billing import (
     BillingFilterForm,
@@ -154,11 +165,44 @@ class SingleInstanceHTMLFormBrowsableAPIRenderer(BrowsableAPIRenderer):
 
 class XLSXFileListModelMixin(XLSXFileMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """
-    Adds pagination bypass and also allows XLSX retrieval
+    Adds pagination bypass and also allows XLSX retrieval.
+    Cursor pagination can be requested with pagination=cursor, or with updated_since=<datetime> for models having a
+    last_updated field, to only get what changed since then (ordered by last update).
     """
 
+    # Fields used to order pages when using cursor pagination
+    cursor_ordering = ("id",)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self.cursor_pagination_requested():
+            self._paginator = NEMOCursorPagination()
+        return super().paginator
+
+    def cursor_pagination_requested(self) -> bool:
+        params = self.request.GET if self.request else {}
+        return params.get("pagination") == "cursor" or "updated_since" in params
+
+    def get_cursor_ordering(self):
+        return ("last_updated", "id") if "updated_since" in self.request.GET else self.cursor_ordering
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request and "updated_since" in self.request.GET:
+            if "last_updated" not in [field.name for field in queryset.model._meta.get_fields()]:
+                raise ValidationError({"updated_since": "This type of object doesn't keep track of updates"})
+            updated_since = parse_datetime(self.request.GET["updated_since"])
+            if not updated_since:
+                raise ValidationError({"updated_since": "Enter a valid date/time"})
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+            queryset = queryset.filter(last_updated__gte=updated_since)
+        return queryset
+
     # Bypass pagination when exporting into any format that's not the browsable API
     def paginate_queryset(self, queryset):
+        if self.cursor_pagination_requested():
+            return super().paginate_queryset(queryset)
         page_size_override = self.request and self.request.GET.get(NEMOPageNumberPagination.page_size_query_param, None)
         renderer = (
             self.request.accepted_renderer if self.request and hasattr(self.request, "accepted_renderer") else None
@@ -177,6 +221,17 @@ class ModelViewSet(XLSXFileListModelMixin, viewsets.ModelViewSet):
     to create multiple instances at once.
     """
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request and self.request.method in ("GET", "HEAD"):
+            # Fetch related objects needed by the fields and expansions requested, instead of once per row
+            serializer = self.get_serializer()
+            plan = plan_queryset(serializer)
+            if plan.only is not None and self.cursor_pagination_requested():
+                plan.only.update(field.lstrip("-") for field in self.get_cursor_ordering())
+            queryset = plan.apply(queryset, restrict_columns=columns_requested(serializer))
+        return queryset
+
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         many = isinstance(request.data, list)
@@ -526,6 +581,7 @@ class RecurringConsumableChargesViewSet(ModelViewSet):
 
 class ReservationViewSet(ModelViewSet):
     filename = "reservations"
+    cursor_ordering = ("start", "id")
     queryset = Reservation.objects.all()
     serializer_class = ReservationSerializer
     filterset_fields = {
@@ -574,6 +630,7 @@ class ReservationQuestionsViewSet(ModelViewSet):
 
 class UsageEventViewSet(ModelViewSet):
     filename = "usage_events"
+    cursor_ordering = ("start", "id")
     queryset = UsageEvent.objects.all()
     serializer_class = UsageEventSerializer
     filterset_fields = {
@@ -600,6 +657,7 @@ class UsageEventViewSet(ModelViewSet):
 
 class AreaAccessRecordViewSet(ModelViewSet):
     filename = "area_access_records"
+    cursor_ordering = ("start", "id")
     queryset = AreaAccessRecord.objects.all().order_by("-start")
     serializer_class = AreaAccessRecordSerializer
     filterset_fields = {
@@ -1072,8 +1130,25 @@ class BillingViewSet(XLSXFileMixin, viewsets.GenericViewSet):
         if not billing_form.is_valid():
             return Response(status=status.HTTP_400_BAD_REQUEST, data=billing_form.errors)
         queryset = self.get_queryset()
-        serializer = self.serializer_class(queryset, many=True)
-        return Response(serializer.data)
+        export_format = request.accepted_renderer.format
+        if export_format not in ["json", "csv", "xlsx"]:
+            serializer = self.serializer_class(queryset, many=True)
+            return Response(serializer.data)
+        # Charges are serialized and written as they are fetched, to keep memory usage flat on large exports
+        serializer = self.get_serializer()
+        rows = map(serializer.to_representation, queryset)
+        fields = list(serializer.fields)
+        if export_format == "xlsx":
+            xlsx = xlsx_file(rows, serializer.fields, getattr(self, "column_header", None))
+            return FileResponse(xlsx, as_attachment=True, filename=self.get_filename())
+        if export_format == "csv":
+            response = StreamingHttpResponse(csv_stream(rows, fields), content_type="text/csv")
+            response["Content-Disposition"] = f'attachment; filename="billing-{export_format_datetime()}.csv"'
+            return response
+        return StreamingHttpResponse(json_stream(rows), content_type="application/json")
+
+    def get_renderers(self):
+        return super().get_renderers() + [CSVRenderer()]
 
     def check_permissions(self, request):
         if not request or not request.user.has_perm("NEMO.use_billing_api"):
@@ -1098,16 +1173,16 @@ class ToolStatusViewSet(XLSXFileMixin, viewsets.GenericViewSet):
         if not request or not request.user.has_perm("NEMO.view_tool"):
             self.permission_denied(request)
 
-    def get_queryset(self) -> QuerySetType[Tool]:
-        tools: QuerySetType[Tool] = Tool.objects.all()
-        for tool in tools:
-            pbs = tool.problems()
-            outages = tool.scheduled_outages()
-            partial_outages = tool.scheduled_partial_outages()
-            rss_unavailable = tool.unavailable_required_resources()
-            partial_rss_unavailable = tool.unavailable_nonrequired_resources()
+    def get_queryset(self) -> List[Tool]:
+        # All statuses are computed at once, instead of running queries for each tool
+        tool_statuses = ToolStatusHelper(Tool.objects.select_related("parent_tool"))
+        for tool in tool_statuses.tools:
+            status = tool_statuses.get(tool)
+            tool.status = status
+            pbs, outages, partial_outages = status.problems, status.outages, status.partial_outages
+            rss_unavailable = status.unavailable_required_resources
+            partial_rss_unavailable = status.unavailable_nonrequired_resources
             tool.problem_descriptions = ", ".join(pb.problem_description for pb in pbs) if pbs else None
-            tool.problematic_since = min((pb.creation_time for pb in pbs), default=None)
             tool.outages = ", ".join(outage.title for outage in outages) if outages else None
             tool.outages_since = min((outage.start for outage in outages), default=None)
             tool.partial_outages = ", ".join(outage.title for outage in partial_outages) if partial_outages else None
@@ -1118,25 +1193,7 @@ class ToolStatusViewSet(XLSXFileMixin, viewsets.GenericViewSet):
             tool.optional_resources_unavailable = (
                 ", ".join(res.name for res in partial_rss_unavailable) if partial_rss_unavailable else None
             )
-            try:
-                tool.required_resources_unavailable_since = (
-                    UnplannedOutage.objects.filter(resource__in=rss_unavailable, end=None).earliest("start").start
-                )
-            except UnplannedOutage.DoesNotExist:
-                pass
-            try:
-                tool.optional_resources_unavailable_since = (
-                    UnplannedOutage.objects.filter(resource__in=partial_rss_unavailable, end=None)
-                    .earliest("start")
-                    .start
-                )
-            except UnplannedOutage.DoesNotExist:
-                pass
-            try:
-                tool.non_operational_since = UnplannedOutage.objects.filter(tool=tool, end=None).earliest("start").start
-            except UnplannedOutage.DoesNotExist:
-                pass
-        return tools
+        return tool_statuses.tools
 
     def get_filename(self, *args, **kwargs):
         return f"tool_status-{export_format_datetime()}.xlsx"
@@ -1,9 +1,12 @@
+import heapq
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, Optional
 
 from django import forms
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat
 
 from NEMO.models import (
     AreaAccessRecord,
@@ -18,6 +21,9 @@ from NEMO.models import (
 from NEMO.typing import QuerySetType
 from NEMO.utilities import localize
 
+# Number of rows fetched from the database at a time when going through charges
+BILLING_CHUNK_SIZE = 2000
+
 
 class BillingFilterForm(forms.Form):
     start = forms.DateField(required=True)
@@ -55,52 +61,157 @@ class BillingFilterForm(forms.Form):
 
 
 class BillableItem(object):
-    def __init__(self, item_type: str, project: Project, user: User, item=None):
+    __slots__ = (
+        "item",
+        "type",
+        "name",
+        "details",
+        "note",
+        "item_id",
+        "item_content_type_id",
+        "validated",
+        "validated_by",
+        "waived",
+        "waived_by",
+        "waived_on",
+        "account",
+        "account_id",
+        "project",
+        "project_id",
+        "application",
+        "user",
+        "username",
+        "user_id",
+        "start",
+        "end",
+        "quantity",
+    )
+
+    def __init__(self, item_type: str, project: Optional[Project], user: Optional[User], item=None):
         self.item = item
         self.type: Optional[str] = item_type
         self.name: Optional[str] = None
         self.details: Optional[str] = ""
+        self.note: Optional[str] = None
         self.item_id: Optional[int] = item.id if item else None
         self.item_content_type_id: Optional[int] = (
             ContentType.objects.get_for_model(item, for_concrete_model=False).id if item else None
         )
         self.validated: bool = False
-        self.validated_by: Optional[User] = None
+        # Usernames of the users who validated or waived the charge
+        self.validated_by: Optional[str] = None
         self.waived: bool = False
-        self.waived_by: Optional[User] = None
+        self.waived_by: Optional[str] = None
         self.waived_on: Optional[datetime] = None
-        if project:
-            self.account: Optional[str] = project.account.name
-            self.account_id: Optional[int] = project.account.id
-            self.project: Optional[str] = project.name
-            self.project_id: Optional[int] = project.id
-            self.application: Optional[str] = project.application_identifier
-        if user:
-            self.user: Optional[str] = str(user)
-            self.username: Optional[str] = user.username
-            self.user_id: Optional[int] = user.id
+        self.account: Optional[str] = project.account.name if project else None
+        self.account_id: Optional[int] = project.account_id if project else None
+        self.project: Optional[str] = project.name if project else None
+        self.project_id: Optional[int] = project.id if project else None
+        self.application: Optional[str] = project.application_identifier if project else None
+        self.user: Optional[str] = str(user) if user else None
+        self.username: Optional[str] = user.username if user else None
+        self.user_id: Optional[int] = user.id if user else None
         self.start: Optional[datetime] = None
         self.end: Optional[datetime] = None
         self.quantity: Optional[Decimal] = None
 
+    @classmethod
+    def from_row(cls, item_type: str, item_content_type_id: int, row: Dict) -> "BillableItem":
+        """Creates a billable item from a row returned by billable_item_rows, without loading any model instance"""
+        item = cls.__new__(cls)
+        item.item = None
+        item.type = item_type
+        item.name = None
+        item.details = ""
+        item.note = None
+        item.item_id = row["id"]
+        item.item_content_type_id = item_content_type_id
+        item.validated = row["validated"]
+        item.validated_by = row["validated_by__username"]
+        item.waived = row["waived"]
+        item.waived_by = row["waived_by__username"]
+        item.waived_on = row["waived_on"]
+        item.account = row["project__account__name"]
+        item.account_id = row["project__account_id"]
+        item.project = row["project__name"]
+        item.project_id = row["project_id"]
+        item.application = row["project__application_identifier"]
+        item.user = row["charged_user"]
+        item.username = row["charged_username"]
+        item.user_id = row["charged_user_id"]
+        item.start = None
+        item.end = None
+        item.quantity = None
+        return item
+
+    def as_dict(self) -> Dict:
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__}
+
+
+def user_display(user_field: str) -> Concat:
+    """Same as str(user), computed by the database"""
+    return Concat(
+        f"{user_field}__first_name",
+        Value(" "),
+        f"{user_field}__last_name",
+        Value(" ("),
+        f"{user_field}__username",
+        Value(")"),
+        output_field=CharField(),
+    )
 
-def get_billing_charges(request_params: Dict) -> List[BillableItem]:
+
+def billable_item_rows(queryset: QuerySetType, user_field: str, *fields: str, **expressions) -> Iterator[Dict]:
+    """
+    Returns the values needed to create billable items from the queryset, fetched in chunks.
+    user_field is the field of the user being charged, additional fields and expressions can be requested.
+    """
+    return queryset.values(
+        "id",
+        "project_id",
+        "project__name",
+        "project__application_identifier",
+        "project__account_id",
+        "project__account__name",
+        "validated",
+        "validated_by__username",
+        "waived",
+        "waived_on",
+        "waived_by__username",
+        *fields,
+        charged_user_id=F(f"{user_field}_id"),
+        charged_username=F(f"{user_field}__username"),
+        charged_user=user_display(user_field),
+        **expressions,
+    ).iterator(chunk_size=BILLING_CHUNK_SIZE)
+
+
+def content_type_id(model) -> int:
+    return ContentType.objects.get_for_model(model, for_concrete_model=False).id
+
+
+def get_billing_charges(request_params: Dict) -> Iterator[BillableItem]:
+    """
+    Returns the charges matching the billing filter, most recent first.
+    Each type of charge is fetched already ordered from the database, in chunks, and they are merged as they are
+    consumed, so the charges never need to be all loaded in memory at once.
+    """
     billing_form = BillingFilterForm(request_params)
     billing_form.full_clean()
-    data: List[BillableItem] = []
-    data.extend(get_usage_events_for_billing(billing_form))
-    data.extend(get_area_access_for_billing(billing_form))
-    data.extend(get_consumables_for_billing(billing_form))
-    data.extend(get_missed_reservations_for_billing(billing_form))
-    data.extend(get_staff_charges_for_billing(billing_form))
-    data.extend(get_training_sessions_for_billing(billing_form))
-
-    data.sort(key=lambda x: x.start, reverse=True)
-    return data
+    return heapq.merge(
+        get_usage_events_for_billing(billing_form),
+        get_area_access_for_billing(billing_form),
+        get_consumables_for_billing(billing_form),
+        get_missed_reservations_for_billing(billing_form),
+        get_staff_charges_for_billing(billing_form),
+        get_training_sessions_for_billing(billing_form),
+        key=lambda x: x.start,
+        reverse=True,
+    )
 
 
-def get_usage_events_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = UsageEvent.objects.filter().prefetch_related("project", "project__account", "user", "operator", "tool")
+def get_usage_events_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = UsageEvent.objects.all()
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(end__gte=start, end__lte=end)
     if billing_form.get_account_id():
@@ -115,11 +226,11 @@ def get_usage_events_for_billing(billing_form: BillingFilterForm) -> List[Billab
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(user__username=billing_form.get_username())
-    return billable_items_usage_events(queryset)
+    return billable_items_usage_events(queryset.order_by("-start"))
 
 
-def get_area_access_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = AreaAccessRecord.objects.filter().prefetch_related("project", "project__account", "customer", "area")
+def get_area_access_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = AreaAccessRecord.objects.all()
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(end__gte=start, end__lte=end)
     if billing_form.get_account_id():
@@ -134,13 +245,11 @@ def get_area_access_for_billing(billing_form: BillingFilterForm) -> List[Billabl
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(customer__username=billing_form.get_username())
-    return billable_items_area_access_records(queryset)
+    return billable_items_area_access_records(queryset.order_by("-start"))
 
 
-def get_missed_reservations_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = Reservation.objects.filter(missed=True).prefetch_related(
-        "project", "project__account", "user", "area", "tool"
-    )
+def get_missed_reservations_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = Reservation.objects.filter(missed=True)
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(end__gte=start, end__lte=end)
     if billing_form.get_account_id():
@@ -155,11 +264,11 @@ def get_missed_reservations_for_billing(billing_form: BillingFilterForm) -> List
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(user__username=billing_form.get_username())
-    return billable_items_missed_reservations(queryset)
+    return billable_items_missed_reservations(queryset.order_by("-start"))
 
 
-def get_staff_charges_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = StaffCharge.objects.filter().prefetch_related("project", "project__account", "customer", "staff_member")
+def get_staff_charges_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = StaffCharge.objects.all()
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(end__gte=start, end__lte=end)
     if billing_form.get_account_id():
@@ -174,13 +283,11 @@ def get_staff_charges_for_billing(billing_form: BillingFilterForm) -> List[Billa
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(customer__username=billing_form.get_username())
-    return billable_items_staff_charges(queryset)
+    return billable_items_staff_charges(queryset.order_by("-start"))
 
 
-def get_consumables_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = ConsumableWithdraw.objects.filter().prefetch_related(
-        "project", "project__account", "customer", "merchant", "consumable"
-    )
+def get_consumables_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = ConsumableWithdraw.objects.all()
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(date__gte=start, date__lte=end)
     if billing_form.get_account_id():
@@ -195,13 +302,11 @@ def get_consumables_for_billing(billing_form: BillingFilterForm) -> List[Billabl
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(customer__username=billing_form.get_username())
-    return billable_items_consumable_withdrawals(queryset)
+    return billable_items_consumable_withdrawals(queryset.order_by("-date"))
 
 
-def get_training_sessions_for_billing(billing_form: BillingFilterForm) -> List[BillableItem]:
-    queryset = TrainingSession.objects.filter().prefetch_related(
-        "project", "project__account", "trainer", "trainee", "tool"
-    )
+def get_training_sessions_for_billing(billing_form: BillingFilterForm) -> Iterator[BillableItem]:
+    queryset = TrainingSession.objects.all()
     start, end = billing_form.get_start_date(), billing_form.get_end_date()
     queryset = queryset.filter(date__gte=start, date__lte=end)
     if billing_form.get_account_id():
@@ -216,125 +321,93 @@ def get_training_sessions_for_billing(billing_form: BillingFilterForm) -> List[B
         queryset = queryset.filter(project__application_identifier=billing_form.get_application_name())
     if billing_form.get_username():
         queryset = queryset.filter(trainee__username=billing_form.get_username())
-    return billable_items_training_sessions(queryset)
+    return billable_items_training_sessions(queryset.order_by("-date"))
 
 
-def billable_items_usage_events(usage_events: QuerySetType[UsageEvent]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for usage_event in usage_events:
-        item = BillableItem("tool_usage", usage_event.project, usage_event.user, usage_event)
-        item.name = usage_event.tool.name
+def billable_items_usage_events(usage_events: QuerySetType[UsageEvent]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(UsageEvent)
+    extra_fields = ["tool__name", "start", "end", "note", "operator_id", "user_id"]
+    for row in billable_item_rows(usage_events, "user", *extra_fields, operator_display=user_display("operator")):
+        item = BillableItem.from_row("tool_usage", item_content_type_id, row)
+        item.name = row["tool__name"]
         item.details = (
-            f"Work performed by {usage_event.operator} on user's behalf"
-            if usage_event.operator != usage_event.user
+            f"Work performed by {row['operator_display']} on user's behalf"
+            if row["operator_id"] != row["user_id"]
             else ""
         )
-        item.start = usage_event.start
-        item.end = usage_event.end
-        item.quantity = get_minutes_between_dates(usage_event.start, usage_event.end)
-        item.validated = usage_event.validated
-        item.validated_by = usage_event.validated_by
-        item.waived = usage_event.waived
-        item.waived_on = usage_event.waived_on
-        item.waived_by = usage_event.waived_by
-        billable_items.append(item)
-    return billable_items
-
-
-def billable_items_area_access_records(area_access_records: QuerySetType[AreaAccessRecord]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for area_access_record in area_access_records:
-        item = BillableItem("area_access", area_access_record.project, area_access_record.customer, area_access_record)
-        item.name = area_access_record.area.name
+        item.note = row["note"]
+        item.start = row["start"]
+        item.end = row["end"]
+        item.quantity = get_minutes_between_dates(row["start"], row["end"])
+        yield item
+
+
+def billable_items_area_access_records(area_access_records: QuerySetType[AreaAccessRecord]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(AreaAccessRecord)
+    extra_fields = ["area__name", "start", "end", "staff_charge_id"]
+    staff_member = user_display("staff_charge__staff_member")
+    for row in billable_item_rows(area_access_records, "customer", *extra_fields, staff_member_display=staff_member):
+        item = BillableItem.from_row("area_access", item_content_type_id, row)
+        item.name = row["area__name"]
         item.details = (
-            f"Area accessed by {area_access_record.staff_charge.staff_member} on user's behalf"
-            if area_access_record.staff_charge
-            else ""
-        )
-        item.start = area_access_record.start
-        item.end = area_access_record.end
-        item.quantity = get_minutes_between_dates(area_access_record.start, area_access_record.end)
-        item.validated = area_access_record.validated
-        item.validated_by = area_access_record.validated_by
-        item.waived = area_access_record.waived
-        item.waived_on = area_access_record.waived_on
-        item.waived_by = area_access_record.waived_by
-        billable_items.append(item)
-    return billable_items
-
-
-def billable_items_consumable_withdrawals(withdrawals: QuerySetType[ConsumableWithdraw]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for consumable_withdrawal in withdrawals:
-        item = BillableItem(
-            "consumable", consumable_withdrawal.project, consumable_withdrawal.customer, consumable_withdrawal
-        )
-        item.name = consumable_withdrawal.consumable.name
-        item.start = consumable_withdrawal.date
-        item.end = consumable_withdrawal.date
-        item.quantity = consumable_withdrawal.quantity
-        item.validated = consumable_withdrawal.validated
-        item.validated_by = consumable_withdrawal.validated_by
-        item.waived = consumable_withdrawal.waived
-        item.waived_on = consumable_withdrawal.waived_on
-        item.waived_by = consumable_withdrawal.waived_by
-        billable_items.append(item)
-    return billable_items
-
-
-def billable_items_missed_reservations(missed_reservations: QuerySetType[Reservation]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for missed_reservation in missed_reservations:
-        item = BillableItem(
-            "missed_reservation", missed_reservation.project, missed_reservation.user, missed_reservation
+            f"Area accessed by {row['staff_member_display']} on user's behalf" if row["staff_charge_id"] else ""
         )
-        item.name = missed_reservation.reservation_item.name
-        item.start = missed_reservation.start
-        item.end = missed_reservation.end
+        item.start = row["start"]
+        item.end = row["end"]
+        item.quantity = get_minutes_between_dates(row["start"], row["end"])
+        yield item
+
+
+def billable_items_consumable_withdrawals(withdrawals: QuerySetType[ConsumableWithdraw]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(ConsumableWithdraw)
+    for row in billable_item_rows(withdrawals, "customer", "consumable__name", "date", "quantity"):
+        item = BillableItem.from_row("consumable", item_content_type_id, row)
+        item.name = row["consumable__name"]
+        item.start = row["date"]
+        item.end = row["date"]
+        item.quantity = row["quantity"]
+        yield item
+
+
+def billable_items_missed_reservations(missed_reservations: QuerySetType[Reservation]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(Reservation)
+    for row in billable_item_rows(missed_reservations, "user", "tool__name", "area__name", "start", "end"):
+        item = BillableItem.from_row("missed_reservation", item_content_type_id, row)
+        item.name = row["tool__name"] or row["area__name"]
+        item.start = row["start"]
+        item.end = row["end"]
         item.quantity = 1
-        item.validated = missed_reservation.validated
-        item.validated_by = missed_reservation.validated_by
-        item.waived = missed_reservation.waived
-        item.waived_on = missed_reservation.waived_on
-        item.waived_by = missed_reservation.waived_by
-        billable_items.append(item)
-    return billable_items
-
-
-def billable_items_staff_charges(staff_charges: QuerySetType[StaffCharge]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for staff_charge in staff_charges:
-        item = BillableItem("staff_charge", staff_charge.project, staff_charge.customer, staff_charge)
-        item.details = staff_charge.note
-        item.name = f"Work performed by {staff_charge.staff_member}"
-        item.start = staff_charge.start
-        item.end = staff_charge.end
-        item.quantity = get_minutes_between_dates(staff_charge.start, staff_charge.end)
-        item.validated = staff_charge.validated
-        item.validated_by = staff_charge.validated_by
-        item.waived = staff_charge.waived
-        item.waived_on = staff_charge.waived_on
-        item.waived_by = staff_charge.waived_by
-        billable_items.append(item)
-    return billable_items
-
-
-def billable_items_training_sessions(training_sessions: QuerySetType[TrainingSession]) -> List[BillableItem]:
-    billable_items: List[BillableItem] = []
-    for training_session in training_sessions:
-        item = BillableItem("training_session", training_session.project, training_session.trainee, training_session)
-        item.name = training_session.tool.name
-        item.details = f"{training_session.get_type_display()} training provided by {training_session.trainer}"
-        item.start = training_session.date
-        item.end = training_session.date
-        item.quantity = training_session.duration
-        item.validated = training_session.validated
-        item.validated_by = training_session.validated_by
-        item.waived = training_session.waived
-        item.waived_on = training_session.waived_on
-        item.waived_by = training_session.waived_by
-        billable_items.append(item)
-    return billable_items
+        yield item
+
+
+def billable_items_staff_charges(staff_charges: QuerySetType[StaffCharge]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(StaffCharge)
+    extra_fields = ["note", "start", "end"]
+    for row in billable_item_rows(
+        staff_charges, "customer", *extra_fields, staff_member_display=user_display("staff_member")
+    ):
+        item = BillableItem.from_row("staff_charge", item_content_type_id, row)
+        item.details = row["note"]
+        item.note = row["note"]
+        item.name = f"Work performed by {row['staff_member_display']}"
+        item.start = row["start"]
+        item.end = row["end"]
+        item.quantity = get_minutes_between_dates(row["start"], row["end"])
+        yield item
+
+
+def billable_items_training_sessions(training_sessions: QuerySetType[TrainingSession]) -> Iterator[BillableItem]:
+    item_content_type_id = content_type_id(TrainingSession)
+    training_types = dict(TrainingSession._meta.get_field("type").flatchoices)
+    extra_fields = ["tool__name", "type", "date", "duration"]
+    for row in billable_item_rows(training_sessions, "trainee", *extra_fields, trainer_display=user_display("trainer")):
+        item = BillableItem.from_row("training_session", item_content_type_id, row)
+        item.name = row["tool__name"]
+        item.details = f"{training_types.get(row['type'], row['type'])} training provided by {row['trainer_display']}"
+        item.start = row["date"]
+        item.end = row["date"]
+        item.quantity = row["duration"]
+        yield item
 
 
 def get_minutes_between_dates(start, end, round_digits=2) -> Decimal:
@@ -1,19 +1,26 @@
-import json
+import hashlib
 import re
+import time
 from datetime import datetime, timedelta
+from itertools import chain
 from http import HTTPStatus
 from logging import getLogger
-from typing import Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound, JsonResponse
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Subquery
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.utils.timezone import make_aware
 from django.views.decorators.http import require_GET, require_POST
 
+from NEMO.calendar_feeds import EventFeedSerializer, serialize_feed
 from NEMO.constants import ADDITIONAL_INFORMATION_MAXIMUM_LENGTH
 from NEMO.decorators import disable_session_expiry_refresh, postpone, staff_member_or_tool_staff_required, synchronized
 from NEMO.exceptions import ProjectChargeException, RequiredUnansweredQuestionsException
@@ -35,6 +42,7 @@ from NEMO.models import (
     UserPreferences,
 )
 from NEMO.policy import check_maximum_users_in_overlapping_reservations, policy_class as policy
+from NEMO.typing import QuerySetType
 from NEMO.utilities import (
     RecurrenceFrequency,
     bootstrap_primary_color,
@@ -180,22 +188,113 @@ def event_feed(request):
 
     facility_name = ApplicationCustomization.get("facility_name")
     if event_type == "reservations":
-        return reservation_event_feed(request, start, end)
-    if event_type == "reservations and use":
-        reservation_feed = json.loads(reservation_event_feed(request, start, end).content)
-        usage_feed = json.loads(usage_event_feed(request, start, end).content)
-        return JsonResponse(reservation_feed + usage_feed, safe=False)
+        events = reservation_feed_events(request, start, end)
+    elif event_type == "reservations and use":
+        events = chain(reservation_feed_events(request, start, end), usage_feed_events(request, start, end))
     elif event_type == f"{facility_name.lower()} use":
-        return usage_event_feed(request, start, end)
+        events = usage_feed_events(request, start, end)
     # Only staff may request a specific user's history...
     elif event_type == "specific user" and request.user.is_staff:
         user = get_object_or_404(User, id=request.GET.get("user"))
-        return specific_user_feed(request, user, start, end)
+        events = specific_user_feed_events(request, user, start, end)
     elif event_type == "configuration agenda":
-        return configuration_agenda_event_feed(request, start, end)
+        events = configuration_agenda_feed_events(request, start, end)
     else:
         return HttpResponseBadRequest("Invalid event type or operation not authorized.")
 
+    cache_seconds = getattr(settings, "CALENDAR_FEED_CACHE_SECONDS", 60)
+    if not cache_seconds:
+        return HttpResponse(serialize_feed(events), content_type="application/json")
+    # The calendar polls the feeds often, only send the events when they changed
+    etag = quote_etag(event_feed_version(request, start, end, cache_seconds))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f"calendar_feed_{etag}"
+        content = cache.get(cache_key)
+        if content is None:
+            content = serialize_feed(events)
+            cache.set(cache_key, content, cache_seconds)
+        response = HttpResponse(content, content_type="application/json")
+    response["ETag"] = etag
+    # Make browsers revalidate the feed every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def event_feed_version(request, start, end, cache_seconds: int) -> str:
+    """
+    Returns a version token for the event feed, which changes when an event in the time window changes.
+    It is made of the number of events and their latest modification time, the request parameters and the user
+    (editable and own events depend on it). The time is also included, rounded to cache_seconds, so events that
+    are still in progress and changes to tools, users etc. are picked up after at most cache_seconds.
+    Bulk updates of events (queryset.update()) have to set last_updated for the feed to change right away.
+    """
+    version = [
+        sorted((key, request.GET.getlist(key)) for key in request.GET if key != "_"),
+        request.user.id,
+        request.user.is_staff,
+        CalendarCustomization.get("calendar_configuration_in_reservations"),
+        CalendarCustomization.get_slot_resolution_minutes(),
+        int(time.time() // cache_seconds),
+    ]
+    for queryset in event_feed_version_querysets(request):
+        aggregate = in_time_window(queryset, start, end).aggregate(Count("id"), Max("last_updated"))
+        version.extend(aggregate.values())
+    return hashlib.blake2b(repr(version).encode(), digest_size=16).hexdigest()
+
+
+def event_feed_version_querysets(request) -> List[QuerySetType]:
+    """
+    Returns the reservations, outages, usage events and area access records the event feed can include.
+    They can include more events than the feed (it is only used to know when the feed changes), but don't
+    require any other query.
+    """
+    reservations, usage_events, area_access_records = (
+        Reservation.objects.all(),
+        UsageEvent.objects.all(),
+        AreaAccessRecord.objects.all(),
+    )
+    # Outages are only included when displaying a tool or an area
+    outages = ScheduledOutage.objects.none()
+    if request.GET.get("event_type") == "specific user":
+        user_id = request.GET.get("user")
+        return [
+            reservations.filter(user_id=user_id),
+            usage_events.filter(user_id=user_id),
+            area_access_records.filter(customer_id=user_id),
+        ]
+    item_type, item_id = request.GET.get("item_type"), request.GET.get("item_id")
+    all_items = any(request.GET.get(key) for key in ["all_tools", "all_areas", "all_areastools"])
+    if item_type and item_id and not all_items:
+        if ReservationItemType(item_type) == ReservationItemType.TOOL:
+            family_tool_ids = Tool.objects.filter(
+                Q(id=item_id) | Q(parent_tool_id=item_id) | Q(tool_children_set=item_id)
+            ).values("id")
+            reservations = reservations.filter(tool_id=item_id)
+            outages = ScheduledOutage.objects.filter(Q(tool_id=item_id) | Q(resource__fully_dependent_tools=item_id))
+            usage_events = usage_events.filter(tool_id__in=family_tool_ids)
+            area_access_records = area_access_records.none()
+        else:
+            area = Area.objects.filter(id=item_id)
+            ancestor_ids = Area.objects.filter(
+                tree_id=Subquery(area.values("tree_id")),
+                lft__lte=Subquery(area.values("lft")),
+                rght__gte=Subquery(area.values("rght")),
+            ).values("id")
+            reservations = reservations.filter(area_id=item_id)
+            outages = ScheduledOutage.objects.filter(
+                Q(area_id__in=ancestor_ids) | Q(resource__dependent_areas__in=ancestor_ids)
+            )
+            usage_events = usage_events.none()
+            area_access_records = area_access_records.filter(area_id=item_id)
+    if request.GET.get("personal_schedule"):
+        reservations, usage_events, area_access_records = (
+            Reservation.objects.filter(user=request.user),
+            UsageEvent.objects.filter(user=request.user),
+            AreaAccessRecord.objects.filter(customer=request.user),
+        )
+    return [reservations, outages, usage_events, area_access_records]
+
 
 def extract_calendar_dates(parameters):
     """
@@ -228,14 +327,21 @@ def extract_calendar_dates(parameters):
     return start, end
 
 
-def reservation_event_feed(request, start, end):
+def in_time_window(queryset: QuerySetType, start: datetime, end: datetime) -> QuerySetType:
+    """
+    Filters events overlapping the time window (starting before the window ends and ending after it starts).
+    Events without an end yet (for example tools still in use) are included if they started before the window ends.
+    """
+    overlap = Q(start__lt=end, end__gt=start)
+    if queryset.model._meta.get_field("end").null:
+        overlap |= Q(start__lt=end, end__isnull=True)
+    return queryset.filter(overlap)
+
+
+def reservation_feed_events(request, start, end) -> Iterator[Dict]:
     events = Reservation.objects.filter(cancelled=False, missed=False, shortened=False)
     outages = ScheduledOutage.objects.none()
-    # Exclude events for which the following is true:
-    # The event starts and ends before the time-window, and...
-    # The event starts and ends after the time-window.
-    events = events.exclude(start__lt=start, end__lt=start)
-    events = events.exclude(start__gt=end, end__gt=end)
+    events = in_time_window(events, start, end)
     all_tools = request.GET.get("all_tools")
     all_areas = request.GET.get("all_areas")
     all_areastools = request.GET.get("all_areastools")
@@ -258,32 +364,27 @@ def reservation_event_feed(request, start, end):
                 )
             elif item_type == ReservationItemType.AREA:
                 outages = Area.objects.get(pk=item_id).scheduled_outage_queryset()
-
-    # Exclude outages for which the following is true:
-    # The outage starts and ends before the time-window, and...
-    # The outage starts and ends after the time-window.
-    outages = outages.exclude(start__lt=start, end__lt=start)
-    outages = outages.exclude(start__gt=end, end__gt=end)
+    outages = in_time_window(outages, start, end)
 
     # Filter events that only have to do with the current user.
     personal_schedule = request.GET.get("personal_schedule")
     if personal_schedule:
         events = events.filter(user=request.user)
 
-    dictionary = {
-        "events": events,
-        "outages": outages,
-        "personal_schedule": personal_schedule,
-        "all_tools": all_tools,
-        "all_areas": all_areas,
-        "all_areastools": all_areastools,
-        "display_name": display_name,
-        "display_configuration": CalendarCustomization.get_bool("calendar_configuration_in_reservations"),
-    }
-    return render(request, "calendar/reservation_event_feed.html", dictionary)
+    serializer = EventFeedSerializer(request.user)
+    yield from serializer.reservations(
+        events,
+        personal_schedule=personal_schedule,
+        all_tools=all_tools,
+        all_areas=all_areas,
+        all_areastools=all_areastools,
+        display_name=display_name,
+        display_configuration=CalendarCustomization.get_bool("calendar_configuration_in_reservations"),
+    )
+    yield from serializer.outages(outages)
 
 
-def usage_event_feed(request, start, end):
+def usage_feed_events(request, start, end) -> Iterator[Dict]:
     usage_events = UsageEvent.objects.none()
     area_access_events = AreaAccessRecord.objects.none()
     missed_reservations = Reservation.objects.none()
@@ -321,70 +422,32 @@ def usage_event_feed(request, start, end):
         if item_id and item_type == ReservationItemType.AREA:
             area_access_events = AreaAccessRecord.objects.filter(area__id=item_id)
 
-    # Exclude events for which the following is true:
-    # The event starts and ends before the time-window, and...
-    # The event starts and ends after the time-window.
-    usage_events = usage_events.exclude(start__lt=start, end__lt=start)
-    usage_events = usage_events.exclude(start__gt=end, end__gt=end)
-    area_access_events = area_access_events.exclude(start__lt=start, end__lt=start)
-    area_access_events = area_access_events.exclude(start__gt=end, end__gt=end)
-    missed_reservations = missed_reservations.exclude(start__lt=start, end__lt=start)
-    missed_reservations = missed_reservations.exclude(start__gt=end, end__gt=end)
-
-    dictionary = {
-        "usage_events": usage_events,
-        "area_access_events": area_access_events,
-        "personal_schedule": personal_schedule,
-        "missed_reservations": missed_reservations,
-        "all_tools": all_tools,
-        "all_areas": all_areas,
-        "all_areastools": all_areastools,
-    }
-    return render(request, "calendar/usage_event_feed.html", dictionary)
-
+    serializer = EventFeedSerializer(request.user)
+    yield from serializer.usage_events(in_time_window(usage_events, start, end), personal_schedule)
+    yield from serializer.area_access_events(in_time_window(area_access_events, start, end))
+    yield from serializer.missed_reservations(in_time_window(missed_reservations, start, end), personal_schedule)
 
-def specific_user_feed(request, user, start, end):
-    # Find all tool usage events for a user.
-    # Exclude events for which the following is true:
-    # The event starts and ends before the time-window, and...
-    # The event starts and ends after the time-window.
-    usage_events = UsageEvent.objects.filter(user=user)
-    usage_events = usage_events.exclude(start__lt=start, end__lt=start)
-    usage_events = usage_events.exclude(start__gt=end, end__gt=end)
 
-    # Find all area access events for a user.
-    area_access_events = AreaAccessRecord.objects.filter(customer=user)
-    area_access_events = area_access_events.exclude(start__lt=start, end__lt=start)
-    area_access_events = area_access_events.exclude(start__gt=end, end__gt=end)
-
-    # Find all reservations for the user that were not missed or cancelled.
+def specific_user_feed_events(request, user, start, end) -> Iterator[Dict]:
+    # Tool usage and area access of the user
+    usage_events = in_time_window(UsageEvent.objects.filter(user=user), start, end)
+    area_access_events = in_time_window(AreaAccessRecord.objects.filter(customer=user), start, end)
+    # Reservations for the user that were not missed or cancelled, and missed reservations
     reservations = Reservation.objects.filter(user=user, missed=False, cancelled=False, shortened=False)
-    reservations = reservations.exclude(start__lt=start, end__lt=start)
-    reservations = reservations.exclude(start__gt=end, end__gt=end)
-
-    # Find all missed reservations for the user.
     missed_reservations = Reservation.objects.filter(user=user, missed=True)
-    missed_reservations = missed_reservations.exclude(start__lt=start, end__lt=start)
-    missed_reservations = missed_reservations.exclude(start__gt=end, end__gt=end)
 
-    dictionary = {
-        "usage_events": usage_events,
-        "area_access_events": area_access_events,
-        "reservations": reservations,
-        "missed_reservations": missed_reservations,
-    }
-    return render(request, "calendar/specific_user_feed.html", dictionary)
+    serializer = EventFeedSerializer(request.user)
+    yield from serializer.user_usage_events(usage_events)
+    yield from serializer.user_area_access_events(area_access_events)
+    yield from serializer.user_reservations(in_time_window(reservations, start, end))
+    yield from serializer.user_missed_reservations(in_time_window(missed_reservations, start, end))
 
 
-def configuration_agenda_event_feed(request, start, end):
+def configuration_agenda_feed_events(request, start, end) -> Iterator[Dict]:
     events = Reservation.objects.filter(
         cancelled=False, missed=False, shortened=False, configurationoption_set__isnull=False
     ).distinct()
-    # Exclude events for which the following is true:
-    # The event starts and ends before the time-window, and...
-    # The event starts and ends after the time-window.
-    events = events.exclude(start__lt=start, end__lt=start)
-    events = events.exclude(start__gt=end, end__gt=end)
+    events = in_time_window(events, start, end)
     all_tools = request.GET.get("all_tools")
 
     # Filter events that only have to do with the relevant tool/area.
@@ -397,14 +460,7 @@ def configuration_agenda_event_feed(request, start, end):
         if item_id and not all_tools:
             events = events.filter(**{f"{item_type.value}__id": item_id})
 
-    personal_schedule = request.GET.get("personal_schedule")
-
-    dictionary = {
-        "events": events,
-        "personal_schedule": personal_schedule,
-        "all_tools": all_tools,
-    }
-    return render(request, "calendar/configuration_event_feed.html", dictionary)
+    yield from EventFeedSerializer(request.user).configuration_agenda(events, all_tools)
 
 
 @login_required
@@ -7,11 +7,13 @@ from datetime import date, datetime
 from logging import getLogger
 from threading import RLock
 from typing import Dict, Iterable, List, Optional
+from uuid import uuid4
 
 from dateutil.relativedelta import relativedelta
 from django.apps import apps
 from django.conf import settings
 from django.contrib import messages
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.validators import (
@@ -19,6 +21,8 @@ from django.core.validators import (
     validate_email,
     validate_integer,
 )
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.http import HttpResponseNotFound
 from django.shortcuts import redirect, render
 from django.template import Context, Template, TemplateDoesNotExist
@@ -56,15 +60,34 @@ customization_logger = getLogger(__name__)
 
 class CustomizationBase(ABC):
     _instances: Dict[str, CustomizationBase] = {}
-    # Static cache variables
+    # Static cache variables. The cache dictionary is never modified in place, it is replaced entirely on reload
+    # so readers can use it without holding the lock
     _variables_cache = None
     _cache_expiry = 0
+    _cache_version = None
+    _version_check_expiry = 0
     _cache_lock = RLock()
-    # Cache expiry time (in seconds, default 30 seconds)
-    CACHE_TTL = quiet_int(getattr(settings, "CUSTOMIZATIONS_CACHE_SECONDS", 30), 30)
+    # Cache expiry time (in seconds, default 30 seconds). Set to None to never expire and only rely on the version
+    CACHE_TTL = getattr(settings, "CUSTOMIZATIONS_CACHE_SECONDS", 30)
+    CACHE_TTL = quiet_int(CACHE_TTL, 30) if CACHE_TTL is not None else None
+    # Django cache used to share the customization version across processes (it should be a shared backend)
+    CACHE_ALIAS = getattr(settings, "CUSTOMIZATIONS_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)
+    CACHE_VERSION_KEY = "NEMO_customizations_version"
+    # How often (in seconds) to check the shared version
+    CACHE_VERSION_CHECK_SECONDS = quiet_int(getattr(settings, "CUSTOMIZATIONS_CACHE_VERSION_CHECK_SECONDS", 1), 1)
 
     # Here we can place variables that we need in NEMO but don't need to be set in UI
-    variables = {"weekend_access_notification_last_sent": ""}
+    variables = {
+        "weekend_access_notification_last_sent": "",
+        # Timed services watermarks (see timed_service_interval)
+        "cancel_unused_reservations_processed_until": "",
+        "reservation_reminders_processed_until": "",
+        "reservation_ending_reminders_processed_until": "",
+        # Last run of each service run by the timed services scheduler
+        "timed_services_last_runs": "",
+        # Run durations and errors of each service run by the timed services scheduler
+        "timed_services_metrics": "",
+    }
     files = []
 
     def __init__(self, key, title):
@@ -72,22 +95,62 @@ class CustomizationBase(ABC):
         self.title = title
 
     @staticmethod
-    def _load_cache():
+    def _get_cache() -> Dict:
+        """
+        Return the cached variables, reloading them only when the cache is empty, expired or outdated.
+        The lock is only acquired when a reload is needed.
+        """
+        variables_cache = CustomizationBase._variables_cache
+        if variables_cache is None or CustomizationBase._is_cache_stale():
+            variables_cache = CustomizationBase._load_cache(variables_cache)
+        return variables_cache
+
+    @staticmethod
+    def _is_cache_stale() -> bool:
+        now = time.time()
+        if CustomizationBase.CACHE_TTL is not None and now > CustomizationBase._cache_expiry:
+            return True
+        if now > CustomizationBase._version_check_expiry:
+            CustomizationBase._version_check_expiry = now + CustomizationBase.CACHE_VERSION_CHECK_SECONDS
+            return CustomizationBase._get_shared_version() != CustomizationBase._cache_version
+        return False
+
+    @staticmethod
+    def _get_shared_version() -> Optional[str]:
+        try:
+            return caches[CustomizationBase.CACHE_ALIAS].get(CustomizationBase.CACHE_VERSION_KEY)
+        except Exception as e:
+            customization_logger.debug(f"could not retrieve customizations version: {e}")
+
+    @staticmethod
+    def _bump_shared_version():
+        try:
+            caches[CustomizationBase.CACHE_ALIAS].set(CustomizationBase.CACHE_VERSION_KEY, uuid4().hex, None)
+        except Exception as e:
+            customization_logger.warning(f"could not update customizations version: {e}")
+
+    @staticmethod
+    def _load_cache(stale_cache: Dict = None) -> Dict:
         """
         Private method to load all variables into the cache from the database.
-        Called when the cache is empty or expired.
+        Called when the cache is empty, expired or outdated.
         """
         with CustomizationBase._cache_lock:
-            # Reload from the database only if the cache is empty or expired
-            if CustomizationBase._variables_cache is None or time.time() > CustomizationBase._cache_expiry:
+            # Another thread might have already replaced the stale cache while we were waiting for the lock
+            if CustomizationBase._variables_cache is None or CustomizationBase._variables_cache is stale_cache:
+                # Read the version first, so a change happening during the load will trigger another reload
+                version = CustomizationBase._get_shared_version()
                 # Load default values
-                CustomizationBase._variables_cache = CustomizationBase._all_variables()
+                variables_cache = CustomizationBase._all_variables()
                 # Then override with db values
-                CustomizationBase._variables_cache.update(
-                    {cust.name: cust.value for cust in Customization.objects.all()}
-                )
+                variables_cache.update(Customization.objects.values_list("name", "value"))
+                CustomizationBase._cache_version = version
+                CustomizationBase._version_check_expiry = time.time() + CustomizationBase.CACHE_VERSION_CHECK_SECONDS
                 # Set the new cache expiration time
-                CustomizationBase._cache_expiry = time.time() + CustomizationBase.CACHE_TTL
+                if CustomizationBase.CACHE_TTL is not None:
+                    CustomizationBase._cache_expiry = time.time() + CustomizationBase.CACHE_TTL
+                CustomizationBase._variables_cache = variables_cache
+            return CustomizationBase._variables_cache
 
     @staticmethod
     def invalidate_cache():
@@ -98,6 +161,31 @@ class CustomizationBase(ABC):
             CustomizationBase._variables_cache = None
             CustomizationBase._cache_expiry = 0
 
+    @staticmethod
+    def invalidate_all_caches():
+        """
+        Invalidate the cache in this process and, using the shared version, in every other process.
+        Also invalidate again after the current transaction is committed, in case another thread
+        reloaded the cache with the old values in the meantime.
+        """
+
+        def invalidate():
+            CustomizationBase._bump_shared_version()
+            CustomizationBase.invalidate_cache()
+
+        invalidate()
+        transaction.on_commit(invalidate)
+
+    @staticmethod
+    def invalidate_cache_on_change(sender, **kwargs):
+        CustomizationBase.invalidate_all_caches()
+
+    # Connect the invalidation signals, so changes made outside of set (admin, api etc.) are also picked up
+    @classmethod
+    def connect_signals(cls):
+        post_save.connect(cls.invalidate_cache_on_change, sender=Customization)
+        post_delete.connect(cls.invalidate_cache_on_change, sender=Customization)
+
     def template(self) -> Optional[str]:
         # We want to check if there is a customization template file in the app template dir
         # Otherwise we load it from the main template dir
@@ -199,9 +287,7 @@ class CustomizationBase(ABC):
         default_value = cls.variables.get(name, cls._all_variables().get(name))
         try:
             if use_cache:
-                with CustomizationBase._cache_lock:
-                    CustomizationBase._load_cache()
-                    return CustomizationBase._variables_cache.get(name, default_value)
+                return CustomizationBase._get_cache().get(name, default_value)
             else:
                 return Customization.objects.get(name=name).value
         except Customization.DoesNotExist:
@@ -214,11 +300,9 @@ class CustomizationBase(ABC):
     @staticmethod
     def get_all() -> Dict:
         """
-        Retrieve all variables. Always reloading the cache.
+        Retrieve all variables from the cache (which is only reloaded when expired or outdated).
         """
-        CustomizationBase.invalidate_cache()  # Invalidate the cache
-        CustomizationBase._load_cache()  # Ensure cache is valid
-        return dict(CustomizationBase._variables_cache.copy().items())
+        return dict(CustomizationBase._get_cache())
 
     @classmethod
     def get_int(cls, name: str, default=None, raise_exception=True) -> int:
@@ -266,8 +350,20 @@ class CustomizationBase(ABC):
                     Customization.objects.get(name=name).delete()
                 except Customization.DoesNotExist:
                     pass
-        # Invalidate the cache
-        CustomizationBase.invalidate_cache()
+        # Invalidate the cache in all processes
+        CustomizationBase.invalidate_all_caches()
+
+    @classmethod
+    def set_without_invalidation(cls, name: str, value: str):
+        """
+        Saves a variable without invalidating the customizations cache in every process.
+        Only meant for internal values that change often and are always read with use_cache=False.
+        """
+        if name not in cls.variables:
+            raise InvalidCustomizationException(name, value)
+        if not Customization.objects.filter(name=name).update(value=value):
+            # bulk_create doesn't send the post_save signal that invalidates the cache
+            Customization.objects.bulk_create([Customization(name=name, value=value)], ignore_conflicts=True)
 
 
 @customization(key="application", title="Application")
@@ -635,12 +731,15 @@ class AdjustmentRequestsCustomization(CustomizationBase):
             # If adjustment requests are being disabled, remove all notifications
             previously_enabled = cls.get("adjustment_requests_enabled")
             if previously_enabled:
+                from NEMO.views.notifications import invalidate_notification_counts
+
                 Notification.objects.filter(
                     notification_type__in=[
                         Notification.Types.ADJUSTMENT_REQUEST,
                         Notification.Types.ADJUSTMENT_REQUEST_REPLY,
                     ]
                 ).delete()
+                invalidate_notification_counts()
         super().set(name, value)
 
     def context(self) -> Dict:
@@ -969,3 +1068,6 @@ def customize(request, key, element=None):
     else:
         messages.success(request, f"{customization_instance.title} settings saved successfully")
         return redirect("customization", key)
+
+
+CustomizationBase.connect_signals()
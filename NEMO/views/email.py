@@ -23,6 +23,7 @@ from NEMO.typing import QuerySetType
 from NEMO.utilities import (
     EmailCategory,
     create_email_attachment,
+    email_batch,
     export_format_datetime,
     quiet_int,
     render_email_template,
@@ -280,16 +281,17 @@ def send_broadcast_email(request):
     try:
         users_set = set(users)
         chunk_size = quiet_int(getattr(settings, "EMAIL_BROADCAST_BCC_CHUNK_SIZE", len(users_set)), len(users_set))
-        for users_chunk in split_into_chunks(users_set, chunk_size):
-            send_mail(
-                subject=subject,
-                content=content,
-                from_email=sender.email,
-                bcc=users_chunk,
-                attachments=attachments,
-                email_category=EmailCategory.BROADCAST_EMAIL,
-                fail_silently=False,
-            )
+        with email_batch():
+            for users_chunk in split_into_chunks(users_set, chunk_size):
+                send_mail(
+                    subject=subject,
+                    content=content,
+                    from_email=sender.email,
+                    bcc=users_chunk,
+                    attachments=attachments,
+                    email_category=EmailCategory.BROADCAST_EMAIL,
+                    fail_silently=False,
+                )
     except SMTPException as error:
         site_title = ApplicationCustomization.get("site_title")
         error_message = (
@@ -299,7 +301,10 @@ def send_broadcast_email(request):
         logger.exception(error_message)
         messages.error(request, message=error_message)
         return redirect("email_broadcast")
-    messages.success(request, message="Your email was sent successfully")
+    if getattr(settings, "EMAIL_OUTBOX_ENABLED", False):
+        messages.success(request, message="Your email was queued and will be sent shortly")
+    else:
+        messages.success(request, message="Your email was sent successfully")
     return redirect("email_broadcast")
 
 
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
-from typing import Iterable, List, Set
+from typing import Dict, Iterable, List, Set
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count
+from django.core.cache import cache
+from django.db.models import Count, Model, Q
 from django.utils import timezone
 
 from NEMO.models import (
@@ -14,89 +16,160 @@ from NEMO.models import (
     TemporaryPhysicalAccessRequest,
     User,
 )
-from NEMO.utilities import end_of_the_day
+from NEMO.utilities import end_of_the_day, is_cache_shared, quiet_int
 from NEMO.views.customization import AdjustmentRequestsCustomization
 
+# Per-user notification counts are cached, and the cache is cleared every time notifications are created or deleted.
+# The generation is part of the key, so counts for all users can be invalidated at once by changing it.
+# Counts are only cached when the Django cache is shared between processes, since they wouldn't be cleared in the others
+NOTIFICATION_COUNTS_CACHE_KEY = "NEMO_notification_counts_{}_{}"
+NOTIFICATION_COUNTS_GENERATION_CACHE_KEY = "NEMO_notification_counts_generation"
+NOTIFICATION_COUNTS_CACHE_SECONDS = quiet_int(getattr(settings, "NOTIFICATION_COUNTS_CACHE_SECONDS", 60), 60)
+# Notifications for many users are created (and updated) in batches of this size
+NOTIFICATIONS_BATCH_SIZE = quiet_int(getattr(settings, "NOTIFICATIONS_BATCH_SIZE", 500), 500)
+
 
 def delete_expired_notifications():
-    Notification.objects.filter(expiration__lt=timezone.now()).delete()
+    deleted, _ = Notification.objects.filter(expiration__lt=timezone.now()).delete()
+    if deleted:
+        invalidate_notification_counts()
 
 
 def get_notifications(user: User, notification_type: str, delete=True):
     notifications = Notification.objects.filter(user=user, notification_type=notification_type)
-    if notifications:
-        notification_ids = list(notifications.values_list("object_id", flat=True))
+    notification_ids = list(notifications.values_list("object_id", flat=True))
+    if notification_ids:
         if delete:
             notifications.delete()
+            invalidate_notification_counts([user.id])
         return notification_ids
     else:
         return None
 
 
-def get_notification_counts(user: User):
+def get_notification_counts(user: User) -> Dict[str, int]:
+    if not is_cache_shared():
+        return count_notifications(user)
+    cache_key = NOTIFICATION_COUNTS_CACHE_KEY.format(get_notification_counts_generation(), user.id)
+    counts = cache.get(cache_key)
+    if counts is None:
+        counts = count_notifications(user)
+        cache.set(cache_key, counts, NOTIFICATION_COUNTS_CACHE_SECONDS)
+    return counts
+
+
+def count_notifications(user: User) -> Dict[str, int]:
     notifications = Notification.objects.filter(user=user)
     counts = notifications.values("notification_type").annotate(total=Count("notification_type"))
     return {item["notification_type"]: item["total"] for item in counts}
 
 
+def get_notification_counts_generation() -> int:
+    return cache.get_or_set(NOTIFICATION_COUNTS_GENERATION_CACHE_KEY, 0, None)
+
+
+def invalidate_notification_counts(user_ids: Iterable[int] = None):
+    """Invalidate cached notification counts for the given user ids, or for all users if none are given"""
+    if user_ids is None:
+        try:
+            cache.incr(NOTIFICATION_COUNTS_GENERATION_CACHE_KEY)
+        except ValueError:
+            cache.set(NOTIFICATION_COUNTS_GENERATION_CACHE_KEY, 1, None)
+    else:
+        generation = get_notification_counts_generation()
+        cache.delete_many([NOTIFICATION_COUNTS_CACHE_KEY.format(generation, user_id) for user_id in set(user_ids)])
+
+
 def delete_notification(notification_type: str, instance_id, users: Iterable[User] = None):
     notifications = Notification.objects.filter(notification_type=notification_type, object_id=instance_id)
     if users:
         notifications = notifications.filter(user__in=users)
-    notifications.delete()
+    user_ids = list(notifications.values_list("user_id", flat=True))
+    if user_ids:
+        notifications.delete()
+        invalidate_notification_counts(user_ids)
+
+
+def create_notifications(
+    user_ids: Iterable[int],
+    notification_type: str,
+    content_object: Model,
+    expiration: datetime,
+    update_existing=True,
+) -> List[int]:
+    """
+    Creates the notification of the content object for all the given users, in bulk.
+    Users already having it get the new expiration (like update_or_create), unless update_existing is False.
+    Returns the ids of the users notified.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    content_type = ContentType.objects.get_for_model(content_object)
+    notifications = Notification.objects.filter(
+        notification_type=notification_type, content_type=content_type, object_id=content_object.pk
+    )
+    existing_user_ids = set(notifications.values_list("user_id", flat=True))
+    if update_existing and existing_user_ids:
+        to_update = [user_id for user_id in user_ids if user_id in existing_user_ids]
+        for i in range(0, len(to_update), NOTIFICATIONS_BATCH_SIZE):
+            notifications.filter(user_id__in=to_update[i : i + NOTIFICATIONS_BATCH_SIZE]).update(expiration=expiration)
+    Notification.objects.bulk_create(
+        (
+            Notification(
+                user_id=user_id,
+                expiration=expiration,
+                notification_type=notification_type,
+                content_type=content_type,
+                object_id=content_object.pk,
+            )
+            for user_id in user_ids
+            if user_id not in existing_user_ids
+        ),
+        batch_size=NOTIFICATIONS_BATCH_SIZE,
+    )
+    return user_ids
 
 
 def create_news_notification(story):
     # Delete all existing notifications for this story, so we don't have multiple notifications for the same story
     Notification.objects.filter(notification_type=Notification.Types.NEWS, object_id=story.id).delete()
-    users = User.objects.filter(is_active=True)
+    user_ids = User.objects.filter(is_active=True).values_list("id", flat=True)
     expiration = timezone.now() + timedelta(days=30)  # Unread news story notifications always expire after 30 days
-    for u in users:
-        Notification.objects.create(
-            user=u, expiration=expiration, content_object=story, notification_type=Notification.Types.NEWS
-        )
+    create_notifications(user_ids, Notification.Types.NEWS, story, expiration)
+    invalidate_notification_counts()
 
 
 def create_safety_notification(safety_issue):
-    users = User.objects.filter(is_staff=True, is_active=True)
+    user_ids = User.objects.filter(is_staff=True, is_active=True).values_list("id", flat=True)
     expiration = timezone.now() + timedelta(days=30)  # Unread safety issue notifications always expire after 30 days
-    for u in users:
-        Notification.objects.update_or_create(
-            user=u,
-            notification_type=Notification.Types.SAFETY,
-            content_type=ContentType.objects.get_for_model(safety_issue),
-            object_id=safety_issue.id,
-            defaults={"expiration": expiration},
-        )
+    invalidate_notification_counts(create_notifications(user_ids, Notification.Types.SAFETY, safety_issue, expiration))
 
 
 def create_buddy_request_notification(buddy_request: BuddyRequest):
-    users: List[User] = User.objects.filter(is_active=True).exclude(id=buddy_request.user_id)
+    # Users without preferences yet have the default preference (notify)
+    user_ids = (
+        User.objects.filter(is_active=True)
+        .exclude(id=buddy_request.user_id)
+        .filter(Q(preferences__isnull=True) | Q(preferences__display_new_buddy_request_notification=True))
+        .values_list("id", flat=True)
+    )
     request_end = buddy_request.end
     # Unread buddy request notifications expire after the request ends
     expiration = end_of_the_day(datetime(request_end.year, request_end.month, request_end.day))
-    for u in users:
-        if u.get_preferences().display_new_buddy_request_notification:
-            Notification.objects.update_or_create(
-                user=u,
-                notification_type=Notification.Types.BUDDY_REQUEST,
-                content_type=ContentType.objects.get_for_model(buddy_request),
-                object_id=buddy_request.id,
-                defaults={"expiration": expiration},
-            )
+    create_notifications(user_ids, Notification.Types.BUDDY_REQUEST, buddy_request, expiration)
+    invalidate_notification_counts()
 
 
 def create_staff_assistance_request_notification(staff_assistance_request: StaffAssistanceRequest):
-    users: List[User] = User.objects.filter(is_active=True, is_staff=True).exclude(id=staff_assistance_request.user_id)
+    user_ids = (
+        User.objects.filter(is_active=True, is_staff=True)
+        .exclude(id=staff_assistance_request.user_id)
+        .values_list("id", flat=True)
+    )
     expiration = datetime.max.replace(tzinfo=timezone.get_default_timezone()) - timedelta(days=1)
-    for u in users:
-        Notification.objects.update_or_create(
-            user=u,
-            notification_type=Notification.Types.STAFF_ASSISTANCE_REQUEST,
-            content_type=ContentType.objects.get_for_model(staff_assistance_request),
-            object_id=staff_assistance_request.id,
-            defaults={"expiration": expiration},
-        )
+    notified_user_ids = create_notifications(
+        user_ids, Notification.Types.STAFF_ASSISTANCE_REQUEST, staff_assistance_request, expiration
+    )
+    invalidate_notification_counts(notified_user_ids)
 
 
 def create_request_message_notification(reply: RequestMessage, notification_type: str, expiration: datetime):
@@ -106,16 +179,13 @@ def create_request_message_notification(reply: RequestMessage, notification_type
     if isinstance(reply.content_object, AdjustmentRequest):
         creator = reply.content_object.creator
         enabled_for_creator = AdjustmentRequestsCustomization.are_adjustment_requests_enabled_for_user(creator)
+    notified_user_ids = []
     for user in reply.content_object.creator_and_reply_users():
         if not (creator and user == creator and not enabled_for_creator):
             if user != reply.author:
-                Notification.objects.update_or_create(
-                    user=user,
-                    notification_type=notification_type,
-                    content_type=ContentType.objects.get_for_model(reply),
-                    object_id=reply.id,
-                    defaults={"expiration": expiration},
-                )
+                notified_user_ids.append(user.id)
+    create_notifications(notified_user_ids, notification_type, reply, expiration)
+    invalidate_notification_counts(notified_user_ids)
 
 
 def create_access_request_notification(access_request: TemporaryPhysicalAccessRequest):
@@ -126,14 +196,9 @@ def create_access_request_notification(access_request: TemporaryPhysicalAccessRe
     users_to_notify.update(access_request.reviewers())
     if access_request.last_updated_by and access_request.last_updated_by != access_request.creator:
         users_to_notify.add(access_request.creator)
-    for user in users_to_notify:
-        Notification.objects.update_or_create(
-            user=user,
-            notification_type=Notification.Types.TEMPORARY_ACCESS_REQUEST,
-            content_type=ContentType.objects.get_for_model(access_request),
-            object_id=access_request.id,
-            defaults={"expiration": expiration},
-        )
+    user_ids = [user.id for user in users_to_notify]
+    create_notifications(user_ids, Notification.Types.TEMPORARY_ACCESS_REQUEST, access_request, expiration)
+    invalidate_notification_counts(user_ids)
 
 
 def create_adjustment_request_notification(adjustment_request: AdjustmentRequest):
@@ -141,13 +206,13 @@ def create_adjustment_request_notification(adjustment_request: AdjustmentRequest
     if AdjustmentRequestsCustomization.are_adjustment_requests_enabled_for_user(adjustment_request.creator):
         users_to_notify.add(adjustment_request.creator)
     expiration = timezone.now() + timedelta(days=30)  # 30 days for adjustment requests to expire
-    for user in users_to_notify:
-        # Only update users other than the one who last updated it
-        if not adjustment_request.last_updated_by or adjustment_request.last_updated_by != user:
-            Notification.objects.get_or_create(
-                user=user,
-                notification_type=Notification.Types.ADJUSTMENT_REQUEST,
-                content_type=ContentType.objects.get_for_model(adjustment_request),
-                object_id=adjustment_request.id,
-                defaults={"expiration": expiration},
-            )
+    # Only update users other than the one who last updated it
+    user_ids = [
+        user.id
+        for user in users_to_notify
+        if not adjustment_request.last_updated_by or adjustment_request.last_updated_by != user
+    ]
+    create_notifications(
+        user_ids, Notification.Types.ADJUSTMENT_REQUEST, adjustment_request, expiration, update_existing=False
+    )
+    invalidate_notification_counts([user.id for user in users_to_notify])
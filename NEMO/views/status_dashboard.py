@@ -5,7 +5,7 @@ from dateutil.relativedelta import relativedelta
 from dateutil.rrule import DAILY, rrule
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import F, Prefetch, Q
+from django.db.models import F, Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -13,6 +13,7 @@ from django.utils import timezone
 from django.views.decorators.http import require_GET, require_http_methods
 
 from NEMO.decorators import disable_session_expiry_refresh, facility_manager_required
+from NEMO.facility_status import FacilityStatusSnapshot
 from NEMO.forms import StaffAbsenceForm
 from NEMO.model_tree import ModelTreeHelper, TreeItem, get_area_model_tree
 from NEMO.models import (
@@ -21,12 +22,8 @@ from NEMO.models import (
     AreaAccessRecord,
     ClosureTime,
     Resource,
-    ScheduledOutage,
     StaffAbsence,
     StaffAvailability,
-    Task,
-    Tool,
-    UsageEvent,
     User,
 )
 from NEMO.typing import QuerySetType
@@ -41,6 +38,9 @@ from NEMO.utilities import (
 )
 from NEMO.views.customization import StatusDashboardCustomization
 
+# Snapshot keys used to filter, group and update tools, not shown on the dashboard
+SNAPSHOT_ONLY_TOOL_KEYS = ["category", "tool_or_parent_id", "family_ids"]
+
 
 @login_required
 @disable_session_expiry_refresh
@@ -354,35 +354,15 @@ def area_tree_helper(
 
 
 def create_tool_summary(tooltip_info=False, tool_categories=None):
-    category_filter = Q()
-    if tool_categories:
-        for category in tool_categories:
-            category_filter |= Q(_category__istartswith=category)
-    tools = (
-        Tool.objects.filter(visible=True)
-        .filter(category_filter)
-        .prefetch_related(
-            "_primary_owner",
-            "_backup_owners",
-            "_superusers",
-            Prefetch("_requires_area_access", queryset=Area.objects.all().only("name")),
-        )
-    )
-    tasks = Task.objects.filter(cancelled=False, resolved=False, tool__visible=True, tool__in=tools)
-    unavailable_resources = Resource.objects.filter(available=False).prefetch_related(
-        "fully_dependent_tools", "partially_dependent_tools"
-    )
-    # also check for visibility on the parent if there is one (alternate tool are hidden)
-    usage_events = (
-        UsageEvent.objects.filter(Q(end=None, tool__visible=True) | Q(end=None, tool__parent_tool__visible=True))
-        .filter(tool__in=tools)
-        .prefetch_related("operator", "user", "tool")
-    )
-    scheduled_outages = ScheduledOutage.objects.filter(
-        start__lte=timezone.now(), end__gt=timezone.now(), area__isnull=True
-    ).prefetch_related("tool", "resource__fully_dependent_tools", "resource__partially_dependent_tools")
-    tool_summary = merge(tools, tasks, unavailable_resources, usage_events, scheduled_outages, tooltip_info)
-    tool_summary = list(tool_summary.values())
+    result = {}
+    for entry in FacilityStatusSnapshot.get()["tools"].values():
+        if tool_categories and not any(entry["category"].lower().startswith(c.lower()) for c in tool_categories):
+            continue
+        tool_summary_item = {key: value for key, value in entry.items() if key not in SNAPSHOT_ONLY_TOOL_KEYS}
+        if not tooltip_info:
+            del tool_summary_item["get_tool_info_html"]
+        result[entry["tool_or_parent_id"]] = tool_summary_item
+    tool_summary = list(result.values())
     tool_sort = StatusDashboardCustomization.get("dashboard_tool_sort")
     max_date_aware = datetime.max.replace(tzinfo=timezone.get_default_timezone())
     if tool_sort == "name":
@@ -402,6 +382,7 @@ def create_tool_summary(tooltip_info=False, tool_categories=None):
 def create_area_summary(area_tree: ModelTreeHelper = None, add_resources=True, add_occupants=True, add_outages=True):
     if area_tree is None:
         area_tree = get_area_model_tree()
+    snapshot = FacilityStatusSnapshot.get()
     area_items = area_tree.items.values()
     result = {}
     for area in area_items:
@@ -423,66 +404,28 @@ def create_area_summary(area_tree: ModelTreeHelper = None, add_resources=True, a
         }
 
     if add_resources:
-        unavailable_resources = Resource.objects.filter(available=False).prefetch_related(
-            Prefetch("dependent_areas", queryset=Area.objects.only("id"))
-        )
-        for resource in unavailable_resources:
-            for area in resource.dependent_areas.all():
-                if area.id in result:
-                    result[area.id]["required_resource_is_unavailable"] = True
+        for area_id in snapshot["unavailable_resource_area_ids"]:
+            if area_id in result:
+                result[area_id]["required_resource_is_unavailable"] = True
     if add_outages:
-        scheduled_outages = ScheduledOutage.objects.filter(
-            start__lte=timezone.now(), end__gt=timezone.now(), tool__isnull=True
-        ).only("area_id", "resource_id")
-        for outage in scheduled_outages:
-            if outage.area_id:
-                result[outage.area_id]["scheduled_outage"] = True
-            elif outage.resource_id:
-                for t in outage.resource.dependent_areas.values_list("id", flat=True):
-                    result[t]["scheduled_outage"] = True
+        for area_id in snapshot["outage_area_ids"]:
+            if area_id in result:
+                result[area_id]["scheduled_outage"] = True
 
     if add_occupants:
-        occupants: List[AreaAccessRecord] = AreaAccessRecord.objects.filter(
-            end=None, staff_charge=None
-        ).prefetch_related(
-            Prefetch(
-                "customer",
-                queryset=User.objects.all().only(
-                    "first_name",
-                    "last_name",
-                    "username",
-                    "is_staff",
-                    "is_accounting_officer",
-                    "is_user_office",
-                    "is_facility_manager",
-                    "is_superuser",
-                ),
-            )
-        )
-        for occupant in occupants:
+        for occupant in snapshot["occupants"].values():
             # Get ids for area and all the parents (so we can add occupants info on parents)
-            area_ids = area_tree.get_area(occupant.area_id).ancestor_ids(include_self=True)
-            if occupant.customer.is_any_part_of_staff:
-                customer_display = f'<span class="success-highlight">{str(occupant.customer)}</span>'
-            elif occupant.customer.is_service_personnel:
-                customer_display = f'<span class="warning-highlight">{str(occupant.customer)}</span>'
-            elif (
-                occupant.customer.is_logged_in_area_without_reservation()
-                or occupant.customer.is_logged_in_area_outside_authorized_schedule()
-            ):
-                customer_display = f'<span class="danger-highlight">{str(occupant.customer)}</span>'
-            else:
-                customer_display = str(occupant.customer)
+            area_ids = area_tree.get_area(occupant["area_id"]).ancestor_ids(include_self=True)
+            customer_display = occupant["customer_display"]
             for area_id in area_ids:
                 if area_id in result:
                     result[area_id]["occupancy"] += 1
-                    if occupant.customer.is_any_part_of_staff:
+                    if occupant["is_any_part_of_staff"]:
                         result[area_id]["occupancy_staff"] += 1
-                    if occupant.customer.is_service_personnel:
+                    if occupant["is_service_personnel"]:
                         result[area_id]["occupancy_service_personnel"] += 1
-                    if (not occupant.customer.is_any_part_of_staff or result[area_id]["count_staff_in_occupancy"]) and (
-                        not occupant.customer.is_service_personnel
-                        or result[area_id]["count_service_personnel_in_occupancy"]
+                    if (not occupant["is_any_part_of_staff"] or result[area_id]["count_staff_in_occupancy"]) and (
+                        not occupant["is_service_personnel"] or result[area_id]["count_service_personnel_in_occupancy"]
                     ):
                         result[area_id]["occupancy_count"] += 1
                     result[area_id]["occupants"] += (
@@ -491,62 +434,3 @@ def create_area_summary(area_tree: ModelTreeHelper = None, add_resources=True, a
     area_summary = list(result.values())
     area_summary.sort(key=lambda x: x["name"])
     return area_summary
-
-
-def merge(tools, tasks, unavailable_resources, usage_events, scheduled_outages, tooltip_info=False):
-    result = {}
-    tools_with_delayed_logoff_in_effect = [
-        x.tool.tool_or_parent_id() for x in UsageEvent.objects.filter(end__gt=timezone.now()).prefetch_related("tool")
-    ]
-    parent_ids = Tool.objects.filter(parent_tool__isnull=False).values_list("parent_tool_id", flat=True)
-    for tool in tools:
-        result[tool.tool_or_parent_id()] = {
-            "name": tool.name_or_child_in_use_name(parent_ids=parent_ids),
-            "id": tool.id,
-            "user": "",
-            "operator": "",
-            "in_use": False,
-            "in_use_since": "",
-            "delayed_logoff_in_progress": tool.tool_or_parent_id() in tools_with_delayed_logoff_in_effect,
-            "problematic": False,
-            "operational": tool.operational,
-            "required_resource_is_unavailable": False,
-            "nonrequired_resource_is_unavailable": False,
-            "scheduled_outage": False,
-            "scheduled_partial_outage": False,
-            "area_name": tool.requires_area_access.name if tool.requires_area_access else None,
-            "area_requires_reservation": (
-                tool.requires_area_access.requires_reservation if tool.requires_area_access else False
-            ),
-        }
-        if tooltip_info:
-            result[tool.tool_or_parent_id()]["get_tool_info_html"] = tool.get_tool_info_html()
-    for tool_id in tasks.values_list("tool_id", flat=True):
-        result[tool_id]["problematic"] = True
-    for event in usage_events:
-        result[event.tool.tool_or_parent_id()]["operator"] = str(event.operator)
-        result[event.tool.tool_or_parent_id()]["user"] = str(event.operator)
-        if event.user != event.operator:
-            result[event.tool.tool_or_parent_id()]["user"] += " on behalf of " + str(event.user)
-        result[event.tool.tool_or_parent_id()]["in_use"] = True
-        result[event.tool.tool_or_parent_id()]["in_use_since"] = event.start
-        result[event.tool.tool_or_parent_id()]["operator_is_any_part_of_staff"] = event.operator.is_any_part_of_staff
-        result[event.tool.tool_or_parent_id()]["operator_is_service_personnel"] = event.operator.is_service_personnel
-    for resource in unavailable_resources:
-        for tool in resource.fully_dependent_tools.filter(visible=True):
-            if tool.id in result:
-                result[tool.id]["required_resource_is_unavailable"] = True
-        for tool in resource.partially_dependent_tools.filter(visible=True):
-            if tool.id in result:
-                result[tool.id]["nonrequired_resource_is_unavailable"] = True
-    for outage in scheduled_outages:
-        if outage.tool_id and outage.tool.visible and outage.tool_id in result:
-            result[outage.tool_id]["scheduled_outage"] = True
-        elif outage.resource_id:
-            for t in outage.resource.fully_dependent_tools.filter(visible=True):
-                if t.id in result:
-                    result[t.id]["scheduled_outage"] = True
-            for t in outage.resource.partially_dependent_tools.filter(visible=True):
-                if t.id in result:
-                    result[t.id]["scheduled_partial_outage"] = True
-    return result
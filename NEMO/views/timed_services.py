@@ -1,10 +1,14 @@
+from contextlib import contextmanager
+from functools import wraps
+from http import HTTPStatus
 from datetime import date, datetime, timedelta
 from logging import getLogger
-from typing import Dict, Iterable, List, Set
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.http import HttpResponse, HttpResponseNotFound
 from django.urls import reverse
 from django.utils import timezone
@@ -13,6 +17,7 @@ from django.views.decorators.http import require_GET
 
 from NEMO.forms import nice_errors
 from NEMO.interlocks import send_csv_interlock_report
+from NEMO.locks import get_lock_backend
 from NEMO.models import (
     Alert,
     Area,
@@ -26,6 +31,7 @@ from NEMO.models import (
     RequestStatus,
     Reservation,
     ReservationItemType,
+    Resource,
     ScheduledOutage,
     StaffCharge,
     TemporaryPhysicalAccessRequest,
@@ -40,6 +46,7 @@ from NEMO.utilities import (
     as_timezone,
     beginning_of_the_day,
     bootstrap_primary_color,
+    email_batch,
     end_of_the_day,
     format_datetime,
     get_email_from_settings,
@@ -64,6 +71,59 @@ from NEMO.views.customization import (
 
 timed_service_logger = getLogger(__name__)
 
+# Maximum number of minutes a timed service catches up on after being stopped or skipped
+TIMED_SERVICES_CATCH_UP_MINUTES = quiet_int(getattr(settings, "TIMED_SERVICES_CATCH_UP_MINUTES", 60), 60)
+
+
+@contextmanager
+def timed_service_interval(name: str) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Yields the (since, until] interval a timed service has to process, starting where its previous run stopped.
+    The end of the interval is saved when the block completes, so runs can be spaced out or skipped without missing
+    anything, and the same items are not processed twice. The first run only processes the last minute.
+    The watermark is always read from the database, so saving it doesn't invalidate the customizations cache.
+    """
+    variable = f"{name}_processed_until"
+    with get_lock_backend().lock(f"NEMO_timed_service_{name}"):
+        until = timezone.now()
+        processed_until = CustomizationBase.get(variable, use_cache=False)
+        processed_until = parse_datetime(processed_until) if processed_until else None
+        if processed_until:
+            since = max(processed_until, until - timedelta(minutes=TIMED_SERVICES_CATCH_UP_MINUTES))
+        else:
+            since = until - timedelta(minutes=1)
+        yield min(since, until), until
+        CustomizationBase.set_without_invalidation(variable, until.isoformat())
+
+
+def timed_service_lock_name(name: str) -> str:
+    return f"NEMO_timed_services_run_{name}"
+
+
+def timed_service(name: str):
+    """
+    Prevents a timed service from running while it is still running from its url, its management command or the
+    timed services scheduler (in other processes too when the lock backend is shared, see SYNCHRONIZED_LOCK_BACKEND).
+    The overlapping run is skipped and a 409 (conflict) response is returned instead.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            lock_backend = get_lock_backend()
+            lock_name = timed_service_lock_name(name)
+            if not lock_backend.acquire(lock_name, 0):
+                timed_service_logger.warning(f"Timed service {name} is still running, skipping it")
+                return HttpResponse(f"Timed service {name} is still running", status=HTTPStatus.CONFLICT)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                lock_backend.release(lock_name)
+
+        return wrapper
+
+    return decorator
+
 
 @login_required
 @require_GET
@@ -72,6 +132,7 @@ def cancel_unused_reservations(request):
     return do_cancel_unused_reservations(request)
 
 
+@timed_service("cancel_unused_reservations")
 def do_cancel_unused_reservations(request=None):
     """
     Missed reservation for tools is when there is no tool activity during the reservation time + missed reservation threshold.
@@ -79,75 +140,18 @@ def do_cancel_unused_reservations(request=None):
 
     Missed reservation for areas is when there is no area access login during the reservation time + missed reservation threshold
     """
-
-    # Missed Tool Reservations
-    tools = Tool.objects.filter(visible=True, _operational=True, _missed_reservation_threshold__isnull=False)
-    missed_reservations: List[Reservation] = []
-    for tool in tools:
-        # If a tool is in use then there's no need to look for unused reservation time.
-        if tool.in_use() or tool.required_resource_is_unavailable() or tool.scheduled_outage_in_progress():
-            continue
-        # Calculate the timestamp of how long a user can be late for a reservation.
-        threshold = timezone.now() - timedelta(minutes=tool.missed_reservation_threshold)
-        threshold = datetime.replace(threshold, second=0, microsecond=0)  # Round down to the nearest minute.
-        # Find the reservations that began exactly at the threshold.
-        reservation = Reservation.objects.filter(
-            cancelled=False,
-            missed=False,
-            shortened=False,
-            tool=tool,
-            user__is_staff=False,
-            start=threshold,
-            end__gt=timezone.now(),
-        )
-        for r in reservation:
-            # Staff may abandon reservations.
-            if r.user.is_staff_on_tool(tool):
-                continue
-            # If there was no tool enable or disable event since the threshold timestamp then we assume the reservation has been missed.
-            if not (
-                UsageEvent.objects.filter(tool_id__in=tool.get_family_tool_ids(), start__gte=threshold).exists()
-                or UsageEvent.objects.filter(tool_id__in=tool.get_family_tool_ids(), end__gte=threshold).exists()
-            ):
-                # Mark the reservation as missed and notify the user & staff.
+    # Reservations whose missed reservation threshold was reached since the last run
+    with timed_service_interval("cancel_unused_reservations") as (since, now):
+        missed_reservations: List[Reservation] = [
+            *missed_tool_reservations(since, now),
+            *missed_area_reservations(since, now),
+        ]
+        if missed_reservations:
+            # Mark the reservations as missed and notify the user & staff.
+            Reservation.objects.filter(id__in=[r.id for r in missed_reservations]).update(missed=True, last_updated=now)
+            for r in missed_reservations:
                 r.missed = True
-                r.save()
-                missed_reservations.append(r)
-
-    # Missed Area Reservations
-    areas = Area.objects.filter(missed_reservation_threshold__isnull=False)
-    for area in areas:
-        # if area has outage or required resource is unavailable, no need to look
-        if area.required_resource_is_unavailable() or area.scheduled_outage_in_progress():
-            continue
-
-        # Calculate the timestamp of how long a user can be late for a reservation.
-        threshold = timezone.now() - timedelta(minutes=area.missed_reservation_threshold)
-        threshold = datetime.replace(threshold, second=0, microsecond=0)  # Round down to the nearest minute.
-        # Find the reservations that began exactly at the threshold.
-        reservation = Reservation.objects.filter(
-            cancelled=False,
-            missed=False,
-            shortened=False,
-            area=area,
-            user__is_staff=False,
-            start=threshold,
-            end__gt=timezone.now(),
-        )
-        for r in reservation:
-            # Staff may abandon reservations.
-            if r.user.is_staff:
-                continue
-            # if the user is not already logged in or if there was no area access starting or ending since the threshold timestamp then we assume the reservation was missed
-            if not (
-                AreaAccessRecord.objects.filter(area__id=area.id, customer=r.user, staff_charge=None, end=None).exists()
-                or AreaAccessRecord.objects.filter(area__id=area.id, customer=r.user, start__gte=threshold).exists()
-                or AreaAccessRecord.objects.filter(area__id=area.id, customer=r.user, end__gte=threshold).exists()
-            ):
-                # Mark the reservation as missed and notify the user & staff.
-                r.missed = True
-                r.save()
-                missed_reservations.append(r)
+                r.last_updated = now
 
     for r in missed_reservations:
         send_missed_reservation_notification(r, request)
@@ -162,6 +166,88 @@ def do_cancel_unused_reservations(request=None):
     return HttpResponse()
 
 
+def missed_reservation_candidates(
+    since: datetime, now: datetime, thresholds: Iterable[int], threshold_field: str
+) -> QuerySetType[Reservation]:
+    # Reservations whose start + threshold (how long a user can be late) is in the (since, now] interval.
+    threshold_filter = Q(pk__in=[])
+    for threshold in thresholds:
+        late = timedelta(minutes=threshold)
+        threshold_filter |= Q(**{threshold_field: threshold}, start__gt=since - late, start__lte=now - late)
+    return Reservation.objects.filter(
+        threshold_filter, cancelled=False, missed=False, shortened=False, user__is_staff=False, end__gt=now
+    ).select_related("user", "tool", "area", "project")
+
+
+def missed_tool_reservations(since: datetime, now: datetime) -> List[Reservation]:
+    """
+    Returns the missed tool reservations in a fixed number of queries, using anti-joins against the tool activity.
+    Only parent tools have a missed reservation threshold, so tool_id is also the tool_or_parent_id here.
+    """
+    tools = Tool.objects.filter(visible=True, _operational=True, _missed_reservation_threshold__isnull=False)
+    thresholds = tools.order_by().values_list("_missed_reservation_threshold", flat=True).distinct()
+    family_usage = UsageEvent.objects.filter(
+        Q(tool_id=OuterRef("tool_id"))
+        | Q(tool__parent_tool_id=OuterRef("tool_id"))
+        | Q(tool_id=OuterRef("tool__parent_tool_id"))
+    )
+    reservations = missed_reservation_candidates(since, now, thresholds, "tool___missed_reservation_threshold").filter(
+        tool__visible=True,
+        tool___operational=True,
+    )
+    return list(
+        reservations.filter(
+            # If a tool is in use then there's no need to look for unused reservation time.
+            ~Exists(family_usage.filter(end=None)),
+            ~Exists(Resource.objects.filter(available=False, fully_dependent_tools=OuterRef("tool_id"))),
+            ~Exists(
+                ScheduledOutage.objects.filter(
+                    Q(tool_id=OuterRef("tool_id")) | Q(resource__fully_dependent_tools=OuterRef("tool_id")),
+                    start__lte=now,
+                    end__gt=now,
+                )
+            ),
+            # Staff may abandon reservations.
+            ~Exists(Tool._staff.through.objects.filter(tool_id=OuterRef("tool_id"), user_id=OuterRef("user_id"))),
+            # If there was no tool enable or disable event since the threshold timestamp then we assume the reservation has been missed.
+            ~Exists(family_usage.filter(Q(start__gte=OuterRef("start")) | Q(end__gte=OuterRef("start")))),
+        )
+    )
+
+
+def missed_area_reservations(since: datetime, now: datetime) -> List[Reservation]:
+    """Returns the missed area reservations in a fixed number of queries, using anti-joins against the area access."""
+    areas = Area.objects.filter(missed_reservation_threshold__isnull=False)
+    thresholds = areas.order_by().values_list("missed_reservation_threshold", flat=True).distinct()
+    # The area of the reservation and its parents
+    ancestors = {
+        "tree_id": OuterRef("area__tree_id"),
+        "lft__lte": OuterRef("area__lft"),
+        "rght__gte": OuterRef("area__rght"),
+    }
+    area_ancestors = {f"area__{key}": value for key, value in ancestors.items()}
+    dependent_area_ancestors = {f"dependent_areas__{key}": value for key, value in ancestors.items()}
+    resource_dependent_area_ancestors = {f"resource__{key}": value for key, value in dependent_area_ancestors.items()}
+    reservations = missed_reservation_candidates(since, now, thresholds, "area__missed_reservation_threshold")
+    return list(
+        reservations.filter(
+            # if area has outage or required resource is unavailable, no need to look
+            ~Exists(Resource.objects.filter(available=False, **dependent_area_ancestors)),
+            ~Exists(
+                ScheduledOutage.objects.filter(
+                    Q(**area_ancestors) | Q(**resource_dependent_area_ancestors), start__lte=now, end__gt=now
+                )
+            ),
+            # if the user is not already logged in or if there was no area access starting or ending since the threshold timestamp then we assume the reservation was missed
+            ~Exists(
+                AreaAccessRecord.objects.filter(area_id=OuterRef("area_id"), customer_id=OuterRef("user_id")).filter(
+                    Q(staff_charge=None, end=None) | Q(start__gte=OuterRef("start")) | Q(end__gte=OuterRef("start"))
+                )
+            ),
+        )
+    )
+
+
 def send_missed_reservation_notification(reservation, request=None):
     message = get_media_file_contents("missed_reservation_email.html")
     user_office_email = EmailsCustomization.get("user_office_email_address")
@@ -192,6 +278,7 @@ def create_closure_alerts(request):
     return do_create_closure_alerts()
 
 
+@timed_service("create_closure_alerts")
 def do_create_closure_alerts():
     future_times = ClosureTime.objects.filter(closure__alert_days_before__isnull=False, end_time__gt=timezone.now())
     for closure_time in future_times:
@@ -250,7 +337,10 @@ def check_and_update_wait_list(request):
     return do_check_and_update_wait_list()
 
 
-def do_check_and_update_wait_list(now=timezone.now()):
+@timed_service("check_and_update_wait_list")
+def do_check_and_update_wait_list(now: datetime = None):
+    # The default is not timezone.now() since it would be evaluated only once, when this module is imported
+    now = now or timezone.now()
     tools_with_wait_list = (
         Tool.objects.filter(toolwaitlist__expired=False, toolwaitlist__deleted=False)
         .exclude(_operation_mode=Tool.OperationMode.REGULAR)
@@ -292,11 +382,12 @@ def do_check_and_update_wait_list(now=timezone.now()):
     return HttpResponse()
 
 
-def in_hybrid_mode_reservation_or_buffer_zone(tool, now=timezone.now()):
+def in_hybrid_mode_reservation_or_buffer_zone(tool, now: datetime = None):
     """
     In hybrid mode, the wait list is not checked if there is an upcoming reservation within the next "reservation_buffer" minutes,
     or if we are inside an active reservation slot.
     """
+    now = now or timezone.now()
     if tool.operation_mode == Tool.OperationMode.HYBRID:
         reservation_buffer = quiet_int(ToolCustomization.get("tool_wait_list_reservation_buffer"), 1)
         upcoming_reservation_within_buffer_or_active_reservation = Reservation.objects.filter(
@@ -311,7 +402,7 @@ def in_hybrid_mode_reservation_or_buffer_zone(tool, now=timezone.now()):
     return False
 
 
-def get_wait_list_turn_available_date(tool, entry, hybrid_mode=False, now=timezone.now()):
+def get_wait_list_turn_available_date(tool, entry, hybrid_mode=False, now: datetime = None):
     """
     User turn becomes available starting from the latest of one of the following dates:
     - The end of the last usage event
@@ -319,6 +410,7 @@ def get_wait_list_turn_available_date(tool, entry, hybrid_mode=False, now=timezo
         - When a reservation is missed, the reservation end is calculated as the start date + the missed reservation threshold.
     - The time the previous user exited the wait list
     """
+    now = now or timezone.now()
 
     last_usage_event = (
         UsageEvent.objects.filter(tool_id__in=tool.get_family_tool_ids(), end__lte=now).order_by("-end").first()
@@ -385,6 +477,7 @@ def email_out_of_time_reservation_notification(request):
     return send_email_out_of_time_reservation_notification(request)
 
 
+@timed_service("email_out_of_time_reservation_notification")
 def send_email_out_of_time_reservation_notification(request=None):
     """
     Out of time reservation notification for areas is when a user is still logged in an area but either their reservation expired or they are outside of their permitted access hours.
@@ -484,6 +577,7 @@ def email_reservation_ending_reminders(request):
     return send_email_reservation_ending_reminders(request)
 
 
+@timed_service("email_reservation_ending_reminders")
 def send_email_reservation_ending_reminders(request=None):
     # Exit early if the reservation ending reminder email template has not been customized for the organization yet.
     reservation_ending_reminder_message = get_media_file_contents("reservation_ending_reminder_email.html")
@@ -503,40 +597,39 @@ def send_email_reservation_ending_reminders(request=None):
         area__isnull=False, user__in=current_logged_in_user.values_list("customer", flat=True)
     )
 
-    # Find all reservations that end 30 or 15 min from now, plus or minus 3 minutes to allow for time skew.
-    reminder_times = [30, 15]
-    tolerance = 3
-    time_filter = Q()
-    for reminder_time in reminder_times:
-        earliest_end = timezone.now() + timedelta(minutes=reminder_time) - timedelta(minutes=tolerance)
-        latest_end = timezone.now() + timedelta(minutes=reminder_time) + timedelta(minutes=tolerance)
-        new_filter = Q(end__gt=earliest_end, end__lt=latest_end)
-        time_filter = time_filter | new_filter
-    ending_reservations = user_area_reservations.filter(time_filter)
     # Email a reminder to each user with a reservation ending soon.
-    for reservation in ending_reservations:
-        starting_reservation = Reservation.objects.filter(
-            cancelled=False,
-            missed=False,
-            shortened=False,
-            area=reservation.area,
-            user=reservation.user,
-            start=reservation.end,
-        )
-        if starting_reservation.exists():
-            continue
-        subject = reservation.reservation_item.name + " reservation ending soon"
-        rendered_message = render_email_template(
-            reservation_ending_reminder_message, {"reservation": reservation}, request
-        )
-        email_notification = reservation.user.get_preferences().email_send_reservation_ending_reminders
-        reservation.user.email_user(
-            subject=subject,
-            message=rendered_message,
-            from_email=user_office_email,
-            email_category=EmailCategory.TIMED_SERVICES,
-            email_notification=email_notification,
-        )
+    with timed_service_interval("reservation_ending_reminders") as (since, until), email_batch():
+        # Find all reservations that reached 30 or 15 min before their end since the last run.
+        reminder_times = [30, 15]
+        time_filter = Q()
+        for reminder_time in reminder_times:
+            reminder_delay = timedelta(minutes=reminder_time)
+            time_filter = time_filter | Q(end__gt=since + reminder_delay, end__lte=until + reminder_delay)
+        # The catch-up interval can start in the past, only remind about reservations that haven't ended yet
+        ending_reservations = user_area_reservations.filter(time_filter, end__gt=until)
+        for reservation in ending_reservations:
+            starting_reservation = Reservation.objects.filter(
+                cancelled=False,
+                missed=False,
+                shortened=False,
+                area=reservation.area,
+                user=reservation.user,
+                start=reservation.end,
+            )
+            if starting_reservation.exists():
+                continue
+            subject = reservation.reservation_item.name + " reservation ending soon"
+            rendered_message = render_email_template(
+                reservation_ending_reminder_message, {"reservation": reservation}, request
+            )
+            email_notification = reservation.user.get_preferences().email_send_reservation_ending_reminders
+            reservation.user.email_user(
+                subject=subject,
+                message=rendered_message,
+                from_email=user_office_email,
+                email_category=EmailCategory.TIMED_SERVICES,
+                email_notification=email_notification,
+            )
     return HttpResponse()
 
 
@@ -548,6 +641,7 @@ def email_usage_reminders(request):
     return send_email_usage_reminders(projects_to_exclude, request)
 
 
+@timed_service("email_usage_reminders")
 def send_email_usage_reminders(projects_to_exclude=None, request=None):
     if projects_to_exclude is None:
         projects_to_exclude = []
@@ -590,41 +684,42 @@ def send_email_usage_reminders(projects_to_exclude=None, request=None):
 
     user_office_email = EmailsCustomization.get("user_office_email_address")
 
-    message = get_media_file_contents("usage_reminder_email.html")
-    facility_name = ApplicationCustomization.get("facility_name")
-    if message:
-        subject = f"{facility_name} usage"
-        for value in aggregate.values():
-            user: User = value["user"]
-            resources_in_use = value["resources_in_use"]
-            # for backwards compatibility, add it to the user object (that's how it was defined and used in the template)
-            user.resources_in_use = resources_in_use
-            rendered_message = render_email_template(
-                message, {"user": user, "resources_in_use": resources_in_use}, request
-            )
-            email_notification = user.get_preferences().email_send_usage_reminders
-            user.email_user(
-                subject=subject,
-                message=rendered_message,
-                from_email=user_office_email,
-                email_category=EmailCategory.TIMED_SERVICES,
-                email_notification=email_notification,
-            )
+    with email_batch():
+        message = get_media_file_contents("usage_reminder_email.html")
+        facility_name = ApplicationCustomization.get("facility_name")
+        if message:
+            subject = f"{facility_name} usage"
+            for value in aggregate.values():
+                user: User = value["user"]
+                resources_in_use = value["resources_in_use"]
+                # for backwards compatibility, add it to the user object (that's how it was defined and used in the template)
+                user.resources_in_use = resources_in_use
+                rendered_message = render_email_template(
+                    message, {"user": user, "resources_in_use": resources_in_use}, request
+                )
+                email_notification = user.get_preferences().email_send_usage_reminders
+                user.email_user(
+                    subject=subject,
+                    message=rendered_message,
+                    from_email=user_office_email,
+                    email_category=EmailCategory.TIMED_SERVICES,
+                    email_notification=email_notification,
+                )
 
-    message = get_media_file_contents("staff_charge_reminder_email.html")
-    if message:
-        busy_staff = StaffCharge.objects.filter(end=None)
-        for staff_charge in busy_staff:
-            subject = "Active staff charge since " + format_datetime(staff_charge.start)
-            rendered_message = render_email_template(message, {"staff_charge": staff_charge}, request)
-            email_notification = staff_charge.staff_member.get_preferences().email_send_usage_reminders
-            staff_charge.staff_member.email_user(
-                subject=subject,
-                message=rendered_message,
-                from_email=user_office_email,
-                email_category=EmailCategory.TIMED_SERVICES,
-                email_notification=email_notification,
-            )
+        message = get_media_file_contents("staff_charge_reminder_email.html")
+        if message:
+            busy_staff = StaffCharge.objects.filter(end=None)
+            for staff_charge in busy_staff:
+                subject = "Active staff charge since " + format_datetime(staff_charge.start)
+                rendered_message = render_email_template(message, {"staff_charge": staff_charge}, request)
+                email_notification = staff_charge.staff_member.get_preferences().email_send_usage_reminders
+                staff_charge.staff_member.email_user(
+                    subject=subject,
+                    message=rendered_message,
+                    from_email=user_office_email,
+                    email_category=EmailCategory.TIMED_SERVICES,
+                    email_notification=email_notification,
+                )
 
     return HttpResponse()
 
@@ -636,6 +731,7 @@ def email_reservation_reminders(request):
     return send_email_reservation_reminders(request)
 
 
+@timed_service("email_reservation_reminders")
 def send_email_reservation_reminders(request=None):
     # Exit early if the reservation reminder email template has not been customized for the organization yet.
     reservation_reminder_message = get_media_file_contents("reservation_reminder_email.html")
@@ -648,61 +744,63 @@ def send_email_reservation_reminders(request=None):
             "The reservation reminder and/or warning email templates have not been customized for your organization yet. Please visit the customization page to upload both templates, then reservation reminder email notifications can be sent."
         )
 
-    # Find all reservations that are two hours from now, plus or minus 5 minutes to allow for time skew.
-    preparation_time = 120
-    tolerance = 5
-    earliest_start = timezone.now() + timedelta(minutes=preparation_time) - timedelta(minutes=tolerance)
-    latest_start = timezone.now() + timedelta(minutes=preparation_time) + timedelta(minutes=tolerance)
-    upcoming_reservations = Reservation.objects.filter(
-        cancelled=False, start__gt=earliest_start, start__lt=latest_start
-    )
     # Email a reminder to each user with an upcoming reservation.
-    for reservation in upcoming_reservations:
-        item = reservation.reservation_item
-        item_type = reservation.reservation_item_type
-        if (
-            item_type == ReservationItemType.TOOL
-            and item.operational
-            and not item.problematic()
-            and item.all_resources_available()
-            or item_type == ReservationItemType.AREA
-            and not item.required_resource_is_unavailable()
-        ):
-            subject = item.name + " reservation reminder"
-            rendered_message = render_email_template(
-                reservation_reminder_message,
-                {"reservation": reservation, "template_color": bootstrap_primary_color("success")},
-                request,
-            )
-        elif (
-            item_type == ReservationItemType.TOOL and not item.operational
-        ) or item.required_resource_is_unavailable():
-            subject = item.name + " reservation problem"
-            rendered_message = render_email_template(
-                reservation_warning_message,
-                {"reservation": reservation, "template_color": bootstrap_primary_color("danger"), "fatal_error": True},
-                request,
-            )
-        else:
-            subject = item.name + " reservation warning"
-            rendered_message = render_email_template(
-                reservation_warning_message,
-                {
-                    "reservation": reservation,
-                    "template_color": bootstrap_primary_color("warning"),
-                    "fatal_error": False,
-                },
-                request,
-            )
-        user_office_email = EmailsCustomization.get("user_office_email_address")
-        email_notification = reservation.user.get_preferences().email_send_reservation_reminders
-        reservation.user.email_user(
-            subject=subject,
-            message=rendered_message,
-            from_email=user_office_email,
-            email_category=EmailCategory.TIMED_SERVICES,
-            email_notification=email_notification,
+    with timed_service_interval("reservation_reminders") as (since, until), email_batch():
+        # Find all reservations that reached two hours before their start since the last run.
+        preparation_time = timedelta(minutes=120)
+        upcoming_reservations = Reservation.objects.filter(
+            cancelled=False, start__gt=since + preparation_time, start__lte=until + preparation_time
         )
+        for reservation in upcoming_reservations:
+            item = reservation.reservation_item
+            item_type = reservation.reservation_item_type
+            if (
+                item_type == ReservationItemType.TOOL
+                and item.operational
+                and not item.problematic()
+                and item.all_resources_available()
+                or item_type == ReservationItemType.AREA
+                and not item.required_resource_is_unavailable()
+            ):
+                subject = item.name + " reservation reminder"
+                rendered_message = render_email_template(
+                    reservation_reminder_message,
+                    {"reservation": reservation, "template_color": bootstrap_primary_color("success")},
+                    request,
+                )
+            elif (
+                item_type == ReservationItemType.TOOL and not item.operational
+            ) or item.required_resource_is_unavailable():
+                subject = item.name + " reservation problem"
+                rendered_message = render_email_template(
+                    reservation_warning_message,
+                    {
+                        "reservation": reservation,
+                        "template_color": bootstrap_primary_color("danger"),
+                        "fatal_error": True,
+                    },
+                    request,
+                )
+            else:
+                subject = item.name + " reservation warning"
+                rendered_message = render_email_template(
+                    reservation_warning_message,
+                    {
+                        "reservation": reservation,
+                        "template_color": bootstrap_primary_color("warning"),
+                        "fatal_error": False,
+                    },
+                    request,
+                )
+            user_office_email = EmailsCustomization.get("user_office_email_address")
+            email_notification = reservation.user.get_preferences().email_send_reservation_reminders
+            reservation.user.email_user(
+                subject=subject,
+                message=rendered_message,
+                from_email=user_office_email,
+                email_category=EmailCategory.TIMED_SERVICES,
+                email_notification=email_notification,
+            )
     return HttpResponse()
 
 
@@ -713,6 +811,7 @@ def email_weekend_access_notification(request):
     return send_email_weekend_access_notification()
 
 
+@timed_service("email_weekend_access_notification")
 def send_email_weekend_access_notification():
     """
     Sends a weekend access email to the addresses set in customization with the template provided.
@@ -799,6 +898,7 @@ def email_user_access_expiration_reminders(request):
     return send_email_user_access_expiration_reminders(request)
 
 
+@timed_service("email_user_access_expiration_reminders")
 def send_email_user_access_expiration_reminders(request=None):
     facility_name = ApplicationCustomization.get("facility_name")
     user_office_email = EmailsCustomization.get("user_office_email_address")
@@ -807,20 +907,21 @@ def send_email_user_access_expiration_reminders(request=None):
     if user_office_email and template and access_expiration_reminder_days:
         user_expiration_reminder_cc = UserCustomization.get("user_access_expiration_reminder_cc")
         ccs = [e for e in user_expiration_reminder_cc.split(",") if e]
-        for remaining_days in [int(days) for days in access_expiration_reminder_days.split(",")]:
-            expiration_date = date.today() + timedelta(days=remaining_days)
-            for user in User.objects.filter(is_active=True, access_expiration=expiration_date):
-                subject = f"Your {facility_name} access expires in {remaining_days} days ({format_datetime(user.access_expiration)})"
-                message = render_email_template(template, {"user": user, "remaining_days": remaining_days}, request)
-                email_notification = user.get_preferences().email_send_access_expiration_emails
-                user.email_user(
-                    subject=subject,
-                    message=message,
-                    from_email=user_office_email,
-                    cc=ccs,
-                    email_notification=email_notification,
-                    email_category=EmailCategory.ACCESS_EXPIRATION_REMINDERS,
-                )
+        with email_batch():
+            for remaining_days in [int(days) for days in access_expiration_reminder_days.split(",")]:
+                expiration_date = date.today() + timedelta(days=remaining_days)
+                for user in User.objects.filter(is_active=True, access_expiration=expiration_date):
+                    subject = f"Your {facility_name} access expires in {remaining_days} days ({format_datetime(user.access_expiration)})"
+                    message = render_email_template(template, {"user": user, "remaining_days": remaining_days}, request)
+                    email_notification = user.get_preferences().email_send_access_expiration_emails
+                    user.email_user(
+                        subject=subject,
+                        message=message,
+                        from_email=user_office_email,
+                        cc=ccs,
+                        email_notification=email_notification,
+                        email_category=EmailCategory.ACCESS_EXPIRATION_REMINDERS,
+                    )
     return HttpResponse()
 
 
@@ -831,57 +932,59 @@ def manage_tool_qualifications(request):
     return do_manage_tool_qualifications(request)
 
 
+@timed_service("manage_tool_qualifications")
 def do_manage_tool_qualifications(request=None):
     user_office_email = EmailsCustomization.get("user_office_email_address")
     template = get_media_file_contents("tool_qualification_expiration_email.html")
     if user_office_email and template:
-        for qualification in Qualification.objects.filter(user__is_active=True, user__is_staff=False).prefetch_related(
-            "tool", "user"
-        ):
-            user = qualification.user
-            tool = qualification.tool
-            if tool.qualification_expiration_days or tool.qualification_expiration_never_used_days:
-                last_tool_use = None
-                try:
-                    # Last tool use cannot be before the last time they qualified
-                    last_tool_use = max(
-                        as_timezone(UsageEvent.objects.filter(user=user, tool=tool).latest("start").start).date(),
-                        qualification.qualified_on,
-                    )
-                    expiration_date: date = (
-                        last_tool_use + timedelta(days=tool.qualification_expiration_days)
-                        if tool.qualification_expiration_days
-                        else None
-                    )
-                except UsageEvent.DoesNotExist:
-                    # User never used the tool, use the qualification date
-                    expiration_date: date = (
-                        qualification.qualified_on + timedelta(days=tool.qualification_expiration_never_used_days)
-                        if tool.qualification_expiration_never_used_days
-                        else None
-                    )
-                # Check for staff on tools
-                if expiration_date and not user.is_staff_on_tool(tool):
-                    if expiration_date <= date.today():
-                        qualification.delete()
-                        send_tool_qualification_expiring_email(
-                            qualification,
-                            last_tool_use,
-                            expiration_date,
-                            tool.qualification_notification_email,
-                            request=request,
+        with email_batch():
+            for qualification in Qualification.objects.filter(
+                user__is_active=True, user__is_staff=False
+            ).prefetch_related("tool", "user"):
+                user = qualification.user
+                tool = qualification.tool
+                if tool.qualification_expiration_days or tool.qualification_expiration_never_used_days:
+                    last_tool_use = None
+                    try:
+                        # Last tool use cannot be before the last time they qualified
+                        last_tool_use = max(
+                            as_timezone(UsageEvent.objects.filter(user=user, tool=tool).latest("start").start).date(),
+                            qualification.qualified_on,
+                        )
+                        expiration_date: date = (
+                            last_tool_use + timedelta(days=tool.qualification_expiration_days)
+                            if tool.qualification_expiration_days
+                            else None
+                        )
+                    except UsageEvent.DoesNotExist:
+                        # User never used the tool, use the qualification date
+                        expiration_date: date = (
+                            qualification.qualified_on + timedelta(days=tool.qualification_expiration_never_used_days)
+                            if tool.qualification_expiration_never_used_days
+                            else None
                         )
-                    if tool.get_qualification_reminder_days():
-                        for remaining_days in tool.get_qualification_reminder_days():
-                            if expiration_date - timedelta(days=remaining_days) == date.today():
-                                send_tool_qualification_expiring_email(
-                                    qualification,
-                                    last_tool_use,
-                                    expiration_date,
-                                    tool.qualification_notification_email,
-                                    remaining_days,
-                                    request=request,
-                                )
+                    # Check for staff on tools
+                    if expiration_date and not user.is_staff_on_tool(tool):
+                        if expiration_date <= date.today():
+                            qualification.delete()
+                            send_tool_qualification_expiring_email(
+                                qualification,
+                                last_tool_use,
+                                expiration_date,
+                                tool.qualification_notification_email,
+                                request=request,
+                            )
+                        if tool.get_qualification_reminder_days():
+                            for remaining_days in tool.get_qualification_reminder_days():
+                                if expiration_date - timedelta(days=remaining_days) == date.today():
+                                    send_tool_qualification_expiring_email(
+                                        qualification,
+                                        last_tool_use,
+                                        expiration_date,
+                                        tool.qualification_notification_email,
+                                        remaining_days,
+                                        request=request,
+                                    )
     return HttpResponse()
 
 
@@ -927,6 +1030,7 @@ def manage_recurring_charges(request):
     return do_manage_recurring_charges(request)
 
 
+@timed_service("manage_recurring_charges")
 def do_manage_recurring_charges(request=None):
     # Dictionary of user ids and list of recurring charges they need to be reminded of
     user_reminders = {}
@@ -997,6 +1101,7 @@ def auto_logout_users(request):
     return do_auto_logout_users()
 
 
+@timed_service("auto_logout_users")
 def do_auto_logout_users():
     current_logged_in_user_to_logout: QuerySetType[AreaAccessRecord] = AreaAccessRecord.objects.filter(
         area__auto_logout_time__isnull=False, end__isnull=True, staff_charge__isnull=True
@@ -1019,6 +1124,7 @@ def email_scheduled_outage_reminders(request):
     return send_email_scheduled_outage_reminders(request)
 
 
+@timed_service("email_scheduled_outage_reminders")
 def send_email_scheduled_outage_reminders(request=None) -> HttpResponse:
     # Exit early if the template email is not defined
     message = get_media_file_contents("scheduled_outage_reminder_email.html")
@@ -1060,6 +1166,7 @@ def deactivate_access_expired_users(request):
     return do_deactivate_access_expired_users()
 
 
+@timed_service("deactivate_access_expired_users")
 def do_deactivate_access_expired_users():
     buffer_days = UserCustomization.get_int("user_access_expiration_buffer_days", 0)
     user_types = UserCustomization.get_list_int("user_access_expiration_types")
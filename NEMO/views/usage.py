@@ -633,16 +633,11 @@ def csv_export_response(
     data.extend(billable_items_training_sessions(training_sessions))
     data.extend(billable_items_area_access_records(area_access))
     data.extend(billable_items_usage_events(usage_events))
+    show_tool_usage_note = ToolControlCustomization.get_bool("tool_control_note_show")
     for billable_item in data:
-        row = vars(billable_item)
-        if billable_item.type == "staff_charge" and billable_item.item:
-            row["note"] = billable_item.item.note
-        if (
-            ToolControlCustomization.get_bool("tool_control_note_show")
-            and billable_item.type == "tool_usage"
-            and billable_item.item
-        ):
-            row["note"] = billable_item.item.note
+        row = billable_item.as_dict()
+        if billable_item.type != "staff_charge" and not (show_tool_usage_note and billable_item.type == "tool_usage"):
+            row["note"] = None
         table_result.add_row(row)
     response = table_result.to_csv()
     filename = f"usage_export_{export_format_datetime()}.csv"
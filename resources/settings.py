@@ -233,6 +233,27 @@ RESERVATION_ORGANIZER_EMAIL = "no_reply"
 USER_RESERVATION_PREFERENCES_DEFAULT = False
 # Change the following to split bcc users into chunks when sending broadcast emails. This can be useful to avoid trigger spam/security measures.
 EMAIL_BROADCAST_BCC_CHUNK_SIZE = None
+# Timed services (missed reservations, reservation reminders) process everything since their previous run.
+# After being stopped or skipped, they catch up on at most this many minutes.
+# TIMED_SERVICES_CATCH_UP_MINUTES = 60
+# The run_timed_services command runs all the timed services in one process, instead of cron calling each url.
+# Change the interval (in seconds) of some services, or set it to None to disable them (defaults in NEMO/timed_services_scheduler.py)
+# TIMED_SERVICES_SCHEDULE = {"cancel_unused_reservations": 60, "email_usage_reminders": None}
+# Keyword arguments passed to the services by the scheduler, for example the projects excluded from usage reminders
+# TIMED_SERVICES_ARGUMENTS = {"email_usage_reminders": {"projects_to_exclude": [1, 2]}}
+# Local time of day at which the services running daily (or less often) are run
+# TIMED_SERVICES_DAILY_TIME = "00:00"
+# Emails sent in bulk (timed services, broadcasts) share a single SMTP connection, reopened every this many emails.
+# EMAIL_BATCH_SIZE = 100
+# Set the following to True to queue emails in the outbox instead of sending them during requests.
+# The outbox is then sent by the send_queued_emails command (run it every minute, or continuously with --loop).
+# EMAIL_OUTBOX_ENABLED = False
+# Number of emails sent concurrently, and maximum number of emails sent per second (None for no limit)
+# EMAIL_OUTBOX_MAX_WORKERS = 1
+# EMAIL_OUTBOX_RATE_LIMIT = None
+# Failed emails are retried after EMAIL_OUTBOX_RETRY_DELAY seconds, doubling each time, up to EMAIL_OUTBOX_MAX_ATTEMPTS
+# EMAIL_OUTBOX_RETRY_DELAY = 60
+# EMAIL_OUTBOX_MAX_ATTEMPTS = 5
 
 # -------------------- SMTP Server config --------------------
 # Uncomment the following if using an email SMTP server
@@ -254,6 +275,9 @@ DATABASES = {
         "NAME": BASE_DIR + "/nemo.db",
     }
 }
+# Partial indexes (on active reservations, tools in use etc.) are not supported on MySQL, where they are skipped.
+# The corresponding warning can be silenced with:
+# SILENCED_SYSTEM_CHECKS = ["models.W037"]
 
 # Comment this line out for dev. This makes sure static files have a version to avoid
 # having to clear browser cache between releases.
@@ -327,7 +351,28 @@ LOGGING = {
 # -------------------- Organization specific settings (NEMO specific; NOT supported by Django) --------------------
 # Customize these to suit your needs
 # Cache timeout for customizations. This is used to avoid re-fetching the same customizations every time.
+# Changes are propagated to other processes using a version stored in the Django cache below. If that cache is shared
+# between processes (memcached, redis, database etc.), this can be set to None so customizations are only reloaded when changed.
 CUSTOMIZATIONS_CACHE_SECONDS = 30
+# Django cache alias used to share the customizations version between processes (defaults to "default")
+# CUSTOMIZATIONS_CACHE_ALIAS = "default"
+# Cache timeouts for the facility-wide menu flags (tools exist, areas exist etc.) and for users' notification counts.
+# Both are cleared when they change, those timeouts only matter when the Django cache is not shared between processes.
+# SITE_FEATURE_FLAGS_CACHE_SECONDS = 60
+# NOTIFICATION_COUNTS_CACHE_SECONDS = 60
+# Notifications for many users (news, safety issues, buddy requests etc.) are inserted in batches of this size.
+# NOTIFICATIONS_BATCH_SIZE = 500
+# Cache timeout for the areas used to build the area tree. The cache is cleared when an area is saved or deleted.
+# AREA_TREE_CACHE_SECONDS = 60
+# The status dashboard and sidebar read tools and areas status from a snapshot, only updating what changed (usage,
+# tasks, outages etc.). It is fully rebuilt after this many seconds, for changes made in other processes when the Django
+# cache is not shared, and for the ones not tracked (user names etc.). It can also be rebuilt with rebuild_facility_status
+# FACILITY_STATUS_SNAPSHOT_SECONDS = 60
+
+# Calendar feeds are versioned using the last modification time of the events, and sent with an ETag so browsers only
+# download them again when they change. Rendered feeds are also cached for this many seconds (0 to disable both).
+# Changes that don't update the events themselves (tool or user names etc.) can take this long to show in the calendar.
+# CALENDAR_FEED_CACHE_SECONDS = 60
 
 # When true, all available URLs and NEMO functionality is enabled.
 # When false, conditional URLs are removed to reduce the attack surface of NEMO.
@@ -338,6 +383,22 @@ ALLOW_CONDITIONAL_URLS = True
 # When true, interlock function will be enabled and request will be made to lock/unlock interlocks.
 # When false, the feature will be disabled
 INTERLOCKS_ENABLED = False
+# Interlock status reports ping cards in parallel, using up to this many threads (one card per thread).
+# Cards that have not answered after the deadline (in seconds) are reported as timed out.
+# INTERLOCKS_PING_MAX_WORKERS = 10
+# INTERLOCKS_PING_DEADLINE = 60
+# By default, ProXr and Modbus cards are connected to for each command. Set this to keep their connection open between
+# commands, closing it after being idle for this many seconds. Only do so when a single process sends interlock commands
+# (one worker): cards usually accept a single client, and would refuse or stall commands from the other processes.
+# INTERLOCKS_CONNECTION_IDLE_TIMEOUT = 0
+
+# Locks used to prevent concurrent tool enabling/disabling, reservations etc. (the @synchronized decorator).
+# The default in-process locks only work with a single process. When running multiple processes, use a shared cache
+# (NEMO.locks.CacheLockBackend, with SYNCHRONIZED_LOCK_CACHE_ALIAS and SYNCHRONIZED_LOCK_EXPIRY) or database advisory
+# locks for PostgreSQL and MySQL (NEMO.locks.DatabaseLockBackend).
+# SYNCHRONIZED_LOCK_BACKEND = "NEMO.locks.InProcessLockBackend"
+# Maximum time to wait for a lock in seconds (None to wait forever)
+# SYNCHRONIZED_LOCK_TIMEOUT = None
 
 # There are three options out-of-the-box to authenticate users (uncomment the one you decide on):
 #   1) A decoupled remote user via HTTP HEADER method (such as Kerberos authentication from a reverse proxy etc.)